@@ -15,6 +15,7 @@
 import os
 import pytest
 import re
+import redo
 import requests
 import subprocess
 import tempfile
@@ -34,6 +35,26 @@ from testutils.common import (
     get_mender_artifact,
     make_accepted_device,
 )
+from testutils.util.direct_upload import direct_upload_artifact
+from testutils.util.multipart import artifact_upload_body, log_upload_stats
+
+# Size of the payload of the artifacts uploaded by the throughput benchmark,
+# which only runs when it is set.
+UPLOAD_BENCHMARK_SIZE = int(os.environ.get("UPLOAD_BENCHMARK_SIZE", "0"))
+
+
+def upload_artifact(api_client, artifact):
+    """Uploads the artifact file through the management API, streaming it from
+    disk instead of building the whole request in memory"""
+    body = artifact_upload_body(artifact, "description")
+    r = api_client.call(
+        "POST",
+        deployments.URL_DEPLOYMENTS_ARTIFACTS,
+        data=body,
+        headers={"Content-Type": body.content_type},
+    )
+    log_upload_stats(body, "artifact upload")
+    return r
 
 
 @pytest.mark.storage_test
@@ -61,22 +82,7 @@ class TestUploadArtifactBase:
             artifact_kw.setdefault("artifact_name", "test")
             artifact_kw.setdefault("device_types", ["arm1"])
             with get_mender_artifact(**artifact_kw) as artifact:
-                r = api_client.with_auth(auth_token).call(
-                    "POST",
-                    deployments.URL_DEPLOYMENTS_ARTIFACTS,
-                    files=(
-                        ("description", (None, "description")),
-                        ("size", (None, str(os.path.getsize(artifact)))),
-                        (
-                            "artifact",
-                            (
-                                artifact,
-                                open(artifact, "rb"),
-                                "application/octet-stream",
-                            ),
-                        ),
-                    ),
-                )
+                r = upload_artifact(api_client.with_auth(auth_token), artifact)
             assert r.status_code == 201
 
         # create a new accepted device
@@ -233,18 +239,7 @@ class TestUploadArtifactEnterprise(TestUploadArtifactBase):
             depends=("key1:value1", "key2:value2"),
             provides=("key3:value3", "key4:value4", "key5:value5"),
         ) as artifact:
-            r = api_client.with_auth(auth_token).call(
-                "POST",
-                deployments.URL_DEPLOYMENTS_ARTIFACTS,
-                files=(
-                    ("description", (None, "description")),
-                    ("size", (None, str(os.path.getsize(artifact)))),
-                    (
-                        "artifact",
-                        (artifact, open(artifact, "rb"), "application/octet-stream"),
-                    ),
-                ),
-            )
+            r = upload_artifact(api_client.with_auth(auth_token), artifact)
         assert r.status_code == 201
 
         # create and upload a conflicting mender artifact
@@ -255,18 +250,7 @@ class TestUploadArtifactEnterprise(TestUploadArtifactBase):
             depends=("key1:value1", "key2:value2"),
             provides=("key3:value3", "key4:value4", "key5:value5"),
         ) as artifact:
-            r = api_client.with_auth(auth_token).call(
-                "POST",
-                deployments.URL_DEPLOYMENTS_ARTIFACTS,
-                files=(
-                    ("description", (None, "description")),
-                    ("size", (None, str(os.path.getsize(artifact)))),
-                    (
-                        "artifact",
-                        (artifact, open(artifact, "rb"), "application/octet-stream"),
-                    ),
-                ),
-            )
+            r = upload_artifact(api_client.with_auth(auth_token), artifact)
         assert r.status_code == 409
 
         # create and upload a non-conflicting mender artifact
@@ -276,18 +260,7 @@ class TestUploadArtifactEnterprise(TestUploadArtifactBase):
             depends=("key1:value1", "key2:value2"),
             provides=("key3:value3", "key4:value4", "key5:value5"),
         ) as artifact:
-            r = api_client.with_auth(auth_token).call(
-                "POST",
-                deployments.URL_DEPLOYMENTS_ARTIFACTS,
-                files=(
-                    ("description", (None, "description")),
-                    ("size", (None, str(os.path.getsize(artifact)))),
-                    (
-                        "artifact",
-                        (artifact, open(artifact, "rb"), "application/octet-stream"),
-                    ),
-                ),
-            )
+            r = upload_artifact(api_client.with_auth(auth_token), artifact)
         assert r.status_code == 201
 
     def test_upload_artifact_selection_no_match(self, mongo, clean_mongo):
@@ -441,18 +414,7 @@ class TestUploadArtifactEnterprise(TestUploadArtifactBase):
             depends=("key1:value1", "key2:value2"),
             provides=("key3:value3", "key4:value4", "key5:value5"),
         ) as artifact:
-            r = api_client.with_auth(auth_token).call(
-                "POST",
-                deployments.URL_DEPLOYMENTS_ARTIFACTS,
-                files=(
-                    ("description", (None, "description")),
-                    ("size", (None, str(os.path.getsize(artifact)))),
-                    (
-                        "artifact",
-                        (artifact, open(artifact, "rb"), "application/octet-stream"),
-                    ),
-                ),
-            )
+            r = upload_artifact(api_client.with_auth(auth_token), artifact)
         assert r.status_code == 201
 
         # extract the artifact id from the Location header
@@ -528,22 +490,7 @@ class TestUploadArtifactEnterprise(TestUploadArtifactBase):
                 depends=("key1:value1", "key2:value2"),
                 provides=("key3:value3", "key4:value4", "key5:value5"),
             ) as artifact:
-                r = api_client.with_auth(auth_token).call(
-                    "POST",
-                    deployments.URL_DEPLOYMENTS_ARTIFACTS,
-                    files=(
-                        ("description", (None, "description")),
-                        ("size", (None, str(os.path.getsize(artifact)))),
-                        (
-                            "artifact",
-                            (
-                                artifact,
-                                open(artifact, "rb"),
-                                "application/octet-stream",
-                            ),
-                        ),
-                    ),
-                )
+                r = upload_artifact(api_client.with_auth(auth_token), artifact)
                 assert r.status_code == 201
 
         for tenant in tenants:
@@ -642,18 +589,7 @@ class TestUploadArtifactOpenSource(TestUploadArtifactBase):
             depends=("key1:value1", "key2:value2"),
             provides=("key3:value3", "key4:value4", "key5:value5"),
         ) as artifact:
-            r = api_client.with_auth(auth_token).call(
-                "POST",
-                deployments.URL_DEPLOYMENTS_ARTIFACTS,
-                files=(
-                    ("description", (None, "description")),
-                    ("size", (None, str(os.path.getsize(artifact)))),
-                    (
-                        "artifact",
-                        (artifact, open(artifact, "rb"), "application/octet-stream"),
-                    ),
-                ),
-            )
+            r = upload_artifact(api_client.with_auth(auth_token), artifact)
         assert r.status_code == 201
 
         # extract the artifact id from the Location header
@@ -739,3 +675,72 @@ class TestUploadArtifactOpenSource(TestUploadArtifactBase):
             assert size == 256
         finally:
             os.unlink(f.name)
+
+
+@pytest.mark.storage_test
+class TestDirectUploadArtifact:
+    @pytest.mark.skipif(
+        UPLOAD_BENCHMARK_SIZE == 0,
+        reason="set UPLOAD_BENCHMARK_SIZE to run the upload benchmark",
+    )
+    def test_direct_upload_throughput(self, mongo, clean_mongo):
+        """Uploads an artifact through the management API and another one of
+        the same size straight to the storage, logging the throughput of both
+
+        Only Azure links are uploaded in parallel blocks: minio/S3 links are
+        presigned for a single PUT, so the file goes up in one request.
+        """
+        username, password = (
+            "some.user+" + str(uuid.uuid4()) + "@example.com",
+            "secretsecret",
+        )
+        create_user(username, password)
+        r = ApiClient(useradm.URL_MGMT).call(
+            "POST", useradm.URL_LOGIN, auth=(username, password)
+        )
+        assert r.status_code == 200
+        auth_token = r.text
+
+        api_client = ApiClient(deployments.URL_MGMT)
+        api_client.headers = {}  # avoid default Content-Type: application/json
+        api_client.with_auth(auth_token)
+
+        with get_mender_artifact(
+            artifact_name="api-upload", size=UPLOAD_BENCHMARK_SIZE
+        ) as artifact:
+            body = artifact_upload_body(artifact)
+            r = api_client.call(
+                "POST",
+                deployments.URL_DEPLOYMENTS_ARTIFACTS,
+                data=body,
+                headers={"Content-Type": body.content_type},
+            )
+            log_upload_stats(body, "management API upload")
+        assert r.status_code == 201
+
+        sent = []
+        with get_mender_artifact(
+            artifact_name="direct-upload", size=UPLOAD_BENCHMARK_SIZE
+        ) as artifact:
+            artifact_size = os.path.getsize(artifact)
+            artifact_id = direct_upload_artifact(
+                artifact,
+                auth_token,
+                progress=lambda bytes_sent, total: sent.append(bytes_sent),
+            )
+        # Retries resend bytes, so at least the whole file went out.
+        assert max(sent) >= artifact_size
+
+        # the artifact is processed asynchronously after the upload completes
+        for _ in redo.retrier(attempts=60, sleeptime=1):
+            r = api_client.call(
+                "GET",
+                deployments.URL_DEPLOYMENTS_ARTIFACTS_GET,
+                path_params={"id": artifact_id},
+            )
+            if r.status_code == 200:
+                break
+        else:
+            assert False, "artifact %s was not processed in time" % artifact_id
+        assert r.json()["name"] == "direct-upload"
+        assert r.json()["size"] == artifact_size
@@ -14,7 +14,6 @@
 
 import pytest
 import uuid
-import os
 import json
 import time
 import urllib.parse
@@ -45,6 +44,7 @@ import testutils.api.useradm as useradm
 import testutils.api.inventory as inventory
 import testutils.api.deployments as deployments_v1
 import testutils.api.auditlogs as auditlogs
+from testutils.util.multipart import artifact_upload_body, log_upload_stats
 
 
 @pytest.fixture(scope="function")
@@ -449,18 +449,14 @@ def make_deployment(token: str, tenant_token: str) -> Tuple[Dict, Dict]:
     with get_mender_artifact(
         artifact_name=artifact_name, device_types=["arm1"],
     ) as artifact:
+        body = artifact_upload_body(artifact, "description")
         r = depl_v1.with_auth(token).call(
             "POST",
             deployments_v1.URL_DEPLOYMENTS_ARTIFACTS,
-            files=(
-                ("description", (None, "description")),
-                ("size", (None, str(os.path.getsize(artifact)))),
-                (
-                    "artifact",
-                    (artifact, open(artifact, "rb"), "application/octet-stream"),
-                ),
-            ),
+            data=body,
+            headers={"Content-Type": body.content_type},
         )
+        log_upload_stats(body, "artifact upload")
     assert r.status_code == 201
     artifact = {"id": r.headers["Location"].rsplit("/", 1)[1]}
 
@@ -46,27 +46,23 @@ class TestCreateArtifactBase:
 
             filename = f.name
 
-            r = api_client.call(
-                "POST",
-                deployments.URL_DEPLOYMENTS_ARTIFACTS_GENERATE,
-                files={
-                    "name": (None, "artifact"),
-                    "description": (None, "description"),
-                    "device_types_compatible": (None, "beaglebone"),
-                    "type": (None, "single_file"),
-                    "args": (
-                        None,
-                        dumps({"filename": "run.sh", "dest_dir": "/tests"}),
-                    ),
-                    "file": (
-                        filename,
-                        open(filename, "rb"),
-                        "application/octet-stream",
-                        {},
-                    ),
-                },
-                qs_params=None,
-            )
+            with open(filename, "rb") as fd:
+                r = api_client.call(
+                    "POST",
+                    deployments.URL_DEPLOYMENTS_ARTIFACTS_GENERATE,
+                    files={
+                        "name": (None, "artifact"),
+                        "description": (None, "description"),
+                        "device_types_compatible": (None, "beaglebone"),
+                        "type": (None, "single_file"),
+                        "args": (
+                            None,
+                            dumps({"filename": "run.sh", "dest_dir": "/tests"}),
+                        ),
+                        "file": (filename, fd, "application/octet-stream", {}),
+                    },
+                    qs_params=None,
+                )
         finally:
             os.unlink(f.name)
 
@@ -42,8 +42,12 @@ from testutils.common import (
     submit_inventory,
     useExistingTenant,
     Tenant,
+    has_attributes,
+    wait_for_reporting,
+    wait_for_reporting_devices,
 )
 from testutils.infra.container_manager.kubernetes_manager import isK8S
+from testutils.util.multipart import artifact_upload_body, log_upload_stats
 
 
 WAITING_MULTIPLIER = 8 if isK8S() else 1
@@ -53,18 +57,25 @@ WAITING_TIME_K8S = 5.0
 def upload_image(filename, auth_token, description="abc"):
     api_client = ApiClient(deployments.URL_MGMT)
     api_client.headers = {}
+    body = artifact_upload_body(filename, description)
     r = api_client.with_auth(auth_token).call(
         "POST",
         deployments.URL_DEPLOYMENTS_ARTIFACTS,
-        files=(
-            ("description", (None, description)),
-            ("size", (None, str(os.path.getsize(filename)))),
-            ("artifact", (filename, open(filename, "rb"), "application/octet-stream")),
-        ),
+        data=body,
+        headers={"Content-Type": body.content_type},
     )
+    log_upload_stats(body, "artifact upload %s" % filename)
     assert r.status_code == 201
 
 
+def wait_for_inventory_indexed(devs, utoken):
+    """Waits until reporting has indexed the devices made by
+    make_device_with_inventory, with their current attributes"""
+    wait_for_reporting_devices(
+        utoken, devs, lambda dev, indexed: has_attributes(indexed, dev.attributes)
+    )
+
+
 def create_tenant_test_setup(
     user_name, tenant_name, nr_deployments=3, nr_devices=100, plan="os"
 ):
@@ -1269,9 +1280,17 @@ class _TestDeploymentsStatusUpdateBase:
         deployment with four devices
         requires five devices (last one won't be part of the deployment
         """
-        # sleep a few seconds waiting for the data propagation to the reporting service
-        # and the Elasticsearch indexing to complete
-        time.sleep(reporting.REPORTING_DATA_PROPAGATION_SLEEP_TIME_SECS)
+        # wait for the data propagation to the reporting service
+        # and the OpenSearch indexing to complete
+        wait_for_reporting_devices(
+            user_token,
+            devs,
+            lambda dev, indexed: deploy_to_group is None
+            or dev is devs[-1]
+            or has_attributes(
+                indexed, [{"name": "group", "value": deploy_to_group}], "system"
+            ),
+        )
 
         deploymentsm = ApiClient(deployments.URL_MGMT)
         deploymentsd = ApiClient(deployments.URL_DEVICES)
@@ -1838,9 +1857,9 @@ class TestDynamicDeploymentsEnterprise:
             for attrs in tc["nonmatches"]
         ]
 
-        # sleep a few seconds waiting for the data propagation to the reporting service
-        # and the Elasticsearch indexing to complete
-        time.sleep(reporting.REPORTING_DATA_PROPAGATION_SLEEP_TIME_SECS)
+        # wait for the data propagation to the reporting service
+        # and the OpenSearch indexing to complete
+        wait_for_inventory_indexed(matching_devs + nonmatching_devs, user.utoken)
 
         dep = create_dynamic_deployment("foo", tc["predicates"], user.utoken)
         if not useExistingTenant():
@@ -1871,9 +1890,9 @@ class TestDynamicDeploymentsEnterprise:
             for i in range(10)
         ]
 
-        # sleep a few seconds waiting for the data propagation to the reporting service
-        # and the Elasticsearch indexing to complete
-        time.sleep(reporting.REPORTING_DATA_PROPAGATION_SLEEP_TIME_SECS)
+        # wait for the data propagation to the reporting service
+        # and the OpenSearch indexing to complete
+        wait_for_inventory_indexed(devs, user.utoken)
 
         for d in devs:
             assert_get_next(200, d.token, "foo")
@@ -1931,9 +1950,9 @@ class TestDynamicDeploymentsEnterprise:
             for i in range(10)
         ]
 
-        # sleep a few seconds waiting for the data propagation to the reporting service
-        # and the Elasticsearch indexing to complete
-        time.sleep(reporting.REPORTING_DATA_PROPAGATION_SLEEP_TIME_SECS)
+        # wait for the data propagation to the reporting service
+        # and the OpenSearch indexing to complete
+        wait_for_inventory_indexed(devs, user.utoken)
 
         for d in devs:
             assert_get_next(200, d.token, "foo")
@@ -2003,9 +2022,9 @@ class TestDynamicDeploymentsEnterprise:
             [{"name": "foo", "value": "bar"}], user.utoken, setup_tenant.tenant_token
         )
 
-        # sleep a few seconds waiting for the data propagation to the reporting service
-        # and the Elasticsearch indexing to complete
-        time.sleep(reporting.REPORTING_DATA_PROPAGATION_SLEEP_TIME_SECS)
+        # wait for the data propagation to the reporting service
+        # and the OpenSearch indexing to complete
+        wait_for_inventory_indexed([dev], user.utoken)
 
         assert_get_next(200, dev.token, "bar")
 
@@ -2024,10 +2043,11 @@ class TestDynamicDeploymentsEnterprise:
         # after updating inventory, the device would qualify for both 'foo' deployments, but
         # the ordering mechanism will prevent it
         submit_inventory([{"name": "foo", "value": "foo"}], dev.token)
+        dev.attributes = [{"name": "foo", "value": "foo"}]
 
-        # sleep a few seconds waiting for the data propagation to the reporting service
-        # and the Elasticsearch indexing to complete
-        time.sleep(reporting.REPORTING_DATA_PROPAGATION_SLEEP_TIME_SECS)
+        # wait for the data propagation to the reporting service
+        # and the OpenSearch indexing to complete
+        wait_for_inventory_indexed([dev], user.utoken)
 
         assert_get_next(204, dev.token)
 
@@ -2043,10 +2063,6 @@ class TestDynamicDeploymentsEnterprise:
             "foo4", [predicate("foo", "inventory", "$eq", "foo")], user.utoken
         )
 
-        # sleep a few seconds waiting for the data propagation to the reporting service
-        # and the Elasticsearch indexing to complete
-        time.sleep(reporting.REPORTING_DATA_PROPAGATION_SLEEP_TIME_SECS)
-
         assert_get_next(200, dev.token, "foo3")
 
     @pytest.mark.parametrize(
@@ -2105,9 +2121,9 @@ class TestDynamicDeploymentsEnterprise:
             for i in range(10)
         ]
 
-        # sleep a few seconds waiting for the data propagation to the reporting service
-        # and the Elasticsearch indexing to complete
-        time.sleep(reporting.REPORTING_DATA_PROPAGATION_SLEEP_TIME_SECS)
+        # wait for the data propagation to the reporting service
+        # and the OpenSearch indexing to complete
+        wait_for_inventory_indexed(devs, user.utoken)
 
         # adjust phase start ts for previous test case duration
         # format for api consumption
@@ -2155,9 +2171,9 @@ class TestDynamicDeploymentsEnterprise:
                 for i in range(10)
             ]
 
-            # sleep a few seconds waiting for the data propagation to the reporting service
-            # and the Elasticsearch indexing to complete
-            time.sleep(reporting.REPORTING_DATA_PROPAGATION_SLEEP_TIME_SECS)
+            # wait for the data propagation to the reporting service
+            # and the OpenSearch indexing to complete
+            wait_for_inventory_indexed(extra_devs, user.utoken)
 
             for extra in extra_devs:
                 assert_get_next(200, extra.token, "bar")
@@ -2239,7 +2255,13 @@ class _TestDeploymentsShowArtifactSizeBase(object):
 
         # wait for data to propagate to reporting
         # and get same info from reporting
-        time.sleep(reporting.REPORTING_DATA_PROPAGATION_SLEEP_TIME_SECS)
+        wait_for_reporting(
+            user_token,
+            {"device_ids": [dev.id for dev in devs], "per_page": len(devs)},
+            lambda results: len(results) == len(devs)
+            and len([res for res in results if "image_size" in res]) == len(devs) - 1,
+            url=reporting.URL_MGMT_DEPLOYMENTS_DEVICES_SEARCH,
+        )
         query = {
             "device_ids": [devs[0].id],
         }
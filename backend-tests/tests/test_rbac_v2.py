@@ -25,6 +25,7 @@ from testutils.api import iot_manager
 from testutils.common import (
     create_org,
     create_user,
+    create_users,
     make_accepted_device,
     mongo,
     clean_mongo,
@@ -1480,13 +1481,7 @@ class TestRBACGetEmailsByGroupEnterprise:
             test_case["users"][i]["name"] = test_case["users"][i]["name"].replace(
                 "UUID", uuidv4
             )
-            test_user = create_user(
-                test_case["users"][i]["name"],
-                test_case["users"][i]["pwd"],
-                tid=tenant.id,
-                roles=test_case["users"][i]["roles"],
-            )
-            tenant.users.append(test_user)
+        tenant.users.extend(create_users(test_case["users"], tid=tenant.id))
 
         # Initialize tenant's devices
         grouped_devices = setup_tenant_devices(tenant, test_case["device_groups"])
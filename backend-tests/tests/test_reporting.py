@@ -12,10 +12,10 @@
 #    See the License for the specific language governing permissions and
 #    limitations under the License.
 import logging
+import time
 from urllib import request
 from datetime import date
 import pytest
-import time
 import uuid
 
 import requests
@@ -36,6 +36,9 @@ from testutils.common import (
     change_authset_status,
     mongo,
     useExistingTenant,
+    has_attributes,
+    opensearch_refresh,
+    wait_for_reporting_devices,
 )
 
 
@@ -58,6 +61,50 @@ def dict_to_inventoryattrs(d, scope="inventory"):
     return attr_list
 
 
+def wait_for_devices_indexed(
+    owner, status="accepted", inventory=True, checked_in=False
+):
+    """Waits until the reporting service has indexed the devices of a user or
+    tenant with the given status (and inventory, and check-in time)"""
+
+    def check(dev, indexed):
+        return (
+            has_attributes(indexed, [{"name": "status", "value": status}], "identity")
+            and (
+                not inventory
+                or has_attributes(indexed, dict_to_inventoryattrs(dev.inventory))
+            )
+            and (not checked_in or "check_in_time" in indexed)
+        )
+
+    wait_for_reporting_devices(owner.api_token, owner.devices, check)
+
+
+def assert_never_checked_in(
+    owner, duration=reporting.REPORTING_DATA_PROPAGATION_SLEEP_TIME_SECS
+):
+    """Fails if the reporting service indexes a check-in time for any of the
+    devices of a user or tenant within duration, the time their latest
+    requests take to propagate. There is nothing to wait for when the check-in
+    time is rightly missing, so the whole duration is watched."""
+    reporting_client = ApiClient(reporting.URL_MGMT)
+    query = {
+        "device_ids": [dev.id for dev in owner.devices],
+        "per_page": len(owner.devices),
+    }
+    deadline = time.time() + duration
+    while True:
+        opensearch_refresh()
+        rsp = reporting_client.with_auth(owner.api_token).call(
+            "POST", reporting.URL_MGMT_DEVICES_SEARCH, query
+        )
+        assert rsp.status_code == 200
+        assert [res["id"] for res in rsp.json() if "check_in_time" in res] == []
+        if time.time() > deadline:
+            return
+        time.sleep(0.5)
+
+
 def add_devices_to_tenant(tenant, dev_inventories, status="accepted"):
     try:
         tenant.devices
@@ -156,9 +203,9 @@ def user_reporting(user):
             {"artifact": ["v1", "v2", "v3"], "py3": "3.8", "idx": 9},
         ],
     )
-    # sleep a few seconds waiting for the data propagation to the reporting service
-    # and the Elasticsearch indexing to complete
-    time.sleep(reporting.REPORTING_DATA_PROPAGATION_SLEEP_TIME_SECS)
+    # wait for the data propagation to the reporting service
+    # and the OpenSearch indexing to complete
+    wait_for_devices_indexed(user)
     return user
 
 
@@ -180,9 +227,9 @@ def user_reporting_pending(user):
         ],
         "pending",
     )
-    # sleep a few seconds waiting for the data propagation to the reporting service
-    # and the Elasticsearch indexing to complete
-    time.sleep(reporting.REPORTING_DATA_PROPAGATION_SLEEP_TIME_SECS)
+    # wait for the data propagation to the reporting service
+    # and the OpenSearch indexing to complete
+    wait_for_devices_indexed(user, status="pending", inventory=False)
     return user
 
 
@@ -211,9 +258,9 @@ def tenant_ent(clean_mongo):
             {"artifact": ["v1", "v2", "v3"], "py3": "3.8", "idx": 9},
         ],
     )
-    # sleep a few seconds waiting for the data propagation to the reporting service
-    # and the Elasticsearch indexing to complete
-    time.sleep(reporting.REPORTING_DATA_PROPAGATION_SLEEP_TIME_SECS)
+    # wait for the data propagation to the reporting service
+    # and the OpenSearch indexing to complete
+    wait_for_devices_indexed(tenant_ent)
     return tenant_ent
 
 
@@ -243,9 +290,9 @@ def tenant_ent_pending(clean_mongo):
         ],
         "pending",
     )
-    # sleep a few seconds waiting for the data propagation to the reporting service
-    # and the Elasticsearch indexing to complete
-    time.sleep(reporting.REPORTING_DATA_PROPAGATION_SLEEP_TIME_SECS)
+    # wait for the data propagation to the reporting service
+    # and the OpenSearch indexing to complete
+    wait_for_devices_indexed(tenant_ent, status="pending", inventory=False)
     return tenant_ent
 
 
@@ -272,9 +319,9 @@ def tenant_pro(clean_mongo):
             {"artifact": ["v2", "v3"], "idx": 8},
         ],
     )
-    # sleep a few seconds waiting for the data propagation to the reporting service
-    # and the Elasticsearch indexing to complete
-    time.sleep(reporting.REPORTING_DATA_PROPAGATION_SLEEP_TIME_SECS)
+    # wait for the data propagation to the reporting service
+    # and the OpenSearch indexing to complete
+    wait_for_devices_indexed(tenant_pro)
     return tenant_pro
 
 
@@ -295,9 +342,9 @@ def tenant_os(clean_mongo):
             {"artifact": "v1", "idx": 2},
         ],
     )
-    # sleep a few seconds waiting for the data propagation to the reporting service
-    # and the Elasticsearch indexing to complete
-    time.sleep(reporting.REPORTING_DATA_PROPAGATION_SLEEP_TIME_SECS)
+    # wait for the data propagation to the reporting service
+    # and the OpenSearch indexing to complete
+    wait_for_devices_indexed(tenant_os)
     return tenant_os
 
 
@@ -1336,7 +1383,7 @@ class TestLastCheckInEnterprise:
         for d in tenant_ent_pending.devices:
             d.send_auth_request()
 
-        time.sleep(reporting.REPORTING_DATA_PROPAGATION_SLEEP_TIME_SECS)
+        assert_never_checked_in(tenant_ent_pending)
 
         search_query = search_query_template
         search_query["per_page"] = len(tenant_ent_pending.devices)
@@ -1357,7 +1404,7 @@ class TestLastCheckInEnterprise:
             )
             d.send_auth_request()
 
-        time.sleep(reporting.REPORTING_DATA_PROPAGATION_SLEEP_TIME_SECS)
+        wait_for_devices_indexed(tenant_ent_pending, inventory=False, checked_in=True)
         search_query = search_query_template
         search_query["per_page"] = len(tenant_ent_pending.devices)
         search_query["filters"][0]["value"] = "accepted"
@@ -1388,7 +1435,7 @@ class TestLastCheckIn:
         for d in user_reporting_pending.devices:
             d.send_auth_request()
 
-        time.sleep(reporting.REPORTING_DATA_PROPAGATION_SLEEP_TIME_SECS)
+        assert_never_checked_in(user_reporting_pending)
         search_query = search_query_template
         search_query["per_page"] = len(user_reporting_pending.devices)
         search_query["filters"][0]["value"] = "pending"
@@ -1408,7 +1455,9 @@ class TestLastCheckIn:
             )
             d.send_auth_request()
 
-        time.sleep(reporting.REPORTING_DATA_PROPAGATION_SLEEP_TIME_SECS)
+        wait_for_devices_indexed(
+            user_reporting_pending, inventory=False, checked_in=True
+        )
         search_query = search_query_template
         search_query["per_page"] = len(user_reporting_pending.devices)
         search_query["filters"][0]["value"] = "accepted"
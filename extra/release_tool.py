@@ -14,13 +14,23 @@
 #    limitations under the License.
 
 import argparse
+import atexit
+import base64
+import contextlib
+import concurrent.futures
 import copy
+import hashlib
+import io
 import json
 import os
 import re
 import shutil
+import socket
+import socketserver
 import subprocess
 import sys
+import threading
+import time
 import traceback
 import datetime
 
@@ -36,7 +46,7 @@ os.environ["GIT_PAGER"] = "cat"
 # This is basically a YAML file which contains the state of the release tool.
 # The easiest way to understand its format is by just looking at it after the
 # key fields have been filled in. This is updated continuously while the script
-# is operating.
+# is operating, through a journal next to it (see StateStore).
 # The repositories are indexed by their Git repository names.
 RELEASE_TOOL_STATE = None
 
@@ -54,6 +64,8 @@ VERSION_BUMP_STRING = "chore: Bump versions for Mender"
 PUSH = True
 # Whether this is a dry-run.
 DRY_RUN = False
+# How many repositories Git commands run in at the same time.
+GIT_JOBS = 8
 
 CONVENTIONAL_COMMIT_REGEX = (
     r"^(?P<type>build|chore|ci|docs|feat|fix|perf|refactor|revert|style|test)"
@@ -65,6 +77,76 @@ class NotAVersionException(Exception):
     pass
 
 
+# The libyaml based loader is much faster, but it is optional in PyYAML.
+YAML_SAFE_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+def yaml_safe_load(stream):
+    """yaml.safe_load, with the libyaml based loader when it is available."""
+    return yaml.load(stream, Loader=YAML_SAFE_LOADER)
+
+
+class ComponentMapsIndex:
+    """component-maps.yml data, indexed once so that component lookups don't
+    walk the raw maps: for each type and name, the associated components of
+    each other type, and the release_component and (resolved)
+    independent_component flags. Use ComponentMapsIndex.of(maps) to get the
+    index of a given maps object, built on first use."""
+
+    TYPES = ["git", "docker_image", "docker_container"]
+
+    # id(maps) -> (maps, index). The maps are kept, so that the id can't be
+    # reused for another object.
+    _indexes = {}
+
+    def __init__(self, maps):
+        # type -> name -> entry, in the order of the maps.
+        self.entries = {}
+        for type in self.TYPES:
+            self.entries[type] = {}
+            for name, info in (maps.get(type) or {}).items():
+                self.entries[type][name] = {
+                    "associations": {
+                        other: tuple(info[other])
+                        for other in self.TYPES
+                        if other != type and info.get(other) is not None
+                    },
+                    "release_component": info.get("release_component"),
+                    "independent_component": info.get("independent_component"),
+                }
+
+        # If a component doesn't say whether it is independent, the first
+        # associated component (git <-> docker_image) decides.
+        for type in self.TYPES:
+            other = "docker_image" if type == "git" else "git"
+            for entry in self.entries[type].values():
+                if entry["independent_component"] is not None:
+                    continue
+                assoc = entry["associations"].get(other, ())
+                assoc_entry = self.entries[other].get(assoc[0]) if assoc else None
+                if assoc_entry is not None:
+                    entry["independent_component"] = assoc_entry[
+                        "independent_component"
+                    ]
+        for type in self.TYPES:
+            for entry in self.entries[type].values():
+                entry["independent_component"] = bool(entry["independent_component"])
+
+    @staticmethod
+    def of(maps):
+        cached = ComponentMapsIndex._indexes.get(id(maps))
+        if cached is None or cached[0] is not maps:
+            cached = (maps, ComponentMapsIndex(maps))
+            ComponentMapsIndex._indexes[id(maps)] = cached
+        return cached[1]
+
+    def entry(self, type, name):
+        try:
+            return self.entries[type][name]
+        except KeyError:
+            raise KeyError("Component '%s' of type %s not found" % (name, type))
+
+
 class Component:
     COMPONENT_MAPS = None
 
@@ -114,17 +196,27 @@ class Component:
     def _initialize_component_maps():
         if Component.COMPONENT_MAPS is None:
             if Component._integration_version:
-                component_maps = execute_git(
-                    None,
-                    integration_dir(),
-                    ["show", f"{Component._integration_version}:component-maps.yml"],
-                    capture=True,
-                    capture_stderr=False,
+                component_maps = get_component_maps_for_rev(
+                    integration_dir(), Component._integration_version
                 )
-                Component.COMPONENT_MAPS = yaml.safe_load(component_maps)
+                if component_maps is None:
+                    raise Exception(
+                        "component-maps.yml not found in %s"
+                        % Component._integration_version
+                    )
+                Component.COMPONENT_MAPS = component_maps
             else:
-                with open(os.path.join(integration_dir(), "component-maps.yml")) as fd:
-                    Component.COMPONENT_MAPS = yaml.safe_load(fd)
+                # Cached while the file is unchanged, for the query server.
+                filename = os.path.join(integration_dir(), "component-maps.yml")
+                stat = os.stat(filename)
+                key = (filename, stat.st_mtime_ns, stat.st_size)
+                if key not in COMPONENT_MAPS_CACHE:
+                    with open(filename) as fd:
+                        COMPONENT_MAPS_CACHE[key] = yaml_safe_load(fd)
+                Component.COMPONENT_MAPS = COMPONENT_MAPS_CACHE[key]
+
+    def _index(self):
+        return ComponentMapsIndex.of(self.COMPONENT_MAPS)
 
     @staticmethod
     def get_component_of_type(type, name):
@@ -163,11 +255,10 @@ class Component:
                 "only_independent_component and only_non_independent_component can't both be true"
             )
         components = []
-        for comp in Component.COMPONENT_MAPS[type]:
-            is_independent_component = Component(comp, type).is_independent_component()
-            is_release_component = Component.COMPONENT_MAPS[type][comp][
-                "release_component"
-            ]
+        index = ComponentMapsIndex.of(Component.COMPONENT_MAPS)
+        for comp, entry in index.entries[type].items():
+            is_independent_component = entry["independent_component"]
+            is_release_component = entry["release_component"]
             if is_independent_component and only_non_independent_component:
                 continue
             if not is_independent_component and only_independent_component:
@@ -200,39 +291,29 @@ class Component:
             return [Component(self.name, self.type)]
 
         try:
-            comps = []
-            for name in self.COMPONENT_MAPS[self.type][self.name][type]:
-                comps.append(Component(name, type))
-            return comps
+            names = self._index().entry(self.type, self.name)["associations"][type]
         except KeyError:
             raise KeyError(
                 "No such combination: Component '%s' of type %s doesn't have any associated components of type %s"
                 % (self.name, self.type, type)
             )
+        return [Component(name, type) for name in names]
 
     def is_release_component(self):
         Component._initialize_component_maps()
-        return self.COMPONENT_MAPS[self.type][self.name]["release_component"]
+        release_component = self._index().entry(self.type, self.name)[
+            "release_component"
+        ]
+        if release_component is None:
+            raise KeyError(
+                "Component '%s' of type %s has no release_component"
+                % (self.name, self.type)
+            )
+        return release_component
 
     def is_independent_component(self):
         Component._initialize_component_maps()
-
-        def components_to_try():
-            yield self
-            if self.type == "git":
-                assoc_comp = self.associated_components_of_type("docker_image")
-            else:
-                assoc_comp = self.associated_components_of_type("git")
-            if len(assoc_comp) > 0:
-                yield assoc_comp[0]
-
-        for comp in components_to_try():
-            independent_component = self.COMPONENT_MAPS[comp.type][comp.name].get(
-                "independent_component"
-            )
-            if independent_component is not None:
-                return independent_component
-        return False
+        return self._index().entry(self.type, self.name)["independent_component"]
 
 
 # categorize backend services wrt open/enterprise versions
@@ -458,7 +539,7 @@ def get_docker_compose_data_from_json_list(json_list):
     """
     data = {}
     for json_str in json_list:
-        json_elem = yaml.safe_load(json_str)
+        json_elem = yaml_safe_load(json_str)
         for container, cont_info in json_elem["services"].items():
             full_image = cont_info.get("image")
             if full_image is None or (
@@ -561,31 +642,229 @@ def get_docker_compose_data(dir, version="git"):
     return get_docker_compose_data_from_json_list(json_list)
 
 
+# Bump when the format of the cached data, or the way it is computed, changes.
+QUERY_CACHE_VERSION = 1
+
+# In-process counterparts of the query cache, for when it is disabled.
+DOCKER_COMPOSE_DATA_CACHE = {}
+COMPONENT_MAPS_CACHE = {}
+
+
+def query_cache_dir():
+    """Return the directory of the persistent query cache, or None if caching is
+    disabled (RELEASE_TOOL_NO_CACHE set). Entries are keyed by commit SHAs, so
+    they never go stale and can be shared by all integration checkouts."""
+
+    if os.environ.get("RELEASE_TOOL_NO_CACHE"):
+        return None
+    cache_dir = os.environ.get("RELEASE_TOOL_CACHE_DIR")
+    if cache_dir is None:
+        cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+            os.path.expanduser("~"), ".cache"
+        )
+        cache_dir = os.path.join(cache_home, "mender-release-tool")
+    return os.path.join(cache_dir, "v%d" % QUERY_CACHE_VERSION)
+
+
+def query_cache_get(kind, key):
+    """Return the cached value for key, or None if there is none."""
+
+    cache_dir = query_cache_dir()
+    if cache_dir is None:
+        return None
+    try:
+        with open(os.path.join(cache_dir, kind, key + ".json")) as fd:
+            return json.load(fd)
+    except (OSError, ValueError):
+        return None
+
+
+def query_cache_put(kind, key, value):
+    """Store value (anything JSON serializable) for key. Failing to write the
+    cache is not an error."""
+
+    cache_dir = query_cache_dir()
+    if cache_dir is None:
+        return
+    filename = os.path.join(cache_dir, kind, key + ".json")
+    tmp_filename = "%s.%d.tmp" % (filename, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(tmp_filename, "w") as fd:
+            json.dump(value, fd)
+        os.replace(tmp_filename, filename)
+    except OSError as err:
+        print("Warning: could not write release tool cache: %s" % err, file=sys.stderr)
+
+
+def resolve_commit(git_dir, rev):
+    """Return the SHA of the commit rev points to."""
+    sha = GitCatFile.of(git_dir).rev_parse(rev + "^{commit}")
+    if sha is None:
+        raise Exception("No such commit: %s" % rev)
+    return sha
+
+
 def get_docker_compose_data_for_rev(git_dir, rev, version="git"):
     """Return docker-compose data from all the YML files in the given revision.
-    See get_docker_compose_data_from_json_list."""
+    See get_docker_compose_data_from_json_list.
+
+    The data is cached by commit, see query_cache_dir."""
     try:
-        yamls = []
-        files = (
-            execute_git(None, git_dir, ["ls-tree", "--name-only", rev], capture=True)
-            .strip()
-            .split("\n")
-        )
-        for filename in filter_docker_compose_files_list(files, version):
-            output = execute_git(
-                None, git_dir, ["show", "%s:%s" % (rev, filename)], capture=True
-            )
-            yamls.append(output)
+        key = "%s-%s" % (resolve_commit(git_dir, rev), version)
+        data = DOCKER_COMPOSE_DATA_CACHE.get(key)
+        if data is None:
+            data = query_cache_get("docker-compose-data", key)
+        if data is None:
+            cat_file = GitCatFile.of(git_dir)
+            yamls = []
+            for filename in filter_docker_compose_files_list(
+                cat_file.ls_tree(rev), version
+            ):
+                yamls.append(cat_file.show(rev, filename))
 
-        data = get_docker_compose_data_from_json_list(yamls)
-        return version_specific_docker_compose_data_patching(data, rev)
+            data = get_docker_compose_data_from_json_list(yamls)
+            query_cache_put("docker-compose-data", key, data)
+        DOCKER_COMPOSE_DATA_CACHE[key] = data
+
+        # The patching depends on the name of rev, not only on its content, and
+        # it modifies the data, so it applies to a copy of the cached data.
+        return version_specific_docker_compose_data_patching(copy.deepcopy(data), rev)
     except Exception as ex:
         raise Exception("Cannot get docker-compose data for %s" % rev) from ex
 
 
+def get_component_maps_for_rev(git_dir, rev):
+    """Return the parsed component-maps.yml of the given revision, or None if it
+    doesn't have one. Cached by commit, like get_docker_compose_data_for_rev, so
+    the same object is returned for the same integration version."""
+
+    key = resolve_commit(git_dir, rev)
+    if key in COMPONENT_MAPS_CACHE:
+        component_maps = COMPONENT_MAPS_CACHE[key]
+    else:
+        # The absence of the file is cached too, as {}.
+        component_maps = query_cache_get("component-maps", key)
+        if component_maps is None:
+            content = GitCatFile.of(git_dir).show(rev, "component-maps.yml")
+            component_maps = yaml_safe_load(content) if content is not None else {}
+            query_cache_put("component-maps", key, component_maps)
+        COMPONENT_MAPS_CACHE[key] = component_maps
+    # Shared with other callers (and indexed, see ComponentMapsIndex), so the
+    # result must not be modified.
+    return component_maps or None
+
+
+def closest_ref_to_head(git_dir):
+    """Return the "closest" branch or tag name to HEAD. Basically we measure the
+    distance in commits from the merge base of most refs to the current HEAD,
+    and then pick the shortest one, and we assume that this is our current
+    version. We pick all the refs from tags and local branches, as well as
+    single level upstream branches (which avoids pull requests).
+
+    The distance of a ref is the number of commits in ref..HEAD, so it is
+    computed for all refs in a single walk of the history, as the difference
+    between the ancestor sets of HEAD and of the ref. The result is cached by
+    HEAD and the commits of all the refs."""
+
+    refs = subprocess.check_output(
+        [
+            "git",
+            "for-each-ref",
+            "--format=%(refname:short)%09%(objectname)%09%(objecttype)"
+            + "%09%(*objectname)%09%(*objecttype)",
+            "refs/tags/*",
+            "refs/heads/*",
+            "refs/remotes/*/*",
+        ],
+        cwd=git_dir,
+    ).decode()
+    head = resolve_commit(git_dir, "HEAD")
+    key = hashlib.sha1((head + "\n" + refs).encode()).hexdigest()
+    closest = query_cache_get("closest-ref", key)
+    if closest is not None:
+        return closest
+
+    ref_commits = {}
+    other_refs = []
+    for line in refs.splitlines():
+        name, sha, type, peeled_sha, peeled_type = line.split("\t")
+        if peeled_type == "commit":
+            ref_commits[name] = peeled_sha
+        elif type == "commit":
+            ref_commits[name] = sha
+        else:
+            # No merge base with HEAD, so all of HEAD's history is in between.
+            other_refs.append(name)
+
+    wanted = set(ref_commits.values())
+    wanted.add(head)
+    rev_list = subprocess.check_output(
+        ["git", "rev-list", "--topo-order", "--reverse", "--parents", "--stdin"],
+        input="\n".join(sorted(wanted)).encode() + b"\n",
+        cwd=git_dir,
+    ).decode()
+
+    # Ancestor sets as bitsets, one bit per commit. Parents come before their
+    # children, and the set of a commit is dropped once all its children have
+    # been walked, unless it is one of the wanted ones.
+    commits = [line.split() for line in rev_list.splitlines()]
+    children_left = {}
+    for commit in commits:
+        for parent in commit[1:]:
+            children_left[parent] = children_left.get(parent, 0) + 1
+    ancestors = {}
+    wanted_ancestors = {}
+    for bit, commit in enumerate(commits):
+        sha = commit[0]
+        bits = 1 << bit
+        for parent in commit[1:]:
+            bits |= ancestors.get(parent, 0)
+            children_left[parent] -= 1
+            if children_left[parent] == 0:
+                ancestors.pop(parent, None)
+        if sha in children_left:
+            ancestors[sha] = bits
+        if sha in wanted:
+            wanted_ancestors[sha] = bits
+
+    head_ancestors = wanted_ancestors[head]
+    head_count = bin(head_ancestors).count("1")
+    distances = []
+    for name, sha in ref_commits.items():
+        common = head_ancestors & wanted_ancestors[sha]
+        distances.append((head_count - bin(common).count("1"), name))
+    distances += [(head_count, name) for name in other_refs]
+    closest = min(distances)[1] if distances else ""
+
+    query_cache_put("closest-ref", key, closest)
+    return closest
+
+
 def version_of(
-    integration_dir, component, in_integration_version=None, git_version=True
+    integration_dir,
+    component,
+    in_integration_version=None,
+    git_version=True,
+    resolved=None,
 ):
+    """Return the version of component in the given integration version (or
+    range), or in the integration working tree if None. resolved is a dict
+    used to remember what was read for the integration revisions, to share it
+    between calls for several components; see versions_of."""
+
+    if resolved is None:
+        resolved = {}
+
+    def compose_data(rev, version):
+        if (rev, version) not in resolved:
+            if rev is None:
+                data = get_docker_compose_data(integration_dir, version)
+            else:
+                data = get_docker_compose_data_for_rev(integration_dir, rev, version)
+            resolved[(rev, version)] = data
+        return resolved[(rev, version)]
+
     git_components = component.associated_components_of_type("git")
     docker_components = component.associated_components_of_type("docker_image")
     if git_version:
@@ -620,25 +899,9 @@ def version_of(
             # Just return the supplied version string.
             return in_integration_version
         else:
-            # Return "closest" branch or tag name. Basically we measure the
-            # distance in commits from the merge base of most refs to the
-            # current HEAD, and then pick the shortest one, and we assume that
-            # this is our current version. We pick all the refs from tags and
-            # local branches, as well as single level upstream branches (which
-            # avoids pull requests).
-            return (
-                subprocess.check_output(
-                    """
-                for i in $(git for-each-ref --format='%(refname:short)' 'refs/tags/*' 'refs/heads/*' 'refs/remotes/*/*'); do
-                    echo $(git log --oneline $(git merge-base $i HEAD)..HEAD | wc -l) $i
-                done | sort -n | head -n1 | awk '{print $2}'
-            """,
-                    shell=True,
-                    cwd=integration_dir,
-                )
-                .strip()
-                .decode()
-            )
+            if "closest-ref" not in resolved:
+                resolved["closest-ref"] = closest_ref_to_head(integration_dir)
+            return resolved["closest-ref"]
 
     if in_integration_version is not None:
         # Check if there is a range, and if so, return range.
@@ -654,32 +917,33 @@ def version_of(
         repo_range = []
         for rev in rev_range:
             # Figure out if the user string contained a remote or not
-            remote = ""
-            split = rev.split("/", 1)
-            if len(split) > 1:
-                remote_candidate = split[0]
-                ref_name = split[1]
-                if (
-                    subprocess.call(
-                        "git rev-parse -q --verify refs/heads/%s > /dev/null"
-                        % ref_name,
-                        shell=True,
-                        cwd=integration_dir,
-                    )
-                    == 0
-                ):
-                    remote = remote_candidate + "/"
+            if ("remote", rev) not in resolved:
+                remote = ""
+                split = rev.split("/", 1)
+                if len(split) > 1:
+                    remote_candidate = split[0]
+                    ref_name = split[1]
+                    if (
+                        subprocess.call(
+                            "git rev-parse -q --verify refs/heads/%s > /dev/null"
+                            % ref_name,
+                            shell=True,
+                            cwd=integration_dir,
+                        )
+                        == 0
+                    ):
+                        remote = remote_candidate + "/"
+                resolved[("remote", rev)] = remote
+            remote = resolved[("remote", rev)]
 
             if not git_version:
-                data = get_docker_compose_data_for_rev(integration_dir, rev, "docker")
+                data = compose_data(rev, "docker")
             else:
-                data = get_docker_compose_data_for_rev(integration_dir, rev, "git")
+                data = compose_data(rev, "git")
                 # For pre 2.4.x releases git-versions.*.yml files do not exist hence this listing
                 # would be missing the backend components. Try loading the old "docker" versions.
                 if data.get(image_name) is None:
-                    data = get_docker_compose_data_for_rev(
-                        integration_dir, rev, "docker"
-                    )
+                    data = compose_data(rev, "docker")
             # If the repository didn't exist in that version, just return all
             # commits in that case, IOW no lower end point range.
             if data.get(image_name) is not None:
@@ -692,12 +956,37 @@ def version_of(
         return range_type.join(repo_range)
     else:
         if not git_version:
-            data = get_docker_compose_data(integration_dir, "docker")
+            data = compose_data(None, "docker")
         else:
-            data = get_docker_compose_data(integration_dir, "git")
+            data = compose_data(None, "git")
         return data[image_name]["version"]
 
 
+def versions_of(
+    integration_dir, components, in_integration_version=None, git_version=True
+):
+    """Return {component name: version} for all the components, like
+    version_of, but reading each integration revision only once. The version
+    is None for components which are not in the integration version, and an
+    empty string for a range where they are in neither end."""
+
+    resolved = {}
+    versions = {}
+    for component in components:
+        try:
+            version = version_of(
+                integration_dir,
+                component,
+                in_integration_version,
+                git_version=git_version,
+                resolved=resolved,
+            )
+        except KeyError:
+            version = None
+        versions[component.name] = version
+    return versions
+
+
 def do_version_of(args):
     """Process --version-of argument."""
 
@@ -733,6 +1022,34 @@ def do_version_of(args):
     )
 
 
+def do_version_of_all(args):
+    """Process --version-of-all argument."""
+
+    if args.version_type is None:
+        version_type = "git"
+    else:
+        version_type = args.version_type
+    assert version_type in ["docker", "git"], (
+        "%s is not a valid name type for --version-of-all!" % version_type
+    )
+
+    Component.set_integration_version(args.in_integration_version)
+    repos = Component.get_components_of_type(
+        "git" if version_type == "git" else "docker_image",
+        only_release=(not args.all),
+        only_non_independent_component=args.only_backend,
+        only_independent_component=args.only_client,
+    )
+    repos.sort(key=lambda x: x.name)
+    versions = versions_of(
+        integration_dir(),
+        repos,
+        args.in_integration_version,
+        git_version=(version_type == "git"),
+    )
+    print(json.dumps({"repos": versions}, indent=2))
+
+
 def do_list_repos(args, optional_too, only_backend, only_client):
     """Lists the repos, using the provided type."""
 
@@ -762,17 +1079,18 @@ def do_list_repos(args, optional_too, only_backend, only_client):
         return
 
     repos_versions_dict = {}
+    versions = versions_of(
+        integration_dir(),
+        repos,
+        args.in_integration_version,
+        git_version=(args.list == "git"),
+    )
     for repo in repos:
-        try:
-            repos_versions_dict[repo.name] = version_of(
-                integration_dir(),
-                repo,
-                args.in_integration_version,
-                git_version=(args.list == "git"),
-            )
-        except KeyError:
+        if versions[repo.name] is None:
             # This repo doesn't exist in the given integration version
             repos_versions_dict[repo.name] = "UNRELEASED"
+        else:
+            repos_versions_dict[repo.name] = versions[repo.name]
 
     if args.list_format == "table":
         name_len_max = str(max([len(r) for r in repos_versions_dict.keys()]))
@@ -820,12 +1138,10 @@ def version_sort_key(version):
 def sorted_final_version_list(git_dir):
     """Returns a sorted list of all final version tags."""
 
-    tags = execute_git(
+    refs = for_each_ref(
         None,
         git_dir,
         [
-            "for-each-ref",
-            "--format=%(refname:short)",
             # Two digits for each component ought to be enough...
             "refs/tags/[0-9].[0-9].[0-9]",
             "refs/tags/[0-9].[0-9].[0-9][0-9]",
@@ -844,9 +1160,9 @@ def sorted_final_version_list(git_dir):
             "refs/tags/[0-9][0-9].[0-9][0-9].[0-9]b[0-9]",
             "refs/tags/[0-9][0-9].[0-9][0-9].[0-9][0-9]b[0-9]",
         ],
-        capture=True,
     )
-    return sorted(tags.split(), key=version_sort_key, reverse=True)
+    tags = [short_ref_name(refname) for refname, _, _ in refs]
+    return sorted(tags, key=version_sort_key, reverse=True)
 
 
 def state_value(state, key_list):
@@ -868,9 +1184,9 @@ def state_value(state, key_list):
         return None
 
 
-def update_state(state, key_list, value):
-    """Updates the state variable and writes this to the RELEASE_TOOL_STATE state
-    file. key_list is the same value as the state_value function."""
+def set_state_value(state, key_list, value):
+    """Sets a value in the state variable, creating the parent keys as needed.
+    key_list is the same value as the state_value function."""
     next = state
     prev = state
     for key in key_list:
@@ -880,9 +1196,140 @@ def update_state(state, key_list, value):
         next = next[key]
     prev[key_list[-1]] = value
 
-    fd = open(RELEASE_TOOL_STATE, "w")
-    fd.write(yaml.dump(state))
-    fd.close()
+
+class StateStore:
+    """Keeps a state variable in a YAML state file, with its updates appended
+    to a journal next to it ("<state file>.journal") instead of rewriting the
+    whole file every time.
+
+    The journal has one JSON line per update, after a header line with the
+    hash of the state file it applies to. Loading replays it on top of the
+    state file, ignoring a last line cut short by a crash. Every
+    COMPACT_EVERY updates, and when the program exits, the state is written
+    back to the state file (through a temporary file, so it is replaced
+    atomically) and the journal is removed. If the state file doesn't match
+    the hash of the journal, e.g. because it was edited manually, the journal
+    is ignored.
+    """
+
+    COMPACT_EVERY = 100
+
+    _stores = {}
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.journal_filename = filename + ".journal"
+        self._snapshot_hash = None
+        self._updates = 0
+        self._state = None
+        atexit.register(self._compact)
+
+    @staticmethod
+    def of(filename):
+        filename = os.path.abspath(filename)
+        if filename not in StateStore._stores:
+            StateStore._stores[filename] = StateStore(filename)
+        return StateStore._stores[filename]
+
+    @staticmethod
+    def _hash(snapshot):
+        if snapshot is None:
+            return None
+        return hashlib.sha256(snapshot).hexdigest()
+
+    def load(self):
+        """Return the state, with the journal replayed."""
+        try:
+            with open(self.filename, "rb") as fd:
+                snapshot = fd.read()
+        except FileNotFoundError:
+            snapshot = None
+        state = (yaml_safe_load(snapshot) if snapshot else None) or {}
+        self._snapshot_hash = self._hash(snapshot)
+        self._updates = 0
+        self._state = state
+
+        try:
+            with open(self.journal_filename) as fd:
+                lines = fd.readlines()
+        except FileNotFoundError:
+            return state
+        try:
+            header = json.loads(lines[0])
+        except (IndexError, ValueError):
+            header = {}
+        if header.get("snapshot") != self._snapshot_hash:
+            print(
+                "Warning: %s changed after %s was written, ignoring the latter."
+                % (self.filename, self.journal_filename)
+            )
+            os.remove(self.journal_filename)
+            return state
+        for line in lines[1:]:
+            try:
+                update = json.loads(line)
+            except ValueError:
+                # Cut short by a crash, and necessarily the last one.
+                break
+            set_state_value(state, update["key"], update["value"])
+        self.save(state)
+        return state
+
+    def update(self, state, key_list, value):
+        """Set a value in state, and record it in the journal."""
+        set_state_value(state, key_list, value)
+        self._state = state
+        if not os.path.exists(self.journal_filename):
+            header = json.dumps({"snapshot": self._snapshot_hash}) + "\n"
+        else:
+            header = ""
+        with open(self.journal_filename, "a") as fd:
+            fd.write(header + json.dumps({"key": key_list, "value": value}) + "\n")
+            fd.flush()
+            os.fsync(fd.fileno())
+        self._updates += 1
+        if self._updates >= self.COMPACT_EVERY:
+            self.save(state)
+
+    def save(self, state):
+        """Write the whole state to the state file, and drop the journal."""
+        snapshot = yaml.dump(state).encode()
+        tmp_filename = "%s.%d.tmp" % (self.filename, os.getpid())
+        with open(tmp_filename, "wb") as fd:
+            fd.write(snapshot)
+            fd.flush()
+            os.fsync(fd.fileno())
+        os.replace(tmp_filename, self.filename)
+        # A crash right here leaves a journal which doesn't match the state
+        # file, and which is therefore ignored: it is already applied.
+        try:
+            os.remove(self.journal_filename)
+        except FileNotFoundError:
+            pass
+        self._snapshot_hash = self._hash(snapshot)
+        self._updates = 0
+        self._state = state
+
+    def _compact(self):
+        if self._updates > 0 and self._state is not None:
+            self.save(self._state)
+
+
+def load_state():
+    """Loads the state variable from the RELEASE_TOOL_STATE state file."""
+    return StateStore.of(RELEASE_TOOL_STATE).load()
+
+
+def save_state(state):
+    """Writes the whole state variable to the RELEASE_TOOL_STATE state file,
+    e.g. before it is edited manually."""
+    StateStore.of(RELEASE_TOOL_STATE).save(state)
+
+
+def update_state(state, key_list, value):
+    """Updates the state variable and records this in the RELEASE_TOOL_STATE
+    state file. key_list is the same value as the state_value function."""
+    StateStore.of(RELEASE_TOOL_STATE).update(state, key_list, value)
 
 
 def execute_git(state, repo_git, args, capture=False, capture_stderr=False):
@@ -917,32 +1364,519 @@ def execute_git(state, repo_git, args, capture=False, capture_stderr=False):
         print("Would have executed: cd %s && git %s" % (git_dir, " ".join(args)))
         return None
 
-    fd = os.open(".", flags=os.O_RDONLY)
-    os.chdir(git_dir)
     if capture_stderr:
         stderr = subprocess.STDOUT
     else:
         stderr = None
 
+    if capture:
+        output = (
+            subprocess.check_output(["git"] + args, stderr=stderr, cwd=git_dir)
+            .decode()
+            .strip()
+        )
+    elif getattr(_repo_output, "buffer", None) is not None:
+        # Running in parallel_per_repo, so the output must go to the buffer of
+        # the repository instead of straight to the terminal.
+        output = None
+        try:
+            sys.stdout.write(
+                subprocess.check_output(
+                    ["git"] + args, stderr=subprocess.STDOUT, cwd=git_dir
+                ).decode()
+            )
+        except subprocess.CalledProcessError as err:
+            sys.stdout.write(err.output.decode())
+            raise
+    else:
+        output = None
+        subprocess.check_call(["git"] + args, stderr=stderr, cwd=git_dir)
+
+    return output
+
+
+# Output buffer of the repository a parallel_per_repo thread is working on.
+_repo_output = threading.local()
+
+
+class _PerRepoStdout:
+    """Stand-in for sys.stdout while parallel_per_repo runs: what the worker
+    threads print goes to the buffer of their repository, the rest goes to the
+    real stdout."""
+
+    def __init__(self, stdout):
+        self.stdout = stdout
+
+    def write(self, text):
+        buffer = getattr(_repo_output, "buffer", None)
+        if buffer is None:
+            return self.stdout.write(text)
+        buffer.append(text)
+        return len(text)
+
+    def flush(self):
+        if getattr(_repo_output, "buffer", None) is None:
+            self.stdout.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stdout, name)
+
+
+def parallel_per_repo(func, items, jobs=None):
+    """Call func(item) for all items, at most `jobs` (default: GIT_JOBS) at a
+    time, and return the results in the order of items.
+
+    What the calls print, including the output of execute_git, is buffered per
+    item and printed in the order of items, so it reads as if the calls were
+    made one by one. If a call raises, its exception is raised once the output
+    of the calls before it, and its own, has been printed, and the calls which
+    haven't started yet are cancelled. The calls must not ask questions;
+    collect what is needed first and ask afterwards."""
+
+    items = list(items)
+    if jobs is None:
+        jobs = GIT_JOBS
+    if jobs <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+
+    def run(item):
+        _repo_output.buffer = []
+        try:
+            return _repo_output.buffer, func(item), None
+        except Exception as ex:
+            return _repo_output.buffer, None, ex
+        finally:
+            _repo_output.buffer = None
+
+    stdout = sys.stdout
+    if not isinstance(stdout, _PerRepoStdout):
+        sys.stdout = _PerRepoStdout(stdout)
     try:
-        if capture:
-            output = (
-                subprocess.check_output(["git"] + args, stderr=stderr).decode().strip()
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=min(jobs, len(items))
+        ) as pool:
+            futures = [pool.submit(run, item) for item in items]
+            results = []
+            for index, future in enumerate(futures):
+                buffer, result, ex = future.result()
+                stdout.write("".join(buffer))
+                if ex is not None:
+                    for later in futures[index + 1 :]:
+                        later.cancel()
+                    raise ex
+                results.append(result)
+            return results
+    finally:
+        sys.stdout = stdout
+
+
+class GitCatFile:
+    """Reads objects from a Git repository through a single long-lived
+    `git cat-file --batch` process, instead of forking one `git show` per
+    object. Use GitCatFile.of(git_dir) to get the shared instance of a
+    repository."""
+
+    _instances = {}
+
+    def __init__(self, git_dir):
+        self.git_dir = git_dir
+        self._proc = None
+
+    @staticmethod
+    def of(git_dir):
+        git_dir = os.path.abspath(git_dir)
+        if git_dir not in GitCatFile._instances:
+            GitCatFile._instances[git_dir] = GitCatFile(git_dir)
+        return GitCatFile._instances[git_dir]
+
+    @staticmethod
+    def close_all():
+        for instance in GitCatFile._instances.values():
+            instance.close()
+        GitCatFile._instances = {}
+
+    def close(self):
+        if self._proc is not None:
+            self._proc.stdin.close()
+            self._proc.wait()
+            self._proc = None
+
+    def read(self, spec):
+        """Return (sha, type, content) of the object named by spec (anything
+        rev-parse understands, e.g. "rev:path" or "rev^{commit}"), or None if
+        there is no such object."""
+
+        if self._proc is None or self._proc.poll() is not None:
+            self._proc = subprocess.Popen(
+                ["git", "cat-file", "--batch"],
+                cwd=self.git_dir,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+            )
+        try:
+            self._proc.stdin.write(spec.encode() + b"\n")
+            self._proc.stdin.flush()
+            header = self._proc.stdout.readline().decode().split()
+            # "<spec> missing" or "<spec> ambiguous", the spec may have spaces.
+            if header and header[-1] in ("missing", "ambiguous"):
+                return None
+            if len(header) != 3:
+                raise ValueError("unexpected header %s" % header)
+            sha, type, size = header
+            content = self._proc.stdout.read(int(size))
+            self._proc.stdout.read(1)
+        except (OSError, ValueError) as ex:
+            self.close()
+            raise Exception("git cat-file failed in %s" % self.git_dir) from ex
+        return sha, type, content
+
+    def rev_parse(self, spec):
+        """Return the SHA of the object named by spec, or None."""
+        obj = self.read(spec)
+        return obj[0] if obj is not None else None
+
+    def show(self, rev, path):
+        """Return the content of path in rev as a string, or None if it does not
+        exist."""
+        obj = self.read("%s:%s" % (rev, path))
+        if obj is None or obj[1] != "blob":
+            return None
+        return obj[2].decode()
+
+    def ls_tree(self, rev):
+        """Return the names of the entries at the top of the tree of rev."""
+        obj = self.read("%s^{tree}" % rev)
+        if obj is None:
+            raise Exception("No tree found for %s in %s" % (rev, self.git_dir))
+        sha_len = len(obj[0]) // 2
+        names = []
+        tree = obj[2]
+        pos = 0
+        while pos < len(tree):
+            # Entries are "<mode> <name>\0<binary sha>".
+            name_start = tree.index(b" ", pos) + 1
+            name_end = tree.index(b"\0", name_start)
+            names.append(tree[name_start:name_end].decode())
+            pos = name_end + 1 + sha_len
+        return names
+
+
+class GitRefs:
+    """Reads the refs and the config of a Git repository straight from its
+    files (loose refs, packed-refs and the config file), instead of running
+    Git. Only used when RELEASE_TOOL_IN_PROCESS_REFS is set: use
+    GitRefs.of(git_dir), which returns None otherwise, and for repositories it
+    cannot read, e.g. worktrees or ones using the reftable format; ask Git in
+    that case.
+
+    Annotated tags which aren't peeled in packed-refs are peeled through
+    GitCatFile."""
+
+    _instances = {}
+
+    def __init__(self, git_dir, gitdir):
+        self.git_dir = git_dir
+        self.gitdir = gitdir
+        self._packed = {}
+
+    @staticmethod
+    def of(git_dir):
+        if not os.environ.get("RELEASE_TOOL_IN_PROCESS_REFS"):
+            return None
+        git_dir = os.path.abspath(git_dir)
+        if git_dir not in GitRefs._instances:
+            GitRefs._instances[git_dir] = GitRefs._open(git_dir)
+        return GitRefs._instances[git_dir]
+
+    @staticmethod
+    def _open(git_dir):
+        dot_git = os.path.join(git_dir, ".git")
+        if os.path.isfile(dot_git):
+            # A worktree or a submodule: ".git" points to the real one.
+            with open(dot_git) as fd:
+                content = fd.read().strip()
+            if not content.startswith("gitdir: "):
+                return None
+            gitdir = os.path.join(git_dir, content[len("gitdir: ") :])
+        elif os.path.isdir(dot_git):
+            gitdir = dot_git
+        else:
+            return None
+        if os.path.isfile(os.path.join(gitdir, "commondir")):
+            # A linked worktree, which has refs of its own.
+            return None
+        if os.path.exists(os.path.join(gitdir, "reftable")):
+            return None
+        return GitRefs(git_dir, gitdir)
+
+    def _packed_refs(self):
+        """Return {refname: (sha, peeled sha, whether peeled is known)}."""
+        refs = {}
+        try:
+            with open(os.path.join(self.gitdir, "packed-refs")) as fd:
+                lines = fd.read().splitlines()
+        except FileNotFoundError:
+            return refs
+        traits = []
+        last = None
+        for line in lines:
+            if line.startswith("#"):
+                if line.startswith("# pack-refs with:"):
+                    traits = line.split(":", 1)[1].split()
+            elif line.startswith("^"):
+                refs[last] = (refs[last][0], line[1:], True)
+            else:
+                sha, last = line.split(" ", 1)
+                # With "peeled", tags without a "^" line are not annotated, and
+                # with "fully-peeled", no ref without one is.
+                known = "fully-peeled" in traits or (
+                    "peeled" in traits and last.startswith("refs/tags/")
+                )
+                refs[last] = (sha, None, known)
+        return refs
+
+    def _read_ref_file(self, path):
+        try:
+            with open(path) as fd:
+                return fd.read().strip()
+        except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+            return None
+
+    def _loose_refs(self):
+        """Return {refname: content of the ref file}."""
+        refs = {}
+        refs_dir = os.path.join(self.gitdir, "refs")
+        for path, dirs, files in os.walk(refs_dir):
+            for file in files:
+                if file.endswith(".lock"):
+                    continue
+                content = self._read_ref_file(os.path.join(path, file))
+                if content:
+                    refname = os.path.relpath(os.path.join(path, file), self.gitdir)
+                    refs[refname.replace(os.sep, "/")] = content
+        return refs
+
+    def refs(self):
+        """Return {refname: sha} of all the refs, like git for-each-ref does,
+        with symbolic refs resolved."""
+
+        packed = self._packed_refs()
+        loose = self._loose_refs()
+
+        def resolve(refname, depth=0):
+            content = loose.get(refname)
+            if content is None:
+                return packed[refname][0] if refname in packed else None
+            if content.startswith("ref: "):
+                if depth > 5:
+                    return None
+                return resolve(content[len("ref: ") :], depth + 1)
+            return content
+
+        # Remembered for peeled().
+        self._packed = {
+            refname: value for refname, value in packed.items() if refname not in loose
+        }
+        result = {}
+        for refname in set(packed) | set(loose):
+            sha = resolve(refname)
+            # Otherwise a dangling symbolic ref.
+            if sha is not None:
+                result[refname] = sha
+        return result
+
+    def peeled(self, refname, sha):
+        """Return the SHA sha, the one of ref refname in the last refs() call,
+        peels to if it is an annotated tag, or None. Only tags are looked at,
+        other refs are taken to point to commits."""
+        packed = self._packed.get(refname)
+        if packed is not None and packed[2]:
+            return packed[1]
+        if not refname.startswith("refs/tags/"):
+            return None
+        return self.peel(sha)
+
+    def head(self):
+        """Return the SHA HEAD points to, or None (unborn branch)."""
+        content = self._read_ref_file(os.path.join(self.gitdir, "HEAD"))
+        if content is None or not content.startswith("ref: "):
+            return content
+        return self.refs().get(content[len("ref: ") :])
+
+    def peel(self, sha):
+        """Return the SHA of the object the tag object sha points to, fully
+        peeled, or None if sha is not a tag."""
+        peeled = GitCatFile.of(self.git_dir).rev_parse("%s^{}" % sha)
+        return peeled if peeled != sha else None
+
+    @staticmethod
+    def _config_value(value):
+        result = ""
+        quoted = False
+        escape = False
+        for char in value.strip():
+            if escape:
+                result += {"n": "\n", "t": "\t", "b": "\b"}.get(char, char)
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                quoted = not quoted
+            elif char in "#;" and not quoted:
+                break
+            else:
+                result += char
+        return result.strip() if not quoted else result
+
+    def config_list(self):
+        """Return the settings of the config file of the repository, as
+        "section[.subsection].key=value" lines like git config -l. None if it
+        includes other files, which is left to Git."""
+
+        try:
+            with open(os.path.join(self.gitdir, "config")) as fd:
+                lines = fd.read().splitlines()
+        except FileNotFoundError:
+            return []
+        settings = []
+        section = None
+        for line in lines:
+            line = line.strip()
+            match = re.match(
+                r'^\[\s*([\w.-]+)(?:\s+"((?:[^"\\]|\\.)*)")?\s*\](.*)$', line
             )
+            if match is not None:
+                name, subsection, line = match.groups()
+                section = name.lower()
+                if section in ["include", "includeif"]:
+                    return None
+                if subsection is not None:
+                    section += "." + re.sub(r"\\(.)", r"\1", subsection)
+                line = line.strip()
+            if not line or line[0] in "#;" or section is None:
+                continue
+            key, equals, value = line.partition("=")
+            value = self._config_value(value) if equals else "true"
+            settings.append("%s.%s=%s" % (section, key.strip().lower(), value))
+        return settings
+
+
+def ref_pattern_regex(pattern):
+    """Return a regex matching what a git for-each-ref pattern does: the refs
+    under it, or the refs matching it as a glob where "*" and "?" don't match
+    "/", but "**" does."""
+
+    regex = ""
+    pos = 0
+    while pos < len(pattern):
+        char = pattern[pos]
+        if pattern.startswith("**", pos):
+            regex += ".*"
+            pos += 2
+            continue
+        if char == "*":
+            regex += "[^/]*"
+        elif char == "?":
+            regex += "[^/]"
+        elif char == "[" and "]" in pattern[pos + 2 :]:
+            end = pattern.index("]", pos + 2)
+            chars = pattern[pos + 1 : end]
+            if chars[0] in "!^":
+                chars = "^/" + chars[1:]
+            regex += "[" + chars.replace("\\", "\\\\") + "]"
+            pos = end
         else:
-            output = None
-            subprocess.check_call(["git"] + args, stderr=stderr)
-    finally:
-        os.fchdir(fd)
-        os.close(fd)
+            regex += re.escape(char)
+        pos += 1
+    prefix = re.escape(pattern) if pattern.endswith("/") else re.escape(pattern) + "/"
+    return "^(?:%s$|%s|%s$)" % (regex, prefix, re.escape(pattern))
 
-    return output
+
+def short_ref_name(refname):
+    """Return the short name of a ref, like %(refname:short) of git
+    for-each-ref (without checking for ambiguity)."""
+    match = re.match(r"^refs/remotes/(.+)/HEAD$", refname)
+    if match is not None:
+        return match.group(1)
+    for prefix in ["refs/heads/", "refs/tags/", "refs/remotes/", "refs/"]:
+        if refname.startswith(prefix):
+            return refname[len(prefix) :]
+    return refname
+
+
+def for_each_ref_in_process(git_refs, patterns, points_at=None):
+    """for_each_ref using git_refs, a GitRefs. Returns None when Git is needed
+    to answer, for points_at other than HEAD or a SHA."""
+
+    if points_at == "HEAD":
+        points_at = git_refs.head()
+        if points_at is None:
+            return []
+    elif points_at is not None and not re.match("^[0-9a-f]{40}$", points_at):
+        return None
+
+    regex = re.compile("|".join([ref_pattern_regex(p) for p in patterns]))
+    result = []
+    for refname, sha in sorted(git_refs.refs().items()):
+        if not regex.match(refname):
+            continue
+        peeled = git_refs.peeled(refname, sha)
+        if points_at is not None and points_at not in [sha, peeled]:
+            continue
+        result.append((refname, sha, peeled))
+    return result
 
 
-def query_execute_git_list(execute_git_list):
+def for_each_ref(state, repo_git, patterns, points_at=None, sort=None):
+    """Lists the refs matching patterns, like git for-each-ref, as a list of
+    (refname, sha, peeled sha) triplets sorted by refname, or by the --sort key
+    sort, where the peeled sha is None unless the ref points to an annotated
+    tag. With points_at, only the refs pointing to that object, directly or
+    through a tag, are listed. state and repo_git are as in execute_git.
+
+    Git is run, unless RELEASE_TOOL_IN_PROCESS_REFS is set, in which case the
+    refs are read by GitRefs when possible. Git is still run if that fails."""
+
+    if os.path.isabs(repo_git):
+        git_dir = repo_git
+    else:
+        git_dir = os.path.join(state["repo_dir"], repo_git)
+
+    git_refs = GitRefs.of(git_dir) if sort is None else None
+    if git_refs is not None:
+        try:
+            result = for_each_ref_in_process(git_refs, patterns, points_at)
+        except Exception:
+            # Something GitRefs doesn't understand. Git knows better.
+            result = None
+        if result is not None:
+            return result
+
+    args = ["for-each-ref", "--format=%(refname)%09%(objectname)%09%(*objectname)"]
+    if sort is not None:
+        args += ["--sort=%s" % sort]
+    if points_at is not None:
+        args += ["--points-at", points_at]
+    output = execute_git(state, repo_git, args + patterns, capture=True)
+    result = []
+    for line in output.split("\n"):
+        if line:
+            # The output is stripped, so the empty field of the last ref may
+            # be gone.
+            refname, sha, peeled = (line.split("\t") + [""])[:3]
+            result.append((refname, sha, peeled or None))
+    return result
+
+
+def query_execute_git_list(execute_git_list, parallel=False):
     """Executes a list of Git commands after asking permission. The argument is
     a list of triplets with the first three arguments of execute_git. Both
-    capture flags will be false during this call."""
+    capture flags will be false during this call.
+
+    With parallel, the commands of different repositories run at the same time
+    (see parallel_per_repo), in their original order within each repository.
+    Only use it when the commands of a repository don't depend on the ones of
+    another repository."""
 
     print_line()
     for cmd in execute_git_list:
@@ -960,8 +1894,22 @@ def query_execute_git_list(execute_git_list):
     if not reply.startswith("Y") and not reply.startswith("y"):
         return False
 
-    for cmd in execute_git_list:
-        execute_git(cmd[0], cmd[1], cmd[2])
+    if parallel:
+        per_repo = {}
+        for cmd in execute_git_list:
+            per_repo.setdefault(cmd[1], []).append(cmd)
+        # One round per command of a repository: the first command of all the
+        # repositories, then the second one, and so on. So, for instance, no
+        # tag gets pushed anywhere unless all the tags could be created.
+        rounds = max([len(cmds) for cmds in per_repo.values()], default=0)
+        for index in range(rounds):
+            parallel_per_repo(
+                lambda cmd: execute_git(cmd[0], cmd[1], cmd[2]),
+                [cmds[index] for cmds in per_repo.values() if len(cmds) > index],
+            )
+    else:
+        for cmd in execute_git_list:
+            execute_git(cmd[0], cmd[1], cmd[2])
 
     return True
 
@@ -994,15 +1942,20 @@ def query_execute_list(execute_list, env=None):
     return True
 
 
-def setup_temp_git_checkout(state, repo_git, ref):
+def setup_temp_git_checkout(state, repo_git, ref, sparse_paths=None):
     """Checks out a temporary Git directory, and returns an absolute path to
-    it. Checks out the ref specified in ref."""
+    it. Checks out the ref specified in ref.
+
+    The objects of the repository are borrowed through Git alternates instead
+    of being copied. With sparse_paths, a list of patterns as in a
+    .gitignore file, only the matching files are checked out."""
 
     tmpdir = os.path.join(state["repo_dir"], "tmp_checkout", repo_git)
     cleanup_temp_git_checkout(tmpdir)
     os.makedirs(tmpdir)
 
-    if not os.path.exists(os.path.join(state["repo_dir"], repo_git)):
+    repo_path = os.path.join(state["repo_dir"], repo_git)
+    if not os.path.exists(repo_path):
         raise Exception("%s does not exist in %s!" % (repo_git, state["repo_dir"]))
 
     if ref.find("/") < 0:
@@ -1014,10 +1967,30 @@ def setup_temp_git_checkout(state, repo_git, ref):
 
     try:
         output = execute_git(state, tmpdir, ["init"], capture=True, capture_stderr=True)
+        objects_dir = execute_git(
+            state, repo_path, ["rev-parse", "--git-path", "objects"], capture=True
+        )
+        with open(
+            os.path.join(tmpdir, ".git", "objects", "info", "alternates"), "w"
+        ) as fd:
+            fd.write(os.path.join(repo_path, objects_dir) + "\n")
+        if sparse_paths is not None:
+            output = execute_git(
+                state,
+                tmpdir,
+                ["config", "core.sparseCheckout", "true"],
+                capture=True,
+                capture_stderr=True,
+            )
+            os.makedirs(os.path.join(tmpdir, ".git", "info"), exist_ok=True)
+            with open(
+                os.path.join(tmpdir, ".git", "info", "sparse-checkout"), "w"
+            ) as fd:
+                fd.write("".join([path + "\n" for path in sparse_paths]))
         output = execute_git(
             state,
             tmpdir,
-            ["fetch", os.path.join(state["repo_dir"], repo_git), "--tags"],
+            ["fetch", repo_path, "--tags"],
             capture=True,
             capture_stderr=True,
         )
@@ -1037,12 +2010,7 @@ def setup_temp_git_checkout(state, repo_git, ref):
             output = execute_git(
                 state,
                 tmpdir,
-                [
-                    "fetch",
-                    os.path.join(state["repo_dir"], repo_git),
-                    "--tags",
-                    "%s:%s" % (ref, ref),
-                ],
+                ["fetch", repo_path, "--tags", "%s:%s" % (ref, ref)],
                 capture=True,
                 capture_stderr=True,
             )
@@ -1060,6 +2028,11 @@ def cleanup_temp_git_checkout(tmpdir):
     shutil.rmtree(tmpdir, ignore_errors=True)
 
 
+# Remotes found by find_upstream_remote, by resolved repository path, name and
+# stamp of its config file.
+_upstream_remotes = {}
+
+
 def find_upstream_remote(state, repo_path, repo_name=None):
     """Given a Git repository, figure out which remote name is the
     "mendersoftware" upstream.
@@ -1070,9 +2043,40 @@ def find_upstream_remote(state, repo_path, repo_name=None):
     if repo_name is None:
         repo_name = os.path.basename(repo_path)
 
-    config = execute_git(state, repo_path, ["config", "-l"], capture=True)
+    if os.path.isabs(repo_path) or state is None:
+        git_dir = repo_path
+    else:
+        git_dir = os.path.join(state["repo_dir"], repo_path)
+
+    git_refs = GitRefs.of(git_dir)
+    cache_key = None
+    if git_refs is not None:
+        try:
+            stat = os.stat(os.path.join(git_refs.gitdir, "config"))
+            cache_key = (
+                os.path.abspath(git_dir),
+                repo_name,
+                stat.st_mtime_ns,
+                stat.st_size,
+            )
+        except FileNotFoundError:
+            pass
+    if cache_key in _upstream_remotes:
+        return _upstream_remotes[cache_key]
+
+    config = None
+    if git_refs is not None:
+        try:
+            config = git_refs.config_list()
+        except Exception:
+            # Left to Git below.
+            pass
+    if config is None:
+        config = execute_git(state, repo_path, ["config", "-l"], capture=True).split(
+            "\n"
+        )
     remote = None
-    for line in config.split("\n"):
+    for line in config:
         match = re.match(
             r"^remote\.([^.]+)\.url=.*github\.com[/:]mendersoftware/%s(\.git)?$"
             % repo_name,
@@ -1088,16 +2092,21 @@ def find_upstream_remote(state, repo_path, repo_name=None):
             % (repo_name, repo_path)
         )
 
+    if cache_key is not None:
+        _upstream_remotes[cache_key] = remote
     return remote
 
 
 def refresh_repos(state):
     """Do a full 'git fetch' on all repositories."""
 
+    repos = Component.get_components_of_type("git")
+    remotes = parallel_per_repo(
+        lambda repo: find_upstream_remote(state, repo.git()), repos
+    )
     git_list = []
 
-    for repo in Component.get_components_of_type("git"):
-        remote = find_upstream_remote(state, repo.git())
+    for repo, remote in zip(repos, remotes):
         git_list.append(
             (
                 state,
@@ -1106,7 +2115,24 @@ def refresh_repos(state):
             )
         )
 
-    query_execute_git_list(git_list)
+    query_execute_git_list(git_list, parallel=True)
+
+
+def tag_index_stamp(repo_path):
+    """Return a stamp of the tags of the repository, which changes whenever a
+    tag is added, moved or removed, e.g. by a fetch. None if the repository
+    layout is not known, and the tags must be listed every time."""
+
+    git_dir = os.path.join(repo_path, ".git")
+    if not os.path.isdir(git_dir):
+        return None
+    stamp = []
+    for path in ["packed-refs", "refs/tags", "reftable/tables.list"]:
+        try:
+            stamp.append(os.stat(os.path.join(git_dir, path)).st_mtime_ns)
+        except OSError:
+            stamp.append(None)
+    return stamp
 
 
 def check_tag_availability(state):
@@ -1120,60 +2146,111 @@ def check_tag_availability(state):
         build_tag: <highest Git build tag, or final Git tag>
         following: <branch we pick next build tag from>
         sha: <SHA of current build tag>
+
+    The tags are listed with one for-each-ref per repository, in parallel, and
+    kept in the state file under "tag_index" until they change (see
+    tag_index_stamp).
     """
 
-    tag_avail = {}
-    highest_overall = -1
-    all_released = True
-    for repo in Component.get_components_of_type("git"):
-        tag_avail[repo.git()] = {}
-        missing_repos = False
+    tag_index = state_value(state, ["tag_index"]) or {}
+
+    def tag_index_entry(repo):
+        """Return the tag_index entry of repo: its final and build tags for the
+        current version, with their SHAs. Reused from the state file as long
+        as the tags of the repository haven't changed."""
+
+        version = state[repo.git()]["version"]
+        stamp = tag_index_stamp(os.path.join(state["repo_dir"], repo.git()))
+        entry = tag_index.get(repo.git())
+        if (
+            stamp is not None
+            and entry is not None
+            and entry["version"] == version
+            and entry["stamp"] == stamp
+        ):
+            return entry
+
+        refs = execute_git(
+            state,
+            repo.git(),
+            [
+                "for-each-ref",
+                "--format=%(refname)%09%(objectname:short)%09%(*objectname:short)",
+                "refs/tags/%s" % version,
+                "refs/tags/%s-build*" % version,
+            ],
+            capture=True,
+        )
+        tags = {}
+        for line in refs.split("\n"):
+            if line:
+                # The output is stripped, so the empty field of the last
+                # lightweight tag may be gone.
+                refname, sha, peeled_sha = (line.split("\t") + [""])[:3]
+                # Annotated tags are peeled to their commit.
+                tags[refname[len("refs/tags/") :]] = peeled_sha or sha
+        return {"version": version, "stamp": stamp, "tags": tags}
+
+    def check_repo(repo):
+        """Return the tag_avail entry of repo, its highest build number (-1 if
+        it has no build tags), whether the repository is missing, and its
+        tag_index entry."""
+
+        avail = {}
+        highest = -1
+        version = state[repo.git()]["version"]
         try:
-            execute_git(
-                state,
-                repo.git(),
-                ["rev-parse", state[repo.git()]["version"]],
-                capture=True,
-                capture_stderr=True,
-            )
-            # No exception happened during above call: This is a final release
-            # tag.
-            tag_avail[repo.git()]["already_released"] = True
-            tag_avail[repo.git()]["build_tag"] = state[repo.git()]["version"]
+            entry = tag_index_entry(repo)
         except FileNotFoundError as err:
             print(err)
-            missing_repos = True
-        except subprocess.CalledProcessError:
-            # Exception happened during Git call. This tag doesn't exist, and
-            # we must look for and/or create build tags.
-            tag_avail[repo.git()]["already_released"] = False
-            all_released = False
+            return avail, highest, True, None
+
+        tags = entry["tags"]
+        if version in tags:
+            # This is a final release tag.
+            avail["already_released"] = True
+            avail["build_tag"] = version
+        else:
+            # This tag doesn't exist, and we must look for and/or create build
+            # tags.
+            avail["already_released"] = False
 
             # Find highest <version>-buildX tag, where X is a number.
-            tags = execute_git(state, repo.git(), ["tag"], capture=True)
-            highest = -1
-            for tag in tags.split("\n"):
-                match = re.match(
-                    "^%s-build([0-9]+)$" % re.escape(state[repo.git()]["version"]), tag
-                )
+            for tag in tags:
+                match = re.match("^%s-build([0-9]+)$" % re.escape(version), tag)
                 if match is not None and int(match.group(1)) > highest:
                     highest = int(match.group(1))
                     highest_tag = tag
             if highest >= 0:
                 # Assign highest tag so far.
-                tag_avail[repo.git()]["build_tag"] = highest_tag
-                if highest > highest_overall:
-                    highest_overall = highest
+                avail["build_tag"] = highest_tag
             # Else: Nothing. This repository doesn't have any build tags yet.
 
-        if tag_avail[repo.git()].get("build_tag") is not None:
-            sha = execute_git(
-                state,
-                repo.git(),
-                ["rev-parse", "--short", tag_avail[repo.git()]["build_tag"] + "~0"],
-                capture=True,
-            )
-            tag_avail[repo.git()]["sha"] = sha
+        if avail.get("build_tag") is not None:
+            avail["sha"] = tags[avail["build_tag"]]
+
+        return avail, highest, False, entry
+
+    tag_avail = {}
+    highest_overall = -1
+    all_released = True
+    missing_repos = False
+    repos = Component.get_components_of_type("git")
+    new_tag_index = {}
+    for repo, (avail, highest, missing, entry) in zip(
+        repos, parallel_per_repo(check_repo, repos)
+    ):
+        tag_avail[repo.git()] = avail
+        if entry is not None:
+            new_tag_index[repo.git()] = entry
+        if avail.get("already_released") is False:
+            all_released = False
+        if highest > highest_overall:
+            highest_overall = highest
+        if missing:
+            missing_repos = True
+    if new_tag_index != tag_index:
+        update_state(state, ["tag_index"], new_tag_index)
 
     if highest_overall > 0:
         tag_avail["image_tag"] = "mender-%s-build%d" % (
@@ -1538,32 +2615,38 @@ def tag_and_push(state, tag_avail, next_tag_avail, final):
     # Prepare Git tag and push commands.
     git_tag_list = []
     git_push_list = []
-    for repo in Component.get_components_of_type("git"):
-        if not next_tag_avail[repo.git()]["already_released"]:
-            git_tag_list.append(
-                (
-                    state,
-                    repo.git(),
-                    [
-                        "tag",
-                        "-a",
-                        "-m",
-                        annotation_version(repo, next_tag_avail),
-                        next_tag_avail[repo.git()]["build_tag"],
-                        next_tag_avail[repo.git()]["sha"],
-                    ],
-                )
+    repos = [
+        repo
+        for repo in Component.get_components_of_type("git")
+        if not next_tag_avail[repo.git()]["already_released"]
+    ]
+    remotes = parallel_per_repo(
+        lambda repo: find_upstream_remote(state, repo.git()), repos
+    )
+    for repo, remote in zip(repos, remotes):
+        git_tag_list.append(
+            (
+                state,
+                repo.git(),
+                [
+                    "tag",
+                    "-a",
+                    "-m",
+                    annotation_version(repo, next_tag_avail),
+                    next_tag_avail[repo.git()]["build_tag"],
+                    next_tag_avail[repo.git()]["sha"],
+                ],
             )
-            remote = find_upstream_remote(state, repo.git())
-            git_push_list.append(
-                (
-                    state,
-                    repo.git(),
-                    ["push", remote, next_tag_avail[repo.git()]["build_tag"]],
-                )
+        )
+        git_push_list.append(
+            (
+                state,
+                repo.git(),
+                ["push", remote, next_tag_avail[repo.git()]["build_tag"]],
             )
+        )
 
-    if not query_execute_git_list(git_tag_list + git_push_list):
+    if not query_execute_git_list(git_tag_list + git_push_list, parallel=True):
         return tag_avail
 
     # If this was the final tag, reflect that in our data.
@@ -1596,7 +2679,7 @@ def get_extra_buildparams_from_yaml():
     reply = requests.get(
         "https://raw.githubusercontent.com/mendersoftware/mender-qa/master/.gitlab-ci.yml"
     )
-    build_variables = yaml.safe_load(reply.content.decode()).get("variables")
+    build_variables = yaml_safe_load(reply.content.decode()).get("variables")
     assert isinstance(build_variables, dict)
 
     # Add all fetched parameters that are not part of our versioned repositories
@@ -1708,10 +2791,10 @@ DR = Disable automatic publishing of the release
                 editor = os.environ.get("EDITOR")
             else:
                 editor = "vi"
+            save_state(state)
             subprocess.call("%s %s" % (editor, RELEASE_TOOL_STATE), shell=True)
-            with open(RELEASE_TOOL_STATE) as fd:
-                state.clear()
-                state.update(yaml.safe_load(fd))
+            state.clear()
+            state.update(load_state())
             # Trigger update of parameters from disk.
             params = None
 
@@ -1823,6 +2906,47 @@ def trigger_gitlab_build(params, extra_buildparams):
         traceback.print_exc()
 
 
+# Names of the license files license-overview-generator looks for, anywhere in
+# a repository.
+LICENSE_FILE_NAMES = ["LICENSE", "LICENCE", "LICENSE.txt", "LICENSE.md", "COPYING"]
+
+
+def license_scan_paths(state, repo_git, ref):
+    """Return the sparse checkout patterns of the files license-overview-generator
+    reads from repo_git at ref: the license files, LIC_FILES_CHKSUM.sha256 and
+    the files listed in it, and one Go file, which tells Go repositories
+    apart."""
+
+    def pattern(path):
+        return "/" + re.sub(r"([\\*?\[\]!# ])", r"\\\1", path)
+
+    paths = [
+        path
+        for path in execute_git(
+            state, repo_git, ["ls-tree", "-r", "-z", "--name-only", ref], capture=True
+        ).split("\0")
+        if path
+    ]
+    patterns = [
+        pattern(path)
+        for path in paths
+        if os.path.basename(path) in LICENSE_FILE_NAMES
+        or path == "LIC_FILES_CHKSUM.sha256"
+    ]
+    go_files = [path for path in paths if path.endswith(".go")]
+    if go_files:
+        patterns.append(pattern(go_files[0]))
+    if "LIC_FILES_CHKSUM.sha256" in paths:
+        chksums = execute_git(
+            state, repo_git, ["show", ref + ":LIC_FILES_CHKSUM.sha256"], capture=True
+        )
+        for line in chksums.split("\n"):
+            entries = line.split()
+            if len(entries) == 2 and not entries[0].startswith("#"):
+                patterns.append(pattern(entries[1]))
+    return patterns
+
+
 def do_license_generation(state, tag_avail):
     print("Setting up temporary Git workspace...")
 
@@ -1832,16 +2956,30 @@ def do_license_generation(state, tag_avail):
         else:
             return tag_avail[repo_git]["build_tag"]
 
-    tmpdirs = []
-    for repo in Component.get_components_of_type("git", only_release=True):
-        tmpdirs.append(
-            setup_temp_git_checkout(
-                state, repo.git(), tag_or_followed_branch(repo.git())
-            )
-        )
-    for repo in Component.get_components_of_type("git", only_non_release=True):
-        remote = find_upstream_remote(state, repo.git())
-        tmpdirs.append(setup_temp_git_checkout(state, repo.git(), remote + "/master"))
+    def setup_checkout(repo_and_release):
+        repo, release = repo_and_release
+        if release:
+            ref = tag_or_followed_branch(repo.git())
+        else:
+            ref = find_upstream_remote(state, repo.git()) + "/master"
+        if repo.git() == "gui":
+            # The whole GUI is needed, to build the image with its disclaimer.
+            sparse_paths = None
+        else:
+            sparse_paths = license_scan_paths(state, repo.git(), ref)
+        return setup_temp_git_checkout(state, repo.git(), ref, sparse_paths)
+
+    tmpdirs = parallel_per_repo(
+        setup_checkout,
+        [
+            (repo, True)
+            for repo in Component.get_components_of_type("git", only_release=True)
+        ]
+        + [
+            (repo, False)
+            for repo in Component.get_components_of_type("git", only_non_release=True)
+        ],
+    )
 
     try:
         with open("generated-license-text.txt", "w") as fd:
@@ -1974,8 +3112,8 @@ def purge_build_tags(state, tag_avail):
     upstream as well."""
 
     print("Checking which remote tags need to be purged...")
-    git_list = []
-    for repo in Component.get_components_of_type("git"):
+
+    def remote_build_tags(repo):
         remote = find_upstream_remote(state, repo.git())
         remote_tag_list = [
             re.match(r".*refs/tags/(.*)", line).group(1)
@@ -1990,6 +3128,13 @@ def purge_build_tags(state, tag_avail):
                 "^%s-build[0-9]+$" % re.escape(state[repo.git()]["version"]), tag
             ):
                 to_purge.append(tag)
+        return remote, to_purge
+
+    repos = Component.get_components_of_type("git")
+    git_list = []
+    for repo, (remote, to_purge) in zip(
+        repos, parallel_per_repo(remote_build_tags, repos)
+    ):
         if len(to_purge) > 0:
             git_list.append(
                 (
@@ -2000,7 +3145,7 @@ def purge_build_tags(state, tag_avail):
             )
             git_list.append((state, repo.git(), ["tag", "-d"] + to_purge))
 
-    query_execute_git_list(git_list)
+    query_execute_git_list(git_list, parallel=True)
 
 
 def find_default_following_branch(state, repo, version):
@@ -2081,6 +3226,217 @@ def merge_release_tag(state, tag_avail, repo):
         cleanup_temp_git_checkout(tmpdir)
 
 
+# Manifest media types the registry is asked for when retagging. Manifest lists
+# and OCI indexes are copied as they are, since the manifests they point to are
+# already in the repository.
+REGISTRY_MANIFEST_TYPES = [
+    "application/vnd.docker.distribution.manifest.list.v2+json",
+    "application/vnd.docker.distribution.manifest.v2+json",
+    "application/vnd.oci.image.index.v1+json",
+    "application/vnd.oci.image.manifest.v1+json",
+]
+
+
+def parse_image_name(image):
+    """Split "[registry/]repository:tag" into (registry, repository, tag), with
+    the same defaults as Docker for Docker Hub images."""
+
+    name, tag = image.rsplit(":", 1)
+    if "/" in tag:
+        raise Exception("Image name %s has no tag" % image)
+    parts = name.split("/", 1)
+    if len(parts) == 2 and (
+        "." in parts[0] or ":" in parts[0] or parts[0] == "localhost"
+    ):
+        registry, repository = parts
+    else:
+        registry, repository = "docker.io", name
+        if "/" not in repository:
+            repository = "library/" + repository
+    return registry, repository, tag
+
+
+def docker_credentials(registry):
+    """Return the (username, password) that `docker login` stored for the
+    registry, or None."""
+
+    config_dir = os.environ.get("DOCKER_CONFIG") or os.path.join(
+        os.path.expanduser("~"), ".docker"
+    )
+    try:
+        with open(os.path.join(config_dir, "config.json")) as fd:
+            config = json.load(fd)
+    except (OSError, ValueError):
+        return None
+
+    server = "https://index.docker.io/v1/" if registry == "docker.io" else registry
+    helper = config.get("credHelpers", {}).get(server) or config.get("credsStore")
+    if helper is not None:
+        try:
+            output = subprocess.check_output(
+                ["docker-credential-%s" % helper, "get"],
+                input=server.encode(),
+                stderr=subprocess.DEVNULL,
+            )
+            creds = json.loads(output)
+            return creds["Username"], creds["Secret"]
+        except (OSError, ValueError, KeyError, subprocess.CalledProcessError):
+            pass
+
+    auth = config.get("auths", {}).get(server, {}).get("auth")
+    if auth is None:
+        return None
+    username, password = base64.b64decode(auth).decode().split(":", 1)
+    return username, password
+
+
+class RegistryRetagger:
+    """Adds tags to images in their registry, through the Docker Registry HTTP
+    API V2: the manifest of the image is fetched and put back under the new
+    tag, byte for byte, so the digest stays the same and no layer is moved.
+
+    Authentication follows the challenge of the registry (token or basic),
+    with the credentials of `docker login`. Registries on localhost are
+    reached over plain HTTP, like a local registry:2 container."""
+
+    def __init__(self, insecure_registries=None):
+        try:
+            import requests
+        except ImportError:
+            print("requests module missing, try running 'sudo pip3 install requests'.")
+            sys.exit(2)
+
+        self.session = requests.Session()
+        self.insecure_registries = set(insecure_registries or [])
+        self._auth = {}
+
+    def _url(self, registry, repository, path):
+        host = registry.split(":")[0]
+        if registry in self.insecure_registries or host in ["localhost", "127.0.0.1"]:
+            scheme = "http"
+        else:
+            scheme = "https"
+        if registry == "docker.io":
+            registry = "registry-1.docker.io"
+        return "%s://%s/v2/%s/%s" % (scheme, registry, repository, path)
+
+    def _authenticate(self, registry, repository, challenge):
+        creds = docker_credentials(registry)
+        auth_type, _, params = challenge.partition(" ")
+        params = dict(re.findall(r'(\w+)="([^"]*)"', params))
+        if auth_type.lower() == "basic":
+            if creds is None:
+                raise Exception("No credentials for %s" % registry)
+            return "Basic " + base64.b64encode(("%s:%s" % creds).encode()).decode()
+
+        query = {"scope": "repository:%s:pull,push" % repository}
+        if "service" in params:
+            query["service"] = params["service"]
+        reply = self.session.get(params["realm"], params=query, auth=creds)
+        if reply.status_code != 200:
+            raise Exception(
+                "Cannot get a token for %s from %s: %d %s"
+                % (repository, params["realm"], reply.status_code, reply.text)
+            )
+        token = reply.json()
+        return "Bearer " + (token.get("token") or token["access_token"])
+
+    def _request(self, method, registry, repository, path, headers, data=None):
+        url = self._url(registry, repository, path)
+        key = (registry, repository)
+        if key in self._auth:
+            headers = dict(headers, Authorization=self._auth[key])
+        reply = self.session.request(method, url, headers=headers, data=data)
+        if reply.status_code == 401 and "WWW-Authenticate" in reply.headers:
+            self._auth[key] = self._authenticate(
+                registry, repository, reply.headers["WWW-Authenticate"]
+            )
+            headers = dict(headers, Authorization=self._auth[key])
+            reply = self.session.request(method, url, headers=headers, data=data)
+        return reply
+
+    def retag(self, source, target):
+        """Make the target image name point to the manifest of the source image
+        name; both must be in the same repository. Return True if the tag was
+        changed, False if it already pointed to that manifest."""
+
+        registry, repository, source_tag = parse_image_name(source)
+        target_registry, target_repository, target_tag = parse_image_name(target)
+        if (registry, repository) != (target_registry, target_repository):
+            raise Exception(
+                "Cannot retag %s as %s: not the same repository" % (source, target)
+            )
+        accept = {"Accept": ", ".join(REGISTRY_MANIFEST_TYPES)}
+
+        reply = self._request(
+            "GET", registry, repository, "manifests/" + source_tag, accept
+        )
+        if reply.status_code != 200:
+            raise Exception(
+                "Cannot get manifest of %s: %d %s"
+                % (source, reply.status_code, reply.text)
+            )
+        manifest = reply.content
+        content_type = reply.headers["Content-Type"]
+        digest = reply.headers.get("Docker-Content-Digest")
+
+        reply = self._request(
+            "HEAD", registry, repository, "manifests/" + target_tag, accept
+        )
+        if (
+            reply.status_code == 200
+            and digest is not None
+            and reply.headers.get("Docker-Content-Digest") == digest
+        ):
+            return False
+
+        reply = self._request(
+            "PUT",
+            registry,
+            repository,
+            "manifests/" + target_tag,
+            {"Content-Type": content_type},
+            data=manifest,
+        )
+        if reply.status_code != 201:
+            raise Exception(
+                "Cannot put manifest of %s as %s: %d %s"
+                % (source, target, reply.status_code, reply.text)
+            )
+        return True
+
+
+def query_retag_list(retag_list):
+    """Retags images in their registry after asking first (see
+    RegistryRetagger). The argument is a list of (source, target) image name
+    pairs, which are processed in parallel.
+
+    Push simulation and dry run are applied if those are enabled."""
+
+    print_line()
+    for source, target in retag_list:
+        print("%s -> %s" % (source, target))
+    reply = ask("\nOk to retag the above images? ")
+    if not reply.startswith("Y") and not reply.startswith("y"):
+        return False
+
+    if not PUSH or DRY_RUN:
+        for source, target in retag_list:
+            print("Would have retagged: %s -> %s" % (source, target))
+        return True
+
+    retagger = RegistryRetagger()
+
+    def retag(pair):
+        if retagger.retag(*pair):
+            print("Retagged: %s -> %s" % pair)
+        else:
+            print("Already up to date: %s -> %s" % pair)
+
+    parallel_per_repo(retag, retag_list)
+    return True
+
+
 def push_latest_docker_tags(state, tag_avail):
     """Make all the Docker ":latest" tags point to the current release."""
 
@@ -2114,7 +3470,7 @@ def push_latest_docker_tags(state, tag_avail):
         if not reply.startswith("Y") and not reply.startswith("y"):
             continue
 
-        exec_list = []
+        retag_list = []
         for image in Component.get_components_of_type("docker_image"):
             # Even though the version is already in 'tip', this is for the
             # overall Mender version. We need the specific one for the
@@ -2161,30 +3517,14 @@ def push_latest_docker_tags(state, tag_avail):
             else:
                 build_tag = tag_avail["image_tag"]
 
-            exec_list.append(
-                [
-                    "docker",
-                    "pull",
-                    "%s/%s:%s" % (prefix, image.docker_image(), build_tag,),
-                ]
-            )
-            exec_list.append(
-                [
-                    "docker",
-                    "tag",
+            retag_list.append(
+                (
                     "%s/%s:%s" % (prefix, image.docker_image(), build_tag,),
                     "%s/%s:%s" % (prefix, image.docker_image(), new_version),
-                ]
-            )
-            exec_list.append(
-                [
-                    "docker",
-                    "push",
-                    "%s/%s:%s" % (prefix, image.docker_image(), new_version),
-                ]
+                )
             )
 
-        query_execute_list(exec_list)
+        query_retag_list(retag_list)
 
 
 def create_release_branches(state, tag_avail):
@@ -2192,12 +3532,10 @@ def create_release_branches(state, tag_avail):
 
     any_repo_needs_branch = False
 
-    for repo in Component.get_components_of_type("git"):
-        if tag_avail[repo.git()]["already_released"]:
-            continue
-
+    def missing_branch_remote(repo):
+        """Return the upstream remote of repo if it lacks the followed branch,
+        None otherwise."""
         remote = find_upstream_remote(state, repo.git())
-
         try:
             execute_git(
                 state,
@@ -2206,7 +3544,18 @@ def create_release_branches(state, tag_avail):
                 capture=True,
                 capture_stderr=True,
             )
+            return None
         except subprocess.CalledProcessError:
+            return remote
+
+    # The checks run in parallel, the questions are asked afterwards, in order.
+    repos = [
+        repo
+        for repo in Component.get_components_of_type("git")
+        if not tag_avail[repo.git()]["already_released"]
+    ]
+    for repo, remote in zip(repos, parallel_per_repo(missing_branch_remote, repos)):
+        if remote is not None:
             any_repo_needs_branch = True
             print_line()
             reply = ask(
@@ -2365,10 +3714,7 @@ def do_build(args):
         print(
             "Fetching cached parameters from %s (delete to reset)." % RELEASE_TOOL_STATE
         )
-        with open(RELEASE_TOOL_STATE) as fd:
-            state = yaml.safe_load(fd)
-    else:
-        state = {}
+    state = load_state()
 
     if state_value(state, ["repo_dir"]) is None:
         repo_dir = os.path.normpath(os.path.join(integration_dir(), ".."))
@@ -2716,14 +4062,13 @@ def do_release(release_state_file):
     # Fill the state data.
     if new_release:
         state = {}
+        save_state(state)
     else:
         print("Loading existing release state data...")
         print(
             "Note that you can always edit or delete %s manually" % RELEASE_TOOL_STATE
         )
-        fd = open(RELEASE_TOOL_STATE)
-        state = yaml.safe_load(fd)
-        fd.close()
+        state = load_state()
 
     if state_value(state, ["repo_dir"]) is None:
         reply = ask("Which directory contains all the Git repositories? ")
@@ -2946,14 +4291,12 @@ def is_marked_as_releaseable_in_integration_version(
     integration_version, repo_git, repo_git_version
 ):
     try:
-        component_maps = execute_git(
-            None,
-            integration_dir(),
-            ["show", "%s:component-maps.yml" % integration_version],
-            capture=True,
-            capture_stderr=True,
+        component_maps = get_component_maps_for_rev(
+            integration_dir(), integration_version
         )
-    except subprocess.CalledProcessError:
+    except Exception:
+        component_maps = None
+    if component_maps is None:
         # No component-maps.yml found.
         if integration_version == "master":
             # For master branch, we should require that the maps are found, so
@@ -2978,10 +4321,98 @@ def is_marked_as_releaseable_in_integration_version(
     # When we have the component-maps.yml data from the given integration
     # version, do a lookup.
     comp = Component.get_component_of_type("git", repo_git)
-    comp.set_custom_component_maps(yaml.safe_load(component_maps))
+    comp.set_custom_component_maps(component_maps)
     return comp.is_release_component()
 
 
+def integration_version_summary(git_dir, candidate, sha):
+    """Return what --integration-versions-including needs to know about an
+    integration version, for any component:
+    {
+        "versions": {image_name: version},
+        "release_components": {git_repo: bool}, or None without component-maps.yml
+    }
+    The summaries are kept in the query cache (see query_cache_dir), keyed by
+    the commit and the name of the version, which matters for legacy tags
+    (see version_specific_docker_compose_data_patching)."""
+
+    summary = query_cache_get(
+        "integration-version-summary", _summary_key(candidate, sha)
+    )
+    if summary is not None:
+        return summary
+
+    versions = {}
+    # For pre 2.4.x releases git-versions.*.yml files do not exist hence the git
+    # listing would be missing the backend components. Fall back to the old
+    # "docker" versions for them.
+    for version_type in ["docker", "git"]:
+        data = get_docker_compose_data_for_rev(git_dir, candidate, version_type)
+        for image, info in data.items():
+            versions[image] = info["version"]
+
+    try:
+        component_maps = get_component_maps_for_rev(git_dir, candidate)
+    except Exception:
+        component_maps = None
+    if component_maps is None:
+        release_components = None
+    else:
+        release_components = {
+            name: info.get("release_component", False)
+            for name, info in component_maps.get("git", {}).items()
+        }
+
+    summary = {"versions": versions, "release_components": release_components}
+    query_cache_put(
+        "integration-version-summary", _summary_key(candidate, sha), summary
+    )
+    return summary
+
+
+def _summary_key(candidate, sha):
+    return "%s-%s" % (sha, re.sub(r"[^A-Za-z0-9._-]", "_", candidate))
+
+
+def _reset_after_fork():
+    # The cat-file processes of the parent can't be shared.
+    GitCatFile._instances = {}
+
+
+def integration_version_summaries(git_dir, candidates, jobs=None):
+    """Return integration_version_summary for each (name, sha) in candidates, in
+    the same order. Summaries which are not cached are computed by a pool of
+    `jobs` processes (default: the number of CPUs), since most of the time
+    goes into parsing YAML."""
+
+    summaries = [
+        query_cache_get("integration-version-summary", _summary_key(name, sha))
+        for name, sha in candidates
+    ]
+    missing = [i for i, summary in enumerate(summaries) if summary is None]
+
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    if jobs <= 1 or len(missing) <= 1:
+        for i in missing:
+            summaries[i] = integration_version_summary(git_dir, *candidates[i])
+        return summaries
+
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=min(jobs, len(missing)), initializer=_reset_after_fork
+    ) as pool:
+        computed = pool.map(
+            integration_version_summary,
+            [git_dir] * len(missing),
+            [candidates[i][0] for i in missing],
+            [candidates[i][1] for i in missing],
+            chunksize=4,
+        )
+        for i, summary in zip(missing, computed):
+            summaries[i] = summary
+    return summaries
+
+
 def do_integration_versions_including(args):
     if not args.version:
         print("--integration-versions-including requires --version argument")
@@ -3003,9 +4434,6 @@ def do_integration_versions_including(args):
     remote = find_upstream_remote(None, git_dir, "integration")
     # The below query will match all tags and the following branches: master, staging and releases (N.M.x)
     git_query = [
-        "for-each-ref",
-        "--format=%(refname:short)",
-        "--sort=-version:refname:short",
         "refs/tags/*",
         "refs/remotes/%s/master" % remote,
         "refs/remotes/%s/staging" % remote,
@@ -3018,42 +4446,46 @@ def do_integration_versions_including(args):
         git_query += ["refs/heads/**"]
     if args.feature_branches:
         git_query += ["refs/remotes/%s/feature-*" % remote]
-    output = execute_git(None, git_dir, git_query, capture=True)
     candidates = []
-    for line in output.strip().split("\n"):
+    for refname, sha, peeled in for_each_ref(
+        None, git_dir, git_query, sort="-version:refname:short"
+    ):
+        name = short_ref_name(refname)
         # Filter out build tags.
-        if re.search("-build", line):
+        if re.search("-build", name):
             continue
 
-        candidates.append(line)
+        # The commit, peeled for annotated tags, is used as cache key.
+        candidates.append((name, peeled or sha))
 
     image = repo.associated_components_of_type("git")[0].git()
 
     # Now look at each docker compose file in each branch, and figure out which
     # ones contain the version of the service we are querying.
+    summaries = integration_version_summaries(git_dir, candidates)
     matches = []
-    for candidate in candidates:
-        data = get_docker_compose_data_for_rev(git_dir, candidate, version="git")
-        # For pre 2.4.x releases git-versions.*.yml files do not exist hence this listing
-        # would be missing the backend components. Try loading the old "docker" versions.
-        if data.get(image) is None:
-            data = get_docker_compose_data_for_rev(git_dir, candidate, version="docker")
-        try:
-            version = data[image]["version"]
-        except KeyError:
+    for (candidate, _), summary in zip(candidates, summaries):
+        version = summary["versions"].get(image)
+        if version is None:
             # Key image doesn't exist because the version is from before
             # that component existed.
             # Not a match.
             continue
 
-        try:
-            if not is_marked_as_releaseable_in_integration_version(
-                candidate, repo.git(), args.version
-            ):
+        release_components = summary["release_components"]
+        if release_components is None:
+            # No component-maps.yml found, see
+            # is_marked_as_releaseable_in_integration_version.
+            if candidate == "master":
+                raise Exception(
+                    "Could not find component-maps.yml at expected location in master branch. Please fix!"
+                )
+            if args.version == "master":
                 continue
-        except KeyError:
-            # Key repo.git() doesn't exist (but Docker component existed). This
-            # can happen when several git repos contribute to one Docker image.
+        elif not release_components.get(repo.git(), False):
+            # Either not a release component, or repo.git() doesn't exist (but
+            # Docker component existed). This can happen when several git repos
+            # contribute to one Docker image.
             # Not a match.
             continue
 
@@ -3118,8 +4550,11 @@ def get_next_hosted_release_version(state):
 
     highest = -1
     for repo in Component.get_components_of_type("git"):
-        tags = execute_git(state, repo.git(), ["tag"], capture=True)
-        for tag in tags.split("\n"):
+        tags = [
+            short_ref_name(refname)
+            for refname, _, _ in for_each_ref(state, repo.git(), ["refs/tags"])
+        ]
+        for tag in tags:
             match = re.match(r"^%s(?:\.([0-9]{2}))?$" % re.escape(version), tag)
             if match is not None:
                 if match.group(1) is None:
@@ -3239,49 +4674,57 @@ def is_repo_on_known_branch(path):
 
     remote = find_upstream_remote(None, path)
 
-    branches = execute_git(
-        None,
-        path,
-        [
-            "for-each-ref",
-            "--format=%(refname:short)",
-            "--points-at",
-            "HEAD",
-            "refs/remotes/%s/*" % remote,
-            "refs/tags/*",
-        ],
-        capture=True,
-    ).split()
+    refs = for_each_ref(
+        None, path, ["refs/remotes/%s/*" % remote, "refs/tags/*"], points_at="HEAD"
+    )
+    branches = [short_ref_name(refname) for refname, _, _ in refs]
     return any(
         [re.search(r"([0-9]+\.[0-9]+\.[0-9x]+|master)$", branch) for branch in branches]
     )
 
 
-def select_test_suite():
-    """Check what backend components are checked out in custom revisions and decide
-    which integration test suite should be ran - 'open', 'enterprise' or both.
-    To be used when running integration tests to see which components 'triggered' the build
-    (i.e. changed, for lack of a better word - could be just 1 service with a checked out PR, or multiple -
-    in case of manually parametrized builds).
-    Rules:
-    - open services, without closed versions, should trigger both setup test runs
-    - open services with closed versions should trigger the 'open' test suite
-    - enterprise services can run just the 'enterprise' setup
-    """
+def scan_release_repos():
+    """Return {component name: (path, whether it is on a known branch)} for all
+    the release git components, which are looked for next to the integration
+    repository. The repositories are checked in parallel."""
+
     # check all known git components for custom revisions
     # answers the question what we're actually building
     paths = ["..", "../go/src/github.com/mendersoftware"]
 
-    built_components = set({})
-    for repo in Component.get_components_of_type("git", only_release=True):
+    def scan(repo):
         path = find_repo_path(repo.git(), paths)
         if path is None:
             raise RuntimeError(
                 "cannot find repo {} in any of {}".format(repo.git(), paths)
             )
+        return path, is_repo_on_known_branch(path)
+
+    repos = Component.get_components_of_type("git", only_release=True)
+    results = parallel_per_repo(scan, repos)
+    return {repo.name: result for repo, result in zip(repos, results)}
+
+
+def select_test_suite(built_components=None):
+    """Check what backend components are checked out in custom revisions and decide
+    which integration test suite should be ran - 'open', 'enterprise' or both.
+    To be used when running integration tests to see which components 'triggered' the build
+    (i.e. changed, for lack of a better word - could be just 1 service with a checked out PR, or multiple -
+    in case of manually parametrized builds).
+    Rules:
+    - open services, without closed versions, should trigger both setup test runs
+    - open services with closed versions should trigger the 'open' test suite
+    - enterprise services can run just the 'enterprise' setup
 
-        if not is_repo_on_known_branch(path):
-            built_components.add(repo.name)
+    built_components are the names of the components not on a known branch,
+    default is to scan the repositories for them (see scan_release_repos).
+    """
+    if built_components is None:
+        built_components = {
+            name
+            for name, (_, on_known_branch) in scan_release_repos().items()
+            if not on_known_branch
+        }
 
     # seems like we're building plain master of everything - run all tests
     if len(built_components) == 0:
@@ -3313,13 +4756,158 @@ def select_test_suite():
         return "all"
 
 
-def do_select_test_suite():
+def do_select_test_suite(args):
     """Process --select-test-suite argument."""
 
-    print(select_test_suite())
+    if not args.json:
+        print(select_test_suite())
+        return
+
+    started = time.monotonic()
+    repos = scan_release_repos()
+    scan_seconds = time.monotonic() - started
+    built_components = {
+        name for name, (_, on_known_branch) in repos.items() if not on_known_branch
+    }
+    print(
+        json.dumps(
+            {
+                "suite": select_test_suite(built_components),
+                # The components checked out in custom revisions.
+                "triggered_by": sorted(built_components),
+                "repos": {
+                    name: {"path": path, "on_known_branch": on_known_branch}
+                    for name, (path, on_known_branch) in repos.items()
+                },
+                "scan_seconds": round(scan_seconds, 3),
+            },
+            indent=2,
+            sort_keys=True,
+        )
+    )
+
+
+class NotAQueryError(Exception):
+    """Raised by main(queries_only=True) for arguments which do more than
+    querying."""
+
+
+class _QueryServerHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            response = serve_query(line, self.server.integration_dir)
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+            self.wfile.flush()
+
+
+def serve_query(request_line, served_integration_dir):
+    """Handle a JSON-RPC 2.0 request of the query server, and return the
+    response. The only method is "run", with params {"argv": [...],
+    "integration_dir": ...}, which runs main(argv) and returns {"exit_code",
+    "stdout", "stderr"}. The integration directory must be the served one."""
+
+    try:
+        request = json.loads(request_line)
+    except ValueError:
+        return {
+            "jsonrpc": "2.0",
+            "id": None,
+            "error": {"code": -32700, "message": "Parse error"},
+        }
+    response = {"jsonrpc": "2.0", "id": request.get("id")}
+    params = request.get("params") or {}
+    if request.get("method") != "run":
+        response["error"] = {"code": -32601, "message": "Method not found"}
+        return response
+    if params.get("integration_dir") != served_integration_dir:
+        response["error"] = {
+            "code": -32602,
+            "message": "Serving %s, not %s"
+            % (served_integration_dir, params.get("integration_dir")),
+        }
+        return response
+
+    global PUSH, DRY_RUN, GIT_JOBS
+    settings = (PUSH, DRY_RUN, GIT_JOBS)
+    # Start from the state of a fresh invocation: main() only sets what the
+    # arguments ask for. The working tree maps are reloaded from their cache.
+    Component._integration_version = None
+    Component.COMPONENT_MAPS = None
+    stdout = io.StringIO()
+    stderr = io.StringIO()
+    exit_code = 0
+    try:
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            main(params.get("argv", []), queries_only=True)
+    except NotAQueryError as ex:
+        response["error"] = {"code": -32602, "message": str(ex)}
+        return response
+    except SystemExit as ex:
+        if isinstance(ex.code, str):
+            stderr.write(ex.code + "\n")
+            exit_code = 1
+        else:
+            exit_code = ex.code or 0
+    except Exception:
+        stderr.write(traceback.format_exc())
+        exit_code = 1
+    finally:
+        PUSH, DRY_RUN, GIT_JOBS = settings
+    response["result"] = {
+        "exit_code": exit_code,
+        "stdout": stdout.getvalue(),
+        "stderr": stderr.getvalue(),
+    }
+    return response
+
+
+def do_server(socket_path):
+    """Process --server argument: answer queries on a Unix socket, keeping
+    component maps, docker-compose data and Git object readers in memory
+    between them. Requests are handled one at a time."""
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    server = socketserver.UnixStreamServer(socket_path, _QueryServerHandler)
+    server.integration_dir = integration_dir()
+    print("Serving queries for %s on %s" % (integration_dir(), socket_path))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(socket_path)
+
+
+def run_on_server(socket_path, argv):
+    """Run the release tool with argv on the query server listening on
+    socket_path, and print its output. Return the exit code, or None if the
+    server couldn't run it (not running, serving another integration
+    repository, or argv is not a query)."""
+
+    request = {
+        "jsonrpc": "2.0",
+        "id": 1,
+        "method": "run",
+        "params": {"argv": argv, "integration_dir": integration_dir()},
+    }
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(socket_path)
+            sock.sendall(json.dumps(request).encode() + b"\n")
+            with sock.makefile("rb") as fd:
+                response = json.loads(fd.readline())
+    except (OSError, ValueError):
+        return None
+    if "result" not in response:
+        return None
+    sys.stdout.write(response["result"]["stdout"])
+    sys.stderr.write(response["result"]["stderr"])
+    return response["result"]["exit_code"]
 
 
-def main():
+def main(argv=None, queries_only=False):
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "-g",
@@ -3328,6 +4916,13 @@ def main():
         metavar="SERVICE",
         help="Get version of given service",
     )
+    parser.add_argument(
+        "--version-of-all",
+        action="store_true",
+        help="Print the versions of all the repositories as JSON. "
+        + "`--in-integration-version`, `--version-type`, `--all`, "
+        + "`--only-backend` and `--only-client` apply as for --version-of and --list",
+    )
     parser.add_argument(
         "-t",
         "--version-type",
@@ -3466,16 +5061,54 @@ def main():
         action="store_true",
         help="Based on checked out git revisions, decide which integration suite must run ('open', 'enterprise', 'all').",
     )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="With --select-test-suite, print the suite, the components which "
+        + "triggered it and how long the scan took as JSON",
+    )
     parser.add_argument(
         "-n", "--dry-run", action="store_true", help="Don't take any action at all"
     )
+    parser.add_argument(
+        "--git-jobs",
+        type=int,
+        help="How many repositories to run Git commands in at the same time "
+        + "during releases (default: 8)",
+    )
     parser.add_argument(
         "--generate-release-notes",
         action="store_true",
         help="Generate changelogs and statistics and put them in `release_notes_*.txt` files. "
         + "Use `--in-integration-version` argument to choose which integration range to generate notes for.",
     )
-    args = parser.parse_args()
+    parser.add_argument(
+        "--server",
+        metavar="SOCKET",
+        help="Answer queries (--version-of, --version-of-all, --list, --map-name, "
+        + "--integration-versions-including, --select-test-suite) on the Unix "
+        + "socket SOCKET. Other invocations run them there when RELEASE_TOOL_SERVER "
+        + "is set to the socket",
+    )
+    args = parser.parse_args(argv)
+
+    if queries_only and (
+        args.set_version_of is not None
+        or args.build
+        or args.release
+        or args.hosted_release
+        or args.generate_release_notes
+        or args.server is not None
+        or not (
+            args.version_of is not None
+            or args.version_of_all
+            or args.list is not None
+            or args.map_name
+            or args.integration_versions_including is not None
+            or args.select_test_suite
+        )
+    ):
+        raise NotAQueryError("Not a query: %s" % " ".join(argv))
 
     # Check conflicting options.
     operations = 0
@@ -3501,9 +5134,16 @@ def main():
     if args.dry_run:
         global DRY_RUN
         DRY_RUN = True
+    if args.git_jobs is not None:
+        global GIT_JOBS
+        GIT_JOBS = args.git_jobs
 
-    if args.version_of is not None:
+    if args.server is not None:
+        do_server(args.server)
+    elif args.version_of is not None:
         do_version_of(args)
+    elif args.version_of_all:
+        do_version_of_all(args)
     elif args.list is not None:
         do_list_repos(
             args,
@@ -3527,7 +5167,7 @@ def main():
     elif args.hosted_release:
         do_hosted_release(args.version)
     elif args.select_test_suite:
-        do_select_test_suite()
+        do_select_test_suite(args)
     elif args.generate_release_notes:
         if not args.in_integration_version:
             raise Exception(
@@ -3542,4 +5182,8 @@ def main():
 
 
 if __name__ == "__main__":
+    if os.environ.get("RELEASE_TOOL_SERVER") and "--server" not in sys.argv:
+        exit_code = run_on_server(os.environ["RELEASE_TOOL_SERVER"], sys.argv[1:])
+        if exit_code is not None:
+            sys.exit(exit_code)
     main()
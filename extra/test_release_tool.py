@@ -12,16 +12,24 @@
 #    See the License for the specific language governing permissions and
 #    limitations under the License.
 
+import copy
+import hashlib
+import http.server
+import json
 import os
 import pathlib
 import re
 import shutil
+import socketserver
 import subprocess
 import sys
+import threading
+import time
 from unittest.mock import patch
 
 import pytest
 import yaml
+import release_tool
 from release_tool import Component, docker_compose_files_list, main
 from release_tool import git_to_buildparam
 
@@ -73,6 +81,56 @@ def is_master():
         return re.search("mendersoftware/gui:.*master", content)
 
 
+@pytest.fixture(autouse=True)
+def release_tool_cache(tmp_path, monkeypatch):
+    """Give each test its own, empty, query cache"""
+    cache_dir = tmp_path / "release-tool-cache"
+    monkeypatch.setenv("RELEASE_TOOL_CACHE_DIR", str(cache_dir))
+    release_tool.DOCKER_COMPOSE_DATA_CACHE.clear()
+    release_tool.COMPONENT_MAPS_CACHE.clear()
+    yield cache_dir
+    release_tool.GitCatFile.close_all()
+
+
+def git_commit_files(git_dir, files, tag=None):
+    """Commit the given {filename: content} files to the Git repository in
+    git_dir, creating it if needed, and optionally tag the commit"""
+    if not os.path.exists(os.path.join(git_dir, ".git")):
+        subprocess.check_call(["git", "init", "-q", git_dir])
+    for filename, content in files.items():
+        with open(os.path.join(git_dir, filename), "w") as fd:
+            fd.write(content)
+    subprocess.check_call(["git", "add", "."], cwd=git_dir)
+    subprocess.check_call(
+        [
+            "git",
+            "-c",
+            "user.name=test",
+            "-c",
+            "user.email=test@example.com",
+            "commit",
+            "-q",
+            "-m",
+            "commit",
+        ],
+        cwd=git_dir,
+    )
+    if tag is not None:
+        subprocess.check_call(["git", "tag", tag], cwd=git_dir)
+
+
+def git_versions_yml(versions):
+    """A git-versions.yml with the given {repo: version} images"""
+    return yaml.dump(
+        {
+            "services": {
+                "mender-%s" % repo: {"image": "mendersoftware/%s:%s" % (repo, version)}
+                for repo, version in versions.items()
+            }
+        }
+    )
+
+
 def run_main_assert_result(capsys, args, expect=None):
     testargs = [RELEASE_TOOL] + args
     with patch.object(sys, "argv", testargs):
@@ -690,6 +748,762 @@ def test_integration_versions_including(capsys):
     assert versions[0].endswith("/master")
 
 
+def test_versions_of(capsys):
+    with patch.object(sys, "argv", [RELEASE_TOOL]):
+        Component.set_integration_version(None)
+        repos = Component.get_components_of_type("git", only_release=False)
+        expected = {}
+        for repo in repos:
+            try:
+                expected[repo.name] = release_tool.version_of(INTEGRATION_DIR, repo)
+            except KeyError:
+                expected[repo.name] = None
+
+        # The docker-compose files are read once for all the repositories.
+        with patch(
+            "release_tool.get_docker_compose_data",
+            wraps=release_tool.get_docker_compose_data,
+        ) as get_docker_compose_data:
+            assert release_tool.versions_of(INTEGRATION_DIR, repos) == expected
+        assert get_docker_compose_data.call_count == 1
+
+        main(["--version-of-all", "--all"])
+    assert json.loads(capsys.readouterr().out) == {"repos": expected}
+
+
+def test_docker_compose_data_for_rev_cache(tmp_path, release_tool_cache):
+    git_dir = str(tmp_path / "integration")
+    git_commit_files(
+        git_dir,
+        {"git-versions.yml": git_versions_yml({"deployments": "4.0.0"})},
+        "1.0.0",
+    )
+    git_commit_files(
+        git_dir, {"git-versions.yml": git_versions_yml({"deployments": "4.1.0"})}
+    )
+
+    data = release_tool.get_docker_compose_data_for_rev(git_dir, "1.0.0")
+    assert data["deployments"]["version"] == "4.0.0"
+    data = release_tool.get_docker_compose_data_for_rev(git_dir, "HEAD")
+    assert data["deployments"]["version"] == "4.1.0"
+
+    # One entry per commit, which is used instead of the repository from then on.
+    sha = subprocess.check_output(
+        ["git", "rev-parse", "1.0.0"], cwd=git_dir, text=True
+    ).strip()
+    cache_file = release_tool_cache / "v1" / "docker-compose-data" / f"{sha}-git.json"
+    assert len(os.listdir(cache_file.parent)) == 2
+    with open(cache_file, "w") as fd:
+        fd.write('{"deployments": {"version": "cached"}}')
+    release_tool.DOCKER_COMPOSE_DATA_CACHE.clear()
+    data = release_tool.get_docker_compose_data_for_rev(git_dir, "1.0.0")
+    assert data["deployments"]["version"] == "cached"
+
+    # A moved ref is resolved to its new commit.
+    git_commit_files(
+        git_dir, {"git-versions.yml": git_versions_yml({"deployments": "4.2.0"})}
+    )
+    data = release_tool.get_docker_compose_data_for_rev(git_dir, "HEAD")
+    assert data["deployments"]["version"] == "4.2.0"
+
+
+def test_git_cat_file(tmp_path):
+    git_dir = str(tmp_path / "repo")
+    git_commit_files(git_dir, {"a.yml": "a: 1\n", "b.txt": "b"}, "1.0.0")
+    git_commit_files(git_dir, {"a.yml": "a: 2\n"})
+
+    cat_file = release_tool.GitCatFile.of(git_dir)
+    assert release_tool.GitCatFile.of(git_dir) is cat_file
+    assert sorted(cat_file.ls_tree("1.0.0")) == ["a.yml", "b.txt"]
+    assert cat_file.show("1.0.0", "a.yml") == "a: 1\n"
+    assert cat_file.show("HEAD", "a.yml") == "a: 2\n"
+    assert cat_file.show("HEAD", "missing.yml") is None
+    assert cat_file.show("HEAD", "missing file.yml") is None
+    assert cat_file.show("HEAD", "a.yml") == "a: 2\n"
+    assert cat_file.rev_parse("no-such-ref") is None
+    assert (
+        cat_file.rev_parse("HEAD^{commit}")
+        == subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=git_dir, text=True
+        ).strip()
+    )
+
+
+def test_closest_ref_to_head(tmp_path, release_tool_cache):
+    git_dir = str(tmp_path / "repo")
+    git_commit_files(git_dir, {"a": "1"}, "1.0.0")
+    git_commit_files(git_dir, {"a": "2"})
+    subprocess.check_call(
+        [
+            "git",
+            "-c",
+            "user.name=test",
+            "-c",
+            "user.email=test@example.com",
+            "tag",
+            "-a",
+            "-m",
+            "1.1.0",
+            "1.1.0",
+        ],
+        cwd=git_dir,
+    )
+    subprocess.check_call(
+        ["git", "checkout", "-q", "-b", "1.0.x", "1.0.0"], cwd=git_dir
+    )
+    git_commit_files(git_dir, {"a": "3"})
+    git_commit_files(git_dir, {"a": "4"})
+    # Pull requests are not candidates.
+    subprocess.check_call(
+        ["git", "update-ref", "refs/remotes/origin/pr/1", "HEAD"], cwd=git_dir
+    )
+    subprocess.check_call(["git", "checkout", "-q", "HEAD~1"], cwd=git_dir)
+
+    # HEAD is part of 1.0.x, while 1.0.0 and 1.1.0 are one commit behind.
+    assert release_tool.closest_ref_to_head(git_dir) == "1.0.x"
+    assert os.listdir(str(release_tool_cache / "v1" / "closest-ref"))
+
+    # Ties are broken by name: 1.1.0 and the first branch are both at HEAD.
+    subprocess.check_call(["git", "checkout", "-q", "1.1.0"], cwd=git_dir)
+    assert release_tool.closest_ref_to_head(git_dir) == "1.1.0"
+
+    subprocess.check_call(["git", "checkout", "-q", "1.0.0"], cwd=git_dir)
+    assert release_tool.closest_ref_to_head(git_dir) == "1.0.0"
+
+
+def test_git_refs(tmp_path, monkeypatch):
+    git_dir = str(tmp_path / "repo")
+    git = ["git", "-c", "user.name=test", "-c", "user.email=test@example.com"]
+    git_commit_files(git_dir, {"a": "1"}, "1.0.0")
+    subprocess.check_call(git + ["tag", "-a", "-m", "1.1.0", "1.1.0"], cwd=git_dir)
+    subprocess.check_call(["git", "branch", "1.0.x"], cwd=git_dir)
+    subprocess.check_call(
+        ["git", "remote", "add", "origin", "git@github.com:mendersoftware/repo.git"],
+        cwd=git_dir,
+    )
+    subprocess.check_call(
+        ["git", "update-ref", "refs/remotes/origin/master", "HEAD"], cwd=git_dir
+    )
+    subprocess.check_call(["git", "gc", "-q"], cwd=git_dir)
+    git_commit_files(git_dir, {"a": "2"})
+    # A loose ref to a packed tag object, and a loose one to a loose object.
+    subprocess.check_call(git + ["tag", "-a", "-m", "1.10.0", "1.10.0"], cwd=git_dir)
+    subprocess.check_call(["git", "repack", "-a", "-d", "-q"], cwd=git_dir)
+    subprocess.check_call(git + ["tag", "-a", "-m", "1.9.0", "1.9.0"], cwd=git_dir)
+    subprocess.check_call(["git", "tag", "1.9.0b1", "1.0.0"], cwd=git_dir)
+    subprocess.check_call(
+        ["git", "update-ref", "refs/remotes/origin/1.0.x", "1.0.0"], cwd=git_dir
+    )
+
+    queries = [
+        (["refs/tags/*", "refs/remotes/origin/*", "refs/heads/**"], None),
+        (["refs/tags/1.[0-9].*", "refs/remotes"], None),
+        (["refs/tags", "refs/remotes/origin/*"], "HEAD"),
+        (["refs/tags", "refs/remotes/origin/*"], "1.0.0"),
+    ]
+    # Git for-each-ref is used by default.
+    monkeypatch.delenv("RELEASE_TOOL_IN_PROCESS_REFS", raising=False)
+    assert release_tool.GitRefs.of(git_dir) is None
+    expected = [
+        release_tool.for_each_ref(None, git_dir, patterns, points_at)
+        for patterns, points_at in queries
+    ]
+    config = release_tool.execute_git(None, git_dir, ["config", "-l"], capture=True)
+    refs = {refname: (sha, peeled) for refname, sha, peeled in expected[0]}
+    assert refs["refs/tags/1.1.0"][1] == refs["refs/heads/1.0.x"][0]
+    assert refs["refs/tags/1.0.0"] == (refs["refs/heads/1.0.x"][0], None)
+
+    # No for-each-ref involved, except for resolving "1.0.0".
+    monkeypatch.setenv("RELEASE_TOOL_IN_PROCESS_REFS", "1")
+    with patch.object(release_tool, "execute_git", side_effect=AssertionError):
+        for (patterns, points_at), refs in zip(queries[:3], expected):
+            assert release_tool.for_each_ref(None, git_dir, patterns, points_at) == refs
+    assert release_tool.for_each_ref(None, git_dir, *queries[3]) == expected[3]
+
+    # Git is asked when the files can't be read.
+    with patch.object(release_tool.GitRefs, "refs", side_effect=ValueError):
+        assert release_tool.for_each_ref(None, git_dir, *queries[0]) == expected[0]
+
+    git_refs = release_tool.GitRefs.of(git_dir)
+    assert git_refs.config_list() == [
+        line for line in config.split("\n") if line in git_refs.config_list()
+    ]
+    assert release_tool.find_upstream_remote(None, git_dir, "repo") == "origin"
+    # Relative paths are in state["repo_dir"], whatever the current directory.
+    os.mkdir(str(tmp_path / "elsewhere"))
+    monkeypatch.chdir(str(tmp_path / "elsewhere"))
+    with patch.object(release_tool, "execute_git", side_effect=AssertionError):
+        state = {"repo_dir": str(tmp_path)}
+        assert release_tool.find_upstream_remote(state, "repo") == "origin"
+    # And cached under their resolved path.
+    cached_paths = [key[0] for key in release_tool._upstream_remotes]
+    assert git_dir in cached_paths
+    assert str(tmp_path / "elsewhere" / "repo") not in cached_paths
+
+    refs = release_tool.for_each_ref(
+        None, git_dir, ["refs/tags"], sort="-version:refname:short"
+    )
+    assert [release_tool.short_ref_name(refname) for refname, _, _ in refs] == [
+        "1.10.0",
+        "1.9.0b1",
+        "1.9.0",
+        "1.1.0",
+        "1.0.0",
+    ]
+
+
+def test_parallel_per_repo(tmp_path, capsys):
+    def work(n):
+        # Later items finish first.
+        time.sleep(0.05 * (3 - n))
+        print("item %d" % n)
+        return n * 2
+
+    assert release_tool.parallel_per_repo(work, range(3), jobs=3) == [0, 2, 4]
+    assert capsys.readouterr().out == "item 0\nitem 1\nitem 2\n"
+
+    def fail(n):
+        print("item %d" % n)
+        if n == 1:
+            raise ValueError("item %d failed" % n)
+
+    with pytest.raises(ValueError, match="item 1 failed"):
+        release_tool.parallel_per_repo(fail, range(3), jobs=2)
+    assert capsys.readouterr().out == "item 0\nitem 1\n"
+
+    # The output of Git goes to the buffer of the repository too.
+    git_dirs = []
+    for name in ["a", "b", "c"]:
+        git_dir = str(tmp_path / name)
+        git_commit_files(git_dir, {"file-%s" % name: name})
+        git_dirs.append(git_dir)
+    release_tool.parallel_per_repo(
+        lambda git_dir: release_tool.execute_git(None, git_dir, ["ls-files"]),
+        git_dirs,
+        jobs=3,
+    )
+    assert capsys.readouterr().out == "file-a\nfile-b\nfile-c\n"
+
+
+class RegistryStandIn(http.server.BaseHTTPRequestHandler):
+    """The manifest endpoints of a registry:2, behind token authentication"""
+
+    TOKEN = "stand-in-token"
+
+    # (repository, tag or digest): (content type, manifest)
+    manifests = {}
+
+    def _reply(self, status, content_type=None, body=b"", headers={}):
+        self.send_response(status)
+        if content_type is not None:
+            self.send_header("Content-Type", content_type)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _authorized(self):
+        if self.headers.get("Authorization") == "Bearer " + self.TOKEN:
+            return True
+        self._reply(
+            401,
+            headers={
+                "WWW-Authenticate": 'Bearer realm="http://%s/token",service="stand-in"'
+                % self.headers["Host"]
+            },
+        )
+        return False
+
+    def _manifest_path(self):
+        return re.match(r"^/v2/(.+)/manifests/([^/]+)$", self.path).groups()
+
+    def do_GET(self):
+        if self.path.startswith("/token?"):
+            self._reply(
+                200, "application/json", json.dumps({"token": self.TOKEN}).encode()
+            )
+            return
+        if not self._authorized():
+            return
+        manifest = self.manifests.get(self._manifest_path())
+        if manifest is None or manifest[0] not in self.headers.get("Accept", ""):
+            self._reply(404)
+            return
+        content_type, body = manifest
+        digest = "sha256:" + hashlib.sha256(body).hexdigest()
+        self._reply(200, content_type, body, {"Docker-Content-Digest": digest})
+
+    do_HEAD = do_GET
+
+    def do_PUT(self):
+        if not self._authorized():
+            return
+        repository, tag = self._manifest_path()
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        digest = "sha256:" + hashlib.sha256(body).hexdigest()
+        self.manifests[(repository, tag)] = (self.headers["Content-Type"], body)
+        self.manifests[(repository, digest)] = (self.headers["Content-Type"], body)
+        self._reply(201, headers={"Docker-Content-Digest": digest})
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def registry_stand_in(tmp_path, monkeypatch):
+    """Serve RegistryStandIn on localhost, and return its address"""
+    # No credentials from `docker login`.
+    monkeypatch.setenv("DOCKER_CONFIG", str(tmp_path / "docker-config"))
+    RegistryStandIn.manifests = {}
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), RegistryStandIn)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield "127.0.0.1:%d" % server.server_address[1]
+    server.shutdown()
+    thread.join()
+
+
+def test_parse_image_name():
+    assert release_tool.parse_image_name("mendersoftware/deployments:1.0") == (
+        "docker.io",
+        "mendersoftware/deployments",
+        "1.0",
+    )
+    assert release_tool.parse_image_name("alpine:3") == (
+        "docker.io",
+        "library/alpine",
+        "3",
+    )
+    assert release_tool.parse_image_name(
+        "registry.mender.io/mendersoftware/mender-gateway:mender-3.7"
+    ) == ("registry.mender.io", "mendersoftware/mender-gateway", "mender-3.7")
+    assert release_tool.parse_image_name("localhost:5000/deployments:latest") == (
+        "localhost:5000",
+        "deployments",
+        "latest",
+    )
+    with pytest.raises(Exception):
+        release_tool.parse_image_name("localhost:5000/deployments")
+
+
+def test_registry_retagger(registry_stand_in):
+    image_type = "application/vnd.docker.distribution.manifest.v2+json"
+    list_type = "application/vnd.docker.distribution.manifest.list.v2+json"
+    # Formatted in a way json.dumps wouldn't, to check that the manifest is
+    # copied as is.
+    image_manifest = b'{\n   "schemaVersion": 2,\n   "layers": []\n}'
+    list_manifest = b'{"schemaVersion":2,"manifests":[{"digest":"sha256:1"}]}'
+    RegistryStandIn.manifests = {
+        ("mendersoftware/deployments", "mender-3.7.0"): (image_type, image_manifest),
+        ("mendersoftware/mender-client-qemu", "4.0.0"): (list_type, list_manifest),
+    }
+
+    retagger = release_tool.RegistryRetagger()
+    deployments = registry_stand_in + "/mendersoftware/deployments:%s"
+    assert retagger.retag(deployments % "mender-3.7.0", deployments % "mender-3.7")
+    assert RegistryStandIn.manifests[("mendersoftware/deployments", "mender-3.7")] == (
+        image_type,
+        image_manifest,
+    )
+    # Already there.
+    assert not retagger.retag(deployments % "mender-3.7.0", deployments % "mender-3.7")
+
+    qemu = registry_stand_in + "/mendersoftware/mender-client-qemu:%s"
+    assert retagger.retag(qemu % "4.0.0", qemu % "latest")
+    assert RegistryStandIn.manifests[
+        ("mendersoftware/mender-client-qemu", "latest")
+    ] == (list_type, list_manifest)
+
+    with pytest.raises(Exception, match="Cannot get manifest"):
+        retagger.retag(qemu % "3.0.0", qemu % "latest")
+    with pytest.raises(Exception, match="not the same repository"):
+        retagger.retag(qemu % "4.0.0", deployments % "latest")
+
+
+def test_sparse_temp_git_checkout(tmp_path):
+    repo_dir = tmp_path / "repos"
+    git_commit_files(str(repo_dir / "deployments"), {"LICENSE": "license"})
+    os.makedirs(str(repo_dir / "deployments" / "vendor" / "lib"))
+    os.makedirs(str(repo_dir / "deployments" / "app"))
+    git_commit_files(
+        str(repo_dir / "deployments"),
+        {
+            "LIC_FILES_CHKSUM.sha256": "# Comment\n"
+            + "1234 LICENSE\n"
+            + "5678 vendor/lib/COPYRIGHT.md\n",
+            "README.md": "readme",
+            "vendor/lib/COPYRIGHT.md": "copyright",
+            "vendor/lib/LICENSE": "lib license",
+            "vendor/lib/lib.go": "package lib",
+            "app/main.go": "package main",
+        },
+        "1.0.0",
+    )
+    state = {"repo_dir": str(repo_dir)}
+
+    sparse_paths = release_tool.license_scan_paths(state, "deployments", "1.0.0")
+    tmpdir = release_tool.setup_temp_git_checkout(
+        state, "deployments", "1.0.0", sparse_paths
+    )
+    try:
+        files = sorted(
+            [
+                os.path.relpath(os.path.join(path, file), tmpdir)
+                for path, dirs, files in os.walk(tmpdir)
+                if ".git" not in path.split(os.sep)
+                for file in files
+            ]
+        )
+        assert files == [
+            "LICENSE",
+            "LIC_FILES_CHKSUM.sha256",
+            "app/main.go",
+            "vendor/lib/COPYRIGHT.md",
+            "vendor/lib/LICENSE",
+        ]
+        # The objects are borrowed, not copied.
+        assert not os.listdir(os.path.join(tmpdir, ".git", "objects", "pack"))
+    finally:
+        release_tool.cleanup_temp_git_checkout(tmpdir)
+
+
+def test_check_tag_availability(tmp_path, monkeypatch):
+    repo_dir = tmp_path / "repos"
+    deployments = str(repo_dir / "deployments")
+    git_commit_files(deployments, {"a": "1"}, "1.0.0-build1")
+    git_commit_files(deployments, {"a": "2"})
+    subprocess.check_call(
+        [
+            "git",
+            "-c",
+            "user.name=test",
+            "-c",
+            "user.email=test@example.com",
+            "tag",
+            "-a",
+            "-m",
+            "build 3",
+            "1.0.0-build3",
+        ],
+        cwd=deployments,
+    )
+    git_commit_files(str(repo_dir / "integration"), {"a": "1"}, "2.0.0")
+
+    def short_sha(git_dir, rev):
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", rev + "~0"], cwd=git_dir, text=True
+        ).strip()
+
+    monkeypatch.setattr(release_tool, "integration_dir", lambda: INTEGRATION_DIR)
+    Component.set_integration_version(None)
+    repos = [
+        Component.get_component_of_type("git", "deployments"),
+        Component.get_component_of_type("git", "integration"),
+    ]
+    monkeypatch.setattr(
+        Component, "get_components_of_type", lambda *args, **kwargs: repos
+    )
+    monkeypatch.setattr(release_tool, "RELEASE_TOOL_STATE", str(tmp_path / "state"))
+    state = {
+        "repo_dir": str(repo_dir),
+        "version": "2.0.0",
+        "deployments": {"version": "1.0.0"},
+        "integration": {"version": "2.0.0"},
+    }
+    expected = {
+        "image_tag": "mender-2.0.0-build3",
+        "deployments": {
+            "already_released": False,
+            "build_tag": "1.0.0-build3",
+            "sha": short_sha(deployments, "1.0.0-build3"),
+        },
+        "integration": {
+            "already_released": True,
+            "build_tag": "2.0.0",
+            "sha": short_sha(str(repo_dir / "integration"), "2.0.0"),
+        },
+    }
+    assert release_tool.check_tag_availability(state) == expected
+    assert release_tool.load_state()["tag_index"] == state["tag_index"]
+
+    # Unchanged tags are taken from the state.
+    with patch("release_tool.execute_git", side_effect=Exception("not cached")):
+        assert release_tool.check_tag_availability(state) == expected
+
+    git_commit_files(deployments, {"a": "3"}, "1.0.0-build4")
+    expected["image_tag"] = "mender-2.0.0-build4"
+    expected["deployments"]["build_tag"] = "1.0.0-build4"
+    expected["deployments"]["sha"] = short_sha(deployments, "1.0.0-build4")
+    assert release_tool.check_tag_availability(state) == expected
+
+
+def test_select_test_suite(tmp_path, monkeypatch, capsys):
+    repo_dir = tmp_path / "repos"
+    for name in ["deployments", "tenantadm"]:
+        git_dir = str(repo_dir / name)
+        git_commit_files(git_dir, {"a": "1"})
+        subprocess.check_call(
+            [
+                "git",
+                "remote",
+                "add",
+                "upstream",
+                "https://github.com/mendersoftware/%s.git" % name,
+            ],
+            cwd=git_dir,
+        )
+        subprocess.check_call(
+            ["git", "update-ref", "refs/remotes/upstream/master", "HEAD"], cwd=git_dir
+        )
+    # A pull request of tenantadm is being built.
+    git_commit_files(str(repo_dir / "tenantadm"), {"a": "2"})
+
+    monkeypatch.setattr(release_tool, "integration_dir", lambda: INTEGRATION_DIR)
+    Component.set_integration_version(None)
+    repos = [
+        Component.get_component_of_type("git", "deployments"),
+        Component.get_component_of_type("git", "tenantadm"),
+    ]
+    monkeypatch.setattr(
+        Component, "get_components_of_type", lambda *args, **kwargs: repos
+    )
+    monkeypatch.setattr(
+        release_tool, "integration_dir", lambda: str(repo_dir / "integration")
+    )
+
+    assert release_tool.select_test_suite() == "enterprise"
+    assert release_tool.select_test_suite({"deployments"}) == "open"
+
+    with patch.object(sys, "argv", [RELEASE_TOOL, "--select-test-suite", "--json"]):
+        main()
+    result = json.loads(capsys.readouterr().out)
+    assert result.pop("scan_seconds") >= 0
+    assert result == {
+        "suite": "enterprise",
+        "triggered_by": ["tenantadm"],
+        "repos": {
+            "deployments": {
+                "path": str(repo_dir / "deployments"),
+                "on_known_branch": True,
+            },
+            "tenantadm": {
+                "path": str(repo_dir / "tenantadm"),
+                "on_known_branch": False,
+            },
+        },
+    }
+
+
+def test_query_server(tmp_path, capsys):
+    socket_path = str(tmp_path / "release-tool.sock")
+    server = socketserver.UnixStreamServer(
+        socket_path, release_tool._QueryServerHandler
+    )
+    server.integration_dir = INTEGRATION_DIR
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        with patch.object(sys, "argv", [RELEASE_TOOL]):
+            main(["--list", "--all"])
+            expected = capsys.readouterr().out
+            assert release_tool.run_on_server(socket_path, ["--list", "--all"]) == 0
+            assert capsys.readouterr().out == expected
+
+            argv = ["--list", "--no-such-option"]
+            assert release_tool.run_on_server(socket_path, argv) == 2
+            assert "unrecognized arguments" in capsys.readouterr().err
+
+            # Not queries, or not for this integration repository: run them
+            # locally.
+            assert release_tool.run_on_server(socket_path, ["--release"]) is None
+            assert (
+                release_tool.run_on_server(socket_path, ["--list", "--build"]) is None
+            )
+        with patch.object(sys, "argv", [str(tmp_path / "extra" / "release_tool.py")]):
+            assert release_tool.run_on_server(socket_path, ["--list"]) is None
+        assert capsys.readouterr().out == ""
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+    assert release_tool.run_on_server(socket_path, ["--list"]) is None
+    assert release_tool.serve_query(b"{", INTEGRATION_DIR)["error"]["code"] == -32700
+    assert release_tool.serve_query(
+        b'{"id": 3, "method": "stop"}', INTEGRATION_DIR
+    ) == {
+        "jsonrpc": "2.0",
+        "id": 3,
+        "error": {"code": -32601, "message": "Method not found"},
+    }
+
+
+def test_query_server_independent_queries(monkeypatch):
+    with patch.object(sys, "argv", [RELEASE_TOOL]):
+        release_tool.Component._initialize_component_maps()
+        maps = copy.deepcopy(release_tool.Component.COMPONENT_MAPS)
+    maps["git"]["other-deployments"] = maps["git"]["deployments"]
+    monkeypatch.setattr(
+        release_tool, "get_component_maps_for_rev", lambda int_dir, rev: maps
+    )
+
+    def query(argv):
+        params = {"argv": argv, "integration_dir": INTEGRATION_DIR}
+        request = json.dumps({"id": 1, "method": "run", "params": params})
+        with patch.object(sys, "argv", [RELEASE_TOOL]):
+            response = release_tool.serve_query(request, INTEGRATION_DIR)
+        return response["result"]
+
+    result = query(["--list", "git", "-i", "1.0.0"])
+    assert "other-deployments" in result["stdout"]
+    # --map-name doesn't take the maps of the previous query's integration
+    # version, but those of the working tree.
+    result = query(["--map-name", "git", "deployments", "docker"])
+    assert result["stdout"] == "deployments\n"
+    result = query(["--map-name", "git", "other-deployments", "docker"])
+    assert result["exit_code"] != 0
+    assert "other-deployments" in result["stderr"]
+
+
+def test_state_store(tmp_path, monkeypatch):
+    filename = str(tmp_path / "release-state.yml")
+    journal = filename + ".journal"
+    monkeypatch.setattr(release_tool.StateStore, "COMPACT_EVERY", 3)
+    store = release_tool.StateStore(filename)
+
+    state = store.load()
+    assert state == {}
+    store.update(state, ["version"], "3.7.0")
+    store.update(state, ["deployments", "version"], "4.4.0")
+    # Only journaled so far.
+    assert not os.path.exists(filename)
+    assert os.path.exists(journal)
+    assert release_tool.StateStore(filename).load() == {
+        "version": "3.7.0",
+        "deployments": {"version": "4.4.0"},
+    }
+    # Loading compacted the journal into the state file.
+    assert not os.path.exists(journal)
+    with open(filename) as fd:
+        assert yaml.safe_load(fd) == state
+
+    # A last update cut short by a crash is lost, but nothing else.
+    store = release_tool.StateStore(filename)
+    state = store.load()
+    store.update(state, ["deployments", "following"], "origin/4.4.x")
+    with open(journal, "a") as fd:
+        fd.write('{"key": ["version"], "val')
+    assert release_tool.StateStore(filename).load() == {
+        "version": "3.7.0",
+        "deployments": {"version": "4.4.0", "following": "origin/4.4.x"},
+    }
+
+    # Compacted every COMPACT_EVERY updates.
+    store = release_tool.StateStore(filename)
+    state = store.load()
+    for n in range(3):
+        store.update(state, ["extra_buildparams", "PARAM_%d" % n], "value")
+    assert not os.path.exists(journal)
+    with open(filename) as fd:
+        assert yaml.safe_load(fd) == state
+
+    # A journal not matching the state file, e.g. because the file was
+    # edited, is ignored.
+    store.update(state, ["version"], "3.7.1")
+    with open(filename, "w") as fd:
+        fd.write(yaml.dump({"version": "3.8.0"}))
+    assert release_tool.StateStore(filename).load() == {"version": "3.8.0"}
+
+
+def test_integration_version_summaries(tmp_path, release_tool_cache):
+    git_dir = str(tmp_path / "integration")
+    component_maps = yaml.dump(
+        {"git": {"deployments": {"release_component": True}, "tools": {}}}
+    )
+    git_commit_files(
+        git_dir,
+        {"git-versions.yml": git_versions_yml({"deployments": "4.0.0"})},
+        "1.0.0",
+    )
+    git_commit_files(
+        git_dir,
+        {
+            "git-versions.yml": git_versions_yml({"deployments": "4.1.0"}),
+            "docker-compose.yml": git_versions_yml({"gui": "1.0.0"}),
+            "component-maps.yml": component_maps,
+        },
+        "1.1.0",
+    )
+    candidates = [
+        (
+            tag,
+            subprocess.check_output(["git", "rev-parse", tag], cwd=git_dir, text=True),
+        )
+        for tag in ["1.1.0", "1.0.0"]
+    ]
+    candidates = [(tag, sha.strip()) for tag, sha in candidates]
+
+    summaries = release_tool.integration_version_summaries(git_dir, candidates, jobs=2)
+    assert summaries == [
+        {
+            "versions": {"deployments": "4.1.0", "gui": "1.0.0"},
+            "release_components": {"deployments": True, "tools": False},
+        },
+        {"versions": {"deployments": "4.0.0"}, "release_components": None},
+    ]
+    assert (
+        len(os.listdir(release_tool_cache / "v1" / "integration-version-summary")) == 2
+    )
+
+    # Served from the cache, without running anything in the repository.
+    shutil.rmtree(os.path.join(git_dir, ".git"))
+    assert (
+        release_tool.integration_version_summaries(git_dir, candidates, jobs=1)
+        == summaries
+    )
+
+
+def test_component_maps_index():
+    maps = {
+        "git": {
+            "deployments": {
+                "docker_image": ["deployments"],
+                "release_component": True,
+            },
+            "mender": {
+                "docker_image": ["mender-client-qemu"],
+                "release_component": True,
+                "independent_component": True,
+            },
+        },
+        "docker_image": {
+            "deployments": {"git": ["deployments"], "release_component": True},
+            "mender-client-qemu": {"git": ["mender"], "release_component": False},
+        },
+        "docker_container": {},
+    }
+    index = release_tool.ComponentMapsIndex.of(maps)
+    assert release_tool.ComponentMapsIndex.of(maps) is index
+
+    # Use the maps of the working tree as global ones.
+    Component.set_integration_version(None)
+
+    comp = Component("mender-client-qemu", "docker_image")
+    comp.set_custom_component_maps(maps)
+    assert [c.name for c in comp.associated_components_of_type("git")] == ["mender"]
+    # Not set on the image, so taken from the associated git component.
+    assert comp.is_independent_component()
+    assert not comp.is_release_component()
+    with pytest.raises(KeyError):
+        comp.associated_components_of_type("docker_container")
+
+    comp = Component("deployments", "git")
+    comp.set_custom_component_maps(maps)
+    assert not comp.is_independent_component()
+
+
 def test_docker_compose_files_list():
     list_git = docker_compose_files_list(INTEGRATION_DIR, version="git")
     list_git_filenames = [os.path.basename(file) for file in list_git]
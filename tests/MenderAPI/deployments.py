@@ -14,15 +14,21 @@
 
 import time
 import json
-import os
 import requests
 import pytest
 
 from . import logger
 from . import api_version
 from . import get_container_manager
+from .polling import poll, PollTimeout
 from .requests_helpers import requests_retry
 
+from testutils.util.multipart import artifact_upload_body, log_upload_stats
+
+# Deployment status checks back off up to this interval only, so that they
+# notice the changes they wait for within about half a second.
+STATUS_MAX_INTERVAL = 0.5
+
 
 class Deployments:
     # track the last statistic for a deployment id
@@ -43,22 +49,17 @@ class Deployments:
             api_version,
         )
 
-    def upload_image(self, filename, description="abc"):
+    def upload_image(self, filename, description="abc", progress=None):
         image_path_url = self.get_deployments_base_path() + "artifacts"
 
+        body = artifact_upload_body(filename, description, progress=progress)
+        headers = {"Content-Type": body.content_type}
+        headers.update(self.auth.get_auth_token())
+
         r = requests_retry().post(
-            image_path_url,
-            verify=False,
-            headers=self.auth.get_auth_token(),
-            files=(
-                ("description", (None, description)),
-                ("size", (None, str(os.path.getsize(filename)))),
-                (
-                    "artifact",
-                    (filename, open(filename, "rb"), "application/octet-stream"),
-                ),
-            ),
+            image_path_url, verify=False, headers=headers, data=body,
         )
+        log_upload_stats(body, "artifact upload %s" % filename)
 
         logger.info(
             "Received image upload status code: "
@@ -159,52 +160,53 @@ class Deployments:
 
         return json.loads(r.text)
 
+    def _has_deployment(self, data, deployment_id):
+        return any([deployment["id"] == deployment_id for deployment in data])
+
     def check_expected_status(
         self, expected_status, deployment_id, max_wait=60 * 60, polling_frequency=0.2
     ):
-        timeout = time.time() + max_wait
-
-        while time.time() <= timeout:
-            data = self.get_status(status=expected_status)
+        try:
+            poll(
+                lambda: self.get_status(status=expected_status),
+                lambda data: self._has_deployment(data, deployment_id),
+                max_wait,
+                name="Deployments.check_expected_status",
+                min_interval=polling_frequency,
+                max_interval=max(polling_frequency, STATUS_MAX_INTERVAL),
+            )
+        except PollTimeout:
+            pytest.fail(
+                "Never found status: %s for %s after %d seconds"
+                % (expected_status, deployment_id, max_wait)
+            )
 
-            for deployment in data:
-                if deployment["id"] == deployment_id:
-                    logger.info(
-                        "got expected deployment status (%s) for: %s"
-                        % (expected_status, deployment_id)
-                    )
-                    return
-            else:
-                time.sleep(polling_frequency)
-                continue
-
-        pytest.fail(
-            "Never found status: %s for %s after %d seconds"
-            % (expected_status, deployment_id, max_wait)
+        logger.info(
+            "got expected deployment status (%s) for: %s"
+            % (expected_status, deployment_id)
         )
 
     def check_not_in_status(
         self, expected_status, deployment_id, max_wait=60 * 60, polling_frequency=0.2
     ):
-        timeout = time.time() + max_wait
-
-        while time.time() <= timeout:
-            data = self.get_status(status=expected_status)
-
-            for deployment in data:
-                if deployment["id"] == deployment_id:
-                    time.sleep(polling_frequency)
-                    continue
-            else:
-                logger.info(
-                    "left deployment status (%s) as expected for: %s"
-                    % (expected_status, deployment_id)
-                )
-                return
-
-        pytest.fail(
-            "Never left status: %s for %s after %d seconds"
-            % (expected_status, deployment_id, max_wait)
+        try:
+            poll(
+                lambda: self.get_status(status=expected_status),
+                lambda data: not self._has_deployment(data, deployment_id),
+                max_wait,
+                name="Deployments.check_not_in_status",
+                min_interval=polling_frequency,
+                max_interval=max(polling_frequency, STATUS_MAX_INTERVAL),
+            )
+        except PollTimeout:
+            pytest.fail(
+                "Never left status: %s for %s after %d seconds"
+                % (expected_status, deployment_id, max_wait)
+            )
+
+        logger.info(
+            "left deployment status (%s) as expected for: %s"
+            % (expected_status, deployment_id)
         )
 
     def check_expected_statistics(
@@ -215,40 +217,48 @@ class Deployments:
         max_wait=60 * 60,
         polling_frequency=0.2,
     ):
-        timeout = time.time() + max_wait
         seen = set()
 
-        while time.time() <= timeout:
-            time.sleep(polling_frequency)
-
+        def probe():
             data = self.get_statistics(deployment_id)
             seen.add(str(data))
+            return data
+
+        def unexpected_failure(data):
+            return int(data["failure"]) > 0 and expected_status != "failure"
 
-            if int(data["failure"]) > 0 and expected_status != "failure":
-                all_failed_logs = ""
-                for device in self.devauth.get_devices():
-                    try:
-                        all_failed_logs += (
-                            self.get_logs(device["id"], deployment_id) + "\n" * 5
-                        )
-                    except Exception:
-                        logger.warning("failed to get logs.")
-
-                pytest.fail(
-                    "deployment unexpectedly failed, here are the deployment logs: \n\n %s"
-                    % (all_failed_logs)
-                )
-
-            if data[expected_status] == expected_count:
-                return
-            continue
-
-        if time.time() > timeout:
+        try:
+            data = poll(
+                probe,
+                # Stop early on failures, no point in waiting for the rest.
+                lambda data: unexpected_failure(data)
+                or data[expected_status] == expected_count,
+                max_wait,
+                name="Deployments.check_expected_statistics",
+                min_interval=polling_frequency,
+                max_interval=max(polling_frequency, STATUS_MAX_INTERVAL),
+            )
+        except PollTimeout:
             pytest.fail(
                 "Never found: %s:%s, only seen: %s after %d seconds"
                 % (expected_status, expected_count, str(seen), max_wait)
             )
 
+        if unexpected_failure(data):
+            all_failed_logs = ""
+            for device in self.devauth.get_devices():
+                try:
+                    all_failed_logs += (
+                        self.get_logs(device["id"], deployment_id) + "\n" * 5
+                    )
+                except Exception:
+                    logger.warning("failed to get logs.")
+
+            pytest.fail(
+                "deployment unexpectedly failed, here are the deployment logs: \n\n %s"
+                % (all_failed_logs)
+            )
+
     def get_deployment_overview(self, deployment_id):
         deployments_overview_url = self.get_deployments_base_path() + "deployments/%s/devices" % (
             deployment_id
@@ -12,13 +12,13 @@
 #    See the License for the specific language governing permissions and
 #    limitations under the License.
 
-import time
 import json
 import requests
 import pytest
 
 from . import logger
 from . import get_container_manager
+from .polling import poll, PollTimeout
 from .requests_helpers import requests_retry
 
 
@@ -50,39 +50,39 @@ class DeviceAuthV2:
         self, status=None, expected_devices=1, max_wait=10 * 60, no_assert=False
     ):
         device_status_path = self.get_devauth_base_path() + "devices"
-        devices = None
-        starttime = time.time()
-        sleeptime = 5
-
-        got_devices = False
-        while starttime + max_wait >= time.time():
-            time.sleep(sleeptime)
-            # Linear backoff
-            sleeptime += 5
+
+        def probe():
             logger.info("getting all devices from: %s" % (device_status_path))
             devices = requests_retry().get(
                 device_status_path, headers=self.auth.get_auth_token(), verify=False
             )
-            if (
+            if not got_enough(devices):
+                if getattr(devices, "text"):
+                    logger.info("fail to get devices (payload: %s)" % devices.text)
+                else:
+                    logger.info("failed to get devices")
+            return devices
+
+        def got_enough(devices):
+            return (
                 devices.status_code == requests.status_codes.codes.ok
                 and len(devices.json()) >= expected_devices
-            ):
-                got_devices = True
-                break
-            else:
-                if devices is not None and getattr(devices, "text"):
-                    logger.info(
-                        "fail to get devices (payload: %s), will try for at least %d more seconds"
-                        % (devices.text, starttime + max_wait - time.time())
-                    )
-                else:
-                    logger.info(
-                        "failed to get devices, will try for at least %d more seconds"
-                        % (starttime + max_wait - time.time())
-                    )
+            )
 
-        if not no_assert:
-            assert got_devices, "Not able to get devices"
+        try:
+            devices = poll(
+                probe,
+                got_enough,
+                max_wait,
+                name="DeviceAuthV2.get_devices_status",
+                min_interval=1,
+                max_interval=15,
+                key=lambda devices: (devices.status_code, devices.text),
+            )
+        except PollTimeout as e:
+            if not no_assert:
+                raise AssertionError("Not able to get devices") from e
+            devices = e.last_value
 
         devices_json = devices.json()
 
@@ -111,26 +111,23 @@ class DeviceAuthV2:
     def check_expected_status(
         self, status, expected_value, max_wait=60 * 60, polling_frequency=1
     ):
-        timeout = time.time() + max_wait
         seen = set()
 
-        while time.time() <= timeout:
-            time.sleep(polling_frequency)
-
+        def probe():
             data = self.get_devices_status(status)
             seen.add(str(data))
-
-            count = 0
-            for device in data:
-                if device["status"] == status:
-                    count += 1
-
-            if count != expected_value:
-                continue
-            else:
-                return
-
-        if time.time() > timeout:
+            return data
+
+        try:
+            poll(
+                probe,
+                lambda data: len([d for d in data if d["status"] == status])
+                == expected_value,
+                max_wait,
+                name="DeviceAuthV2.check_expected_status",
+                min_interval=polling_frequency,
+            )
+        except PollTimeout:
             pytest.fail(
                 "Never found: %s:%s, only seen: %s"
                 % (status, expected_value, str(seen))
@@ -149,20 +146,18 @@ class DeviceAuthV2:
             )
 
         # block until devices are actually accepted
-        timeout = time.time() + 30
-        while time.time() <= timeout:
-            time.sleep(1)
-            if (
-                len(
+        try:
+            poll(
+                lambda: len(
                     self.get_devices_status(
                         status="accepted", expected_devices=expected_devices
                     )
-                )
-                == expected_devices
-            ):
-                break
-
-        if time.time() > timeout:
+                ),
+                lambda accepted: accepted == expected_devices,
+                30,
+                name="DeviceAuthV2.accept_devices",
+            )
+        except PollTimeout:
             pytest.fail("wasn't able to accept device after 30 seconds")
 
         logger.info("Successfully bootstrap all clients")
@@ -0,0 +1,110 @@
+# Copyright 2023 Northern.tech AS
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+import collections
+import json
+import random
+import threading
+import time
+
+from . import logger
+
+# Per poll name: how many polls ran, how many times the server was probed, how
+# many polls timed out and how long was spent sleeping between probes.
+_metrics = collections.defaultdict(
+    lambda: {"polls": 0, "probes": 0, "timeouts": 0, "waited": 0.0}
+)
+_metrics_lock = threading.Lock()
+
+
+class PollTimeout(Exception):
+    def __init__(self, name, max_wait, last_value):
+        super().__init__("%s: condition not met after %s seconds" % (name, max_wait))
+        self.last_value = last_value
+
+
+def poll(
+    probe,
+    until,
+    max_wait,
+    name=None,
+    min_interval=0.2,
+    max_interval=5.0,
+    backoff=1.5,
+    jitter=0.2,
+    key=None,
+):
+    """Call probe() until until(value) is true for the value it returns, and
+    return that value. Raises PollTimeout if it doesn't happen within max_wait
+    seconds.
+
+    The interval between probes starts at min_interval and grows exponentially
+    up to max_interval while the probed value stays the same. Any change in the
+    value is taken as progress, and brings the interval back to min_interval.
+    Values are compared through key(value), if given. A random jitter of
+    +/- jitter (as a fraction) is applied to each interval.
+
+    until doubles as an early-exit predicate: it may return true for values
+    which are not a success (e.g. a failed deployment), and let the caller
+    inspect the returned value.
+    """
+
+    if name is None:
+        name = probe.__qualname__
+
+    probes, waited = 0, 0.0
+    deadline = time.time() + max_wait
+    interval = min_interval
+    last_value = None
+    try:
+        while True:
+            value = probe()
+            probes += 1
+            if until(value):
+                return value
+
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                with _metrics_lock:
+                    _metrics[name]["timeouts"] += 1
+                raise PollTimeout(name, max_wait, value)
+
+            compared_value = value if key is None else key(value)
+            if probes > 1 and compared_value == last_value:
+                interval = min(interval * backoff, max_interval)
+            else:
+                interval = min_interval
+            last_value = compared_value
+
+            sleep = min(remaining, interval * random.uniform(1 - jitter, 1 + jitter))
+            time.sleep(sleep)
+            waited += sleep
+    finally:
+        with _metrics_lock:
+            metrics = _metrics[name]
+            metrics["polls"] += 1
+            metrics["probes"] += probes
+            metrics["waited"] += waited
+        logger.debug("poll %s: %d probes, waited %.1f seconds" % (name, probes, waited))
+
+
+def poll_metrics():
+    """Returns a copy of the accumulated metrics, per poll name."""
+    with _metrics_lock:
+        return {name: dict(metrics) for name, metrics in _metrics.items()}
+
+
+def dump_poll_metrics(filename):
+    with open(filename, "w") as fd:
+        json.dump(poll_metrics(), fd, indent=2, sort_keys=True)
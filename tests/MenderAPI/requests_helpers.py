@@ -12,18 +12,64 @@
 #    See the License for the specific language governing permissions and
 #    limitations under the License.
 
+import os
+import threading
+from http.cookiejar import DefaultCookiePolicy
+
 import requests
 from requests.adapters import HTTPAdapter
 from requests.packages.urllib3.util.retry import Retry
 
-# Will retry on 500 Server error
-def requests_retry(status_forcelist=[500, 502]):
-    s = requests.Session()
+# Connection pools of the shared sessions: number of hosts to keep pools for,
+# and number of connections kept per host.
+POOL_CONNECTIONS = int(os.environ.get("MENDER_API_POOL_CONNECTIONS", "10"))
+POOL_MAXSIZE = int(os.environ.get("MENDER_API_POOL_MAXSIZE", "10"))
+
+_thread_local = threading.local()
+
+
+class RetrySession(requests.Session):
+    """requests.Session which counts the requests sent through it"""
+
+    def __init__(self):
+        super().__init__()
+        self.request_count = 0
+
+    def request(self, *args, **kwargs):
+        self.request_count += 1
+        return super().request(*args, **kwargs)
+
+
+def _new_session(status_forcelist):
+    s = RetrySession()
+    # The session is shared between tests (and tenants): never send back
+    # cookies, all the state is in the explicit auth headers.
+    s.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
     retries = Retry(
         total=5,
         backoff_factor=1,
         status_forcelist=status_forcelist,
         allowed_methods=["HEAD", "GET", "POST", "PUT", "DELETE", "OPTIONS", "TRACE"],
     )
-    s.mount("https://", HTTPAdapter(max_retries=retries))
+    s.mount(
+        "https://",
+        HTTPAdapter(
+            max_retries=retries,
+            pool_connections=POOL_CONNECTIONS,
+            pool_maxsize=POOL_MAXSIZE,
+        ),
+    )
     return s
+
+
+# Will retry on 500 Server error
+def requests_retry(status_forcelist=[500, 502]):
+    """Returns the calling thread's shared session, so that connections are
+    kept alive between requests. There is one session per status_forcelist."""
+    sessions = getattr(_thread_local, "sessions", None)
+    if sessions is None:
+        sessions = _thread_local.sessions = {}
+    key = tuple(status_forcelist)
+    if key not in sessions:
+        sessions[key] = _new_session(list(key))
+    return sessions[key]
@@ -13,6 +13,9 @@
 #    limitations under the License.
 
 import distutils.spawn
+import functools
+import glob
+import hashlib
 import logging
 import os
 import subprocess
@@ -23,9 +26,13 @@ from distutils.version import LooseVersion
 import filelock
 import pytest
 from testutils.infra.container_manager.base import BaseContainerManagerNamespace
+from testutils.infra.container_manager.docker_compose_base_manager import (
+    DockerComposeBaseNamespace,
+)
 from testutils.infra.device import MenderDevice, MenderDeviceGroup
 
 from . import log
+from .MenderAPI.polling import dump_poll_metrics
 from .tests.mendertesting import MenderTesting
 
 THIS_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -156,6 +163,14 @@ def pytest_configure(config):
     )
 
 
+def pytest_sessionfinish(session):
+    # One file per xdist worker, they don't share the metrics.
+    worker_id = os.environ.get("PYTEST_XDIST_WORKER", "master")
+    dump_poll_metrics(
+        os.path.join(log.TEST_LOGS_PATH, "poll_metrics_%s.json" % worker_id)
+    )
+
+
 def unique_test_name(request):
     """Generate unique test names by prepending the class to the method name"""
     if request.node.cls is not None:
@@ -201,6 +216,8 @@ def pytest_exception_interact(node, call, report):
             ]
         if len(env_candidates) > 0:
             env = env_candidates[0]
+            if isinstance(env, DockerComposeBaseNamespace):
+                env.log_containers_logs_tails()
             dev_candidates = [
                 getattr(env, attr)
                 for attr in dir(env)
@@ -271,6 +288,45 @@ def verify_sane_test_environment():
         )
 
 
+def _mender_client_version_cache_key():
+    integration_dir = os.path.join(THIS_DIR, "..")
+    key = hashlib.sha256(
+        subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=integration_dir)
+    )
+    # The versions may be set in the working tree (release_tool --set-version-of)
+    # without being committed, so take the compose files into account too.
+    for filename in sorted(glob.glob(os.path.join(integration_dir, "*.yml"))):
+        with open(filename, "rb") as fd:
+            key.update(fd.read())
+    return key.hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def get_mender_client_version():
+    """Version of the Mender client under test, as reported by release_tool
+
+    Resolved once per integration HEAD (and compose files) and cached on disk,
+    so that it's shared by all the xdist workers and following sessions.
+    """
+    cache_file = os.path.join(
+        tempfile.gettempdir(),
+        "mender-client-version-%s" % _mender_client_version_cache_key(),
+    )
+    with filelock.FileLock(cache_file + ".lock"):
+        if os.path.exists(cache_file):
+            with open(cache_file) as fd:
+                return fd.read()
+        version = (
+            subprocess.check_output([RELEASE_TOOL, "--version-of", "mender"])
+            .decode()
+            .strip()
+        )
+        with open(cache_file + ".tmp", "w") as fd:
+            fd.write(version)
+        os.rename(cache_file + ".tmp", cache_file)
+        return version
+
+
 @pytest.fixture(autouse=True)
 def min_mender_client_version(request):
     version_marker = request.node.get_closest_marker("min_mender_client_version")
@@ -278,11 +334,7 @@ def min_mender_client_version(request):
         # No marker, assume it shall run for all versions
         return
 
-    mender_client_version = (
-        subprocess.check_output([RELEASE_TOOL, "--version-of", "mender"])
-        .decode()
-        .strip()
-    )
+    mender_client_version = get_mender_client_version()
     min_required_version = version_marker.args[0]
 
     if not version_is_minimum(mender_client_version, min_required_version):
@@ -291,11 +343,7 @@ def min_mender_client_version(request):
 
 @pytest.fixture(autouse=True)
 def mender_client_version():
-    return (
-        subprocess.check_output([RELEASE_TOOL, "--version-of", "mender"])
-        .decode()
-        .strip()
-    )
+    return get_mender_client_version()
 
 
 def version_is_minimum(version, min_version):
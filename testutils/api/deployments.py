@@ -29,4 +29,8 @@ URL_DEPLOYMENTS_ARTIFACTS = "/artifacts"
 URL_DEPLOYMENTS_ARTIFACTS_GET = "/artifacts/{id}"
 URL_DEPLOYMENTS_ARTIFACTS_DOWNLOAD = "/artifacts/{id}/download"
 URL_DEPLOYMENTS_ARTIFACTS_GENERATE = "/artifacts/generate"
+URL_DEPLOYMENTS_ARTIFACTS_DIRECT_UPLOAD = "/artifacts/directupload"
+URL_DEPLOYMENTS_ARTIFACTS_DIRECT_UPLOAD_COMPLETE = (
+    "/artifacts/directupload/{id}/complete"
+)
 URL_INTERNAL_CONFIG = "/tenants/{tenant_id}/config"
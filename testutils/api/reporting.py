@@ -21,8 +21,13 @@ URL_MGMT = "/api/management/v1/reporting"
 URL_MGMT_DEVICES_SEARCH = "/devices/search"
 URL_MGMT_DEPLOYMENTS_DEVICES_SEARCH = "/deployments/devices/search"
 
+# how long to wait for data to propagate to the reporting service and to be
+# indexed, see testutils.common.wait_for_reporting
+REPORTING_DATA_PROPAGATION_TIMEOUT_SECS = 30.0
+# how long it usually takes, where the search can't be used as a barrier
 REPORTING_DATA_PROPAGATION_SLEEP_TIME_SECS = 4.0
 
 OPENSEARCH_DELETE_URL = (
     "http://mender-opensearch:9200/devices/_delete_by_query?conflicts=proceed"
 )
+OPENSEARCH_REFRESH_URL = "http://mender-opensearch:9200/_refresh"
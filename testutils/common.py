@@ -15,7 +15,6 @@ import json
 import pytest
 import random
 import time
-import string
 import tempfile
 import uuid
 import os
@@ -65,6 +64,17 @@ def opensearch_cleanup():
         pass
 
 
+def opensearch_refresh():
+    """Makes the documents indexed so far visible to searches right away,
+    instead of at the next periodic refresh. Tried on every call, with a short
+    timeout: OpenSearch can't be reached directly everywhere (e.g. on
+    staging), and a failed refresh only means waiting for the periodic one."""
+    try:
+        requests.post(reporting.OPENSEARCH_REFRESH_URL, timeout=1)
+    except requests.RequestException:
+        pass
+
+
 def mongo_cleanup(mongo):
     mongo.cleanup()
 
@@ -174,6 +184,27 @@ def create_user(
     return User(uid, name, pwd)
 
 
+def create_users(
+    users: List[dict], tid: str = "", containers_namespace: str = "backend-tests",
+) -> List[User]:
+    """Batch version of create_user: users holds the name, pwd and (optional)
+    roles arguments of create_user for each user."""
+    cli = CliUseradm(containers_namespace)
+    uids = cli.create_users(
+        [
+            {
+                "username": user["name"],
+                "password": user["pwd"],
+                "tenant_id": tid,
+                "roles": user.get("roles", []),
+            }
+            for user in users
+        ]
+    )
+
+    return [User(uid, user["name"], user["pwd"]) for uid, user in zip(uids, users)]
+
+
 def create_org(
     name: str,
     username: str,
@@ -183,45 +214,76 @@ def create_org(
     containers_namespace: str = "backend-tests",
     container_manager=None,
 ) -> Tenant:
+    return create_orgs(
+        [
+            {
+                "name": name,
+                "username": username,
+                "password": password,
+                "plan": plan,
+                "addons": addons,
+            }
+        ],
+        containers_namespace=containers_namespace,
+        container_manager=container_manager,
+    )[0]
+
+
+def create_orgs(
+    orgs: List[dict],
+    containers_namespace: str = "backend-tests",
+    container_manager=None,
+) -> List[Tenant]:
+    """Batch version of create_org: orgs holds the name, username, password
+    and (optional) plan and addons arguments of create_org for each
+    organization. The organizations are created in one batch of tenantadm
+    commands, and their tokens read in another."""
     cli = CliTenantadm(
         containers_namespace=containers_namespace, container_manager=container_manager
     )
-    user_id = None
-    tenant_id = cli.create_org(name, username, password, plan=plan, addons=addons)
-    tenant_token = json.loads(cli.get_tenant(tenant_id))["tenant_token"]
+    tenant_ids = cli.create_orgs(orgs)
+    tenant_tokens = [
+        json.loads(tenant)["tenant_token"] for tenant in cli.get_tenants(tenant_ids)
+    ]
 
     host = GATEWAY_HOSTNAME
     if container_manager is not None:
         host = container_manager.get_mender_gateway()
     api = ApiClient(useradm.URL_MGMT, host=host)
 
-    # Try log in every second for 2 minutes.
-    # - There usually is a slight delay (in order of ms) for propagating
-    #   the created user to the db.
-    for _ in retrier(attempts=120, sleepscale=1, sleeptime=1):
-        rsp = api.call("POST", useradm.URL_LOGIN, auth=(username, password))
-        if rsp.status_code == 200:
-            break
+    tenants = []
+    for org, tenant_id, tenant_token in zip(orgs, tenant_ids, tenant_tokens):
+        username, password = org["username"], org["password"]
+        user_id = None
+
+        # Try log in every second for 2 minutes.
+        # - There usually is a slight delay (in order of ms) for propagating
+        #   the created user to the db.
+        for _ in retrier(attempts=120, sleepscale=1, sleeptime=1):
+            rsp = api.call("POST", useradm.URL_LOGIN, auth=(username, password))
+            if rsp.status_code == 200:
+                break
 
-    assert (
-        rsp.status_code == 200
-    ), "User could not log in within two minutes after organization has been created."
+        assert (
+            rsp.status_code == 200
+        ), "User could not log in within two minutes after organization has been created."
 
-    user_token = rsp.text
-    rsp = api.with_auth(user_token).call("GET", useradm.URL_USERS)
-    users = json.loads(rsp.text)
-    for user in users:
-        if user["email"] == username:
-            user_id = user["id"]
-            break
-    if user_id is None:
-        raise ValueError("Error retrieving user id.")
+        user_token = rsp.text
+        rsp = api.with_auth(user_token).call("GET", useradm.URL_USERS)
+        users = json.loads(rsp.text)
+        for user in users:
+            if user["email"] == username:
+                user_id = user["id"]
+                break
+        if user_id is None:
+            raise ValueError("Error retrieving user id.")
 
-    tenant = Tenant(name, tenant_id, tenant_token)
-    user = User(user_id, username, password)
-    user.token = user_token
-    tenant.users.append(user)
-    return tenant
+        tenant = Tenant(org["name"], tenant_id, tenant_token)
+        user = User(user_id, username, password)
+        user.token = user_token
+        tenant.users.append(user)
+        tenants.append(tenant)
+    return tenants
 
 
 def get_device_by_id_data(dauthm, id_data, utoken):
@@ -384,9 +446,10 @@ def get_mender_artifact(
     depends=(),
     provides=(),
 ):
-    data = "".join(random.choices(string.ascii_uppercase + string.digits, k=size))
     f = tempfile.NamedTemporaryFile(delete=False)
-    f.write(data.encode("utf-8"))
+    # In chunks, the payload may be large.
+    for offset in range(0, size, 1024 * 1024):
+        f.write(os.urandom(min(1024 * 1024, size - offset)))
     f.close()
     #
     filename = f.name
@@ -613,8 +676,102 @@ def setup_tenant_devices(tenant, device_groups):
             grouped_devices[group].append(device)
             tenant.devices.append(device)
 
-    # sleep a few seconds waiting for the data propagation to the reporting service
-    # and the Elasticsearch indexing to complete
-    time.sleep(reporting.REPORTING_DATA_PROPAGATION_SLEEP_TIME_SECS)
+    # wait for the data propagation to the reporting service
+    # and the OpenSearch indexing to complete
+    wait_for_reporting_devices(
+        user.token,
+        tenant.devices,
+        lambda dev, indexed: dev.group is None
+        or has_attributes(indexed, [{"name": "group", "value": dev.group}], "system"),
+    )
 
     return grouped_devices
+
+
+def has_attributes(indexed, attributes, scope="inventory"):
+    """
+    Whether a device returned by the reporting search has the given attributes
+    ({"name": ..., "value": ...}, in the given scope unless they set one).
+    """
+    indexed_attributes = indexed.get("attributes") or []
+    return all(
+        dict(attr, scope=attr.get("scope", scope)) in indexed_attributes
+        for attr in attributes
+    )
+
+
+def wait_for_reporting(
+    utoken,
+    query,
+    until,
+    url=reporting.URL_MGMT_DEVICES_SEARCH,
+    timeout=reporting.REPORTING_DATA_PROPAGATION_TIMEOUT_SECS,
+):
+    """
+    Barrier for data to propagate to the reporting service and be indexed:
+    runs the reporting search query until until(results) is true, and returns
+    the results. It returns as soon as the data is there, rather than after a
+    fixed sleep.
+    On Kubernetes, where the search is not available to the tests, it sleeps
+    for the usual propagation time instead. Without a reporting service (the
+    search is not found), there is nothing to wait for.
+    :param utoken:  user token for the management API
+    :param query:   search query (dict)
+    :param until:   predicate on the list of search results
+    :param url:     search endpoint (devices or deployments devices)
+    :param timeout: seconds after which to give up, with a TimeoutError
+    :return: the results, or None if the search could not be used
+    """
+    if isK8S():
+        time.sleep(reporting.REPORTING_DATA_PROPAGATION_SLEEP_TIME_SECS)
+        return None
+    reporting_client = ApiClient(reporting.URL_MGMT)
+    deadline = time.time() + timeout
+    interval = 0.05
+    while True:
+        opensearch_refresh()
+        rsp = reporting_client.with_auth(utoken).call("POST", url, query)
+        if rsp.status_code == 404:
+            return None
+        if rsp.status_code == 200 and until(rsp.json() or []):
+            return rsp.json() or []
+        if time.time() > deadline:
+            raise TimeoutError(
+                "reporting data did not propagate within %s seconds; last response: %d %s"
+                % (timeout, rsp.status_code, rsp.text)
+            )
+        time.sleep(interval)
+        interval = min(interval * 2, 1.0)
+
+
+def wait_for_reporting_devices(
+    utoken,
+    devices,
+    check=None,
+    timeout=reporting.REPORTING_DATA_PROPAGATION_TIMEOUT_SECS,
+):
+    """
+    Waits until all the devices are indexed by the reporting service and, if
+    check is given, check(device, indexed) is true for each of them, indexed
+    being the device as returned by the search.
+    :return: Dict mapping device id -> indexed device, or None as in
+             wait_for_reporting
+    """
+    ids = [dev.id for dev in devices]
+
+    def until(results):
+        indexed = {res["id"]: res for res in results}
+        return all(
+            dev.id in indexed and (check is None or check(dev, indexed[dev.id]))
+            for dev in devices
+        )
+
+    results = wait_for_reporting(
+        utoken,
+        {"device_ids": ids, "per_page": max(len(ids), 1)},
+        until,
+        timeout=timeout,
+    )
+    if results is None:
+        return None
+    return {res["id"]: res for res in results}
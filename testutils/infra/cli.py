@@ -18,7 +18,7 @@ import tempfile
 
 from collections import namedtuple
 from contextlib import contextmanager
-from typing import List
+from typing import Dict, List, Optional
 
 from testutils.infra.container_manager.docker_manager import DockerNamespace
 from testutils.infra.container_manager.kubernetes_manager import (
@@ -28,6 +28,10 @@ from testutils.infra.container_manager.kubernetes_manager import (
 
 Microservice = namedtuple("Service", "bin_path data_path")
 
+# Runnable flavour of each service, per container ID, so that the probing in
+# choose_binary_and_config_paths happens once per container.
+_chosen_services = {}
+
 
 class BaseCli:
     def __init__(
@@ -45,19 +49,40 @@ class BaseCli:
 
         self.cid = self.container_manager.getid([base_filter])
 
+    @property
+    def session(self):
+        # Looked up every time: the session is replaced if the container is
+        # restarted.
+        return self.container_manager.exec_session(self.cid)
+
+    def execute(self, cmd: List[str], timeout: Optional[float] = None) -> str:
+        """Run cmd in the service container, over the shared exec session."""
+        return self.session.execute(cmd, timeout=timeout)
+
+    def execute_many(
+        self, cmds: List[List[str]], timeout: Optional[float] = None
+    ) -> List[str]:
+        """Run all cmds in the service container in one batch."""
+        return self.session.execute_many(cmds, timeout=timeout)
+
     def choose_binary_and_config_paths(
         self, service_flavours: List[str], service_name: str
     ):
         """Choose binary and configuration paths depending on service flavour. """
+        key = (self.cid, service_name)
+        if key in _chosen_services:
+            self.service = _chosen_services[key]
+            return
         for service in service_flavours:
             try:
-                self.container_manager.execute(self.cid, [service.bin_path, "--help"])
+                self.execute([service.bin_path, "--help"])
                 self.service = service
                 break
             except:
                 continue
         else:
             raise RuntimeError(f"no runnable binary found in {service_name}")
+        _chosen_services[key] = self.service
 
 
 class CliUseradm(BaseCli):
@@ -77,6 +102,17 @@ class CliUseradm(BaseCli):
         )
 
     def create_user(self, username, password, tenant_id="", roles=[]):
+        return self.execute(self._create_user_cmd(username, password, tenant_id, roles))
+
+    def create_users(self, users: List[Dict]) -> List[str]:
+        """Create many users in one batch.
+
+        Each element of users holds the keyword arguments of create_user.
+        Returns the user IDs, in order.
+        """
+        return self.execute_many([self._create_user_cmd(**user) for user in users])
+
+    def _create_user_cmd(self, username, password, tenant_id="", roles=[]):
         cmd = [
             self.service.bin_path,
             "create-user",
@@ -92,8 +128,7 @@ class CliUseradm(BaseCli):
         if len(roles) > 0:
             cmd += ["--roles", ",".join(roles)]
 
-        uid = self.container_manager.execute(self.cid, cmd)
-        return uid
+        return cmd
 
     def migrate(self, tenant_id=None):
         if isK8S():
@@ -104,7 +139,7 @@ class CliUseradm(BaseCli):
         if tenant_id is not None:
             cmd.extend(["--tenant", tenant_id])
 
-        self.container_manager.execute(self.cid, cmd)
+        self.execute(cmd)
 
 
 class CliTenantadm(BaseCli):
@@ -118,6 +153,19 @@ class CliTenantadm(BaseCli):
         self.choose_binary_and_config_paths([enterprise], self.service_name)
 
     def create_org(self, name, username, password, plan="os", addons=[]) -> str:
+        return self.execute(
+            self._create_org_cmd(name, username, password, plan, addons)
+        )
+
+    def create_orgs(self, orgs: List[Dict]) -> List[str]:
+        """Create many organizations in one batch.
+
+        Each element of orgs holds the keyword arguments of create_org.
+        Returns the tenant IDs, in order.
+        """
+        return self.execute_many([self._create_org_cmd(**org) for org in orgs])
+
+    def _create_org_cmd(self, name, username, password, plan="os", addons=[]):
         cmd = [
             self.service.bin_path,
             "create-org",
@@ -133,22 +181,27 @@ class CliTenantadm(BaseCli):
         for addon in addons:
             cmd.extend(["--addon", addon])
 
-        tid = self.container_manager.execute(self.cid, cmd)
-        return tid
+        return cmd
 
     def get_tenant(self, tid: str):
         cmd = [self.service.bin_path, "get-tenant", "--id", tid]
 
-        tenant = self.container_manager.execute(self.cid, cmd)
+        tenant = self.execute(cmd)
         return tenant
 
+    def get_tenants(self, tids: List[str]) -> List[str]:
+        """Batch version of get_tenant."""
+        return self.execute_many(
+            [[self.service.bin_path, "get-tenant", "--id", tid] for tid in tids]
+        )
+
     def migrate(self):
         if isK8S():
             return
 
         cmd = [self.service.bin_path, "migrate"]
 
-        self.container_manager.execute(self.cid, cmd)
+        self.execute(cmd)
 
 
 class CliDeviceauth(BaseCli):
@@ -177,7 +230,7 @@ class CliDeviceauth(BaseCli):
         if tenant_id is not None:
             cmd.extend(["--tenant", tenant_id])
 
-        self.container_manager.execute(self.cid, cmd)
+        self.execute(cmd)
 
     @contextmanager
     def add_default_tenant_token(self, tenant_token):
@@ -231,7 +284,7 @@ class CliDeviceauth(BaseCli):
         if tenant_id is not None:
             cmd.extend(["--tenant_id", tenant_id])
 
-        self.container_manager.execute(self.cid, cmd)
+        self.execute(cmd)
 
 
 class CliDeployments(BaseCli):
@@ -259,7 +312,7 @@ class CliDeployments(BaseCli):
         if tenant_id is not None:
             cmd.extend(["--tenant", tenant_id])
 
-        self.container_manager.execute(self.cid, cmd)
+        self.execute(cmd)
 
 
 class CliDeviceMonitor(BaseCli):
@@ -271,4 +324,4 @@ class CliDeviceMonitor(BaseCli):
         if isK8S():
             return
 
-        self.container_manager.execute(self.cid, [self.path, "migrate"])
+        self.execute([self.path, "migrate"])
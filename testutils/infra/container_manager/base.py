@@ -15,6 +15,8 @@
 
 import random
 
+from .exec_session import ExecSession
+
 
 class BaseContainerManagerNamespace:
     """Base class to define a containers namespace"""
@@ -37,10 +39,14 @@ class BaseContainerManagerNamespace:
         """Stops the running containers"""
         raise NotImplementedError
 
-    def execute(self, container_id, cmd):
+    def execute(self, container_id, cmd, timeout=None):
         """Executes the given cmd on an specific container"""
         raise NotImplementedError
 
+    def exec_session(self, container_id):
+        """Returns an ExecSession to run many commands on an specific container"""
+        return ExecSession(self, container_id)
+
     def cmd(self, container_id, docker_cmd, cmd=[]):
         """Executes a docker command with arguments on an specific container"""
         raise NotImplementedError
@@ -0,0 +1,226 @@
+# Copyright 2023 Northern.tech AS
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+"""Streaming capture of container logs into compressed per-service files"""
+
+import collections
+import gzip
+import logging
+import os
+import subprocess
+import threading
+import time
+
+logger = logging.getLogger("root")
+
+# Where the per-project log directories are created. Each namespace gets its own
+# subdirectory, so parallel (xdist) workers never write to the same file. By
+# default they go with the logs of the integration tests, which CI collects.
+CONTAINER_LOGS_PATH = os.environ.get(
+    "CONTAINER_LOGS_PATH",
+    os.path.realpath(
+        os.path.join(
+            os.path.dirname(__file__),
+            "..",
+            "..",
+            "..",
+            "tests",
+            "mender_test_logs",
+            "containers",
+        )
+    ),
+)
+
+# How many of the last lines of each container are kept for log_tails().
+TAIL_LINES = 20
+
+_READ_CHUNK_SIZE = 64 * 1024
+
+# The streamers by project, for follow_container().
+_streamers = {}
+
+
+def follow_container(container_id):
+    """Start following a container (re)started outside of docker-compose, e.g.
+    with `docker start`, if the logs of its project are being streamed"""
+    try:
+        project = (
+            subprocess.check_output(
+                [
+                    "docker",
+                    "inspect",
+                    "--format",
+                    '{{index .Config.Labels "com.docker.compose.project"}}',
+                    str(container_id),
+                ]
+            )
+            .decode()
+            .strip()
+        )
+    except (subprocess.CalledProcessError, FileNotFoundError) as e:
+        logger.warning("cannot inspect container %s: %s" % (container_id, e))
+        return
+    streamer = _streamers.get(project)
+    if streamer is not None:
+        streamer.follow()
+
+
+class _ContainerLogFollower:
+    """Follows the logs of a single container into a gzip file
+
+    The `docker logs -f` process exits on its own when the container stops, so
+    a follower is finished when either the container is gone or stop() is
+    called. A finished follower can be restarted (e.g. after `docker start`);
+    the output is appended as a new gzip member to the same file.
+    The last TAIL_LINES lines are also kept in memory, see tail().
+    """
+
+    def __init__(self, container_id, name, filename):
+        self.container_id = container_id
+        self.name = name
+        self.filename = filename
+        self._proc = None
+        self._thread = None
+        self._since = None
+        self._tail = collections.deque(maxlen=TAIL_LINES)
+
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        cmd = ["docker", "logs", "--follow", self.container_id]
+        if self._since is not None:
+            cmd += ["--since", "%.3f" % self._since]
+        self._proc = subprocess.Popen(
+            cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT
+        )
+        self._thread = threading.Thread(
+            target=self._copy, args=(self._proc,), daemon=True
+        )
+        self._thread.start()
+
+    def _copy(self, proc):
+        try:
+            with gzip.open(self.filename, "ab") as fd:
+                while True:
+                    chunk = proc.stdout.read1(_READ_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    fd.write(chunk)
+                    self._keep_tail(chunk)
+        except Exception as e:
+            logger.warning(
+                "log capture of container %s failed: %s" % (self.container_id, e)
+            )
+        finally:
+            proc.stdout.close()
+            proc.wait()
+            self._since = time.time()
+
+    def _keep_tail(self, chunk):
+        lines = chunk.splitlines(keepends=True)
+        # A chunk may end in the middle of a line.
+        if self._tail and not self._tail[-1].endswith(b"\n"):
+            lines[0] = self._tail.pop() + lines[0]
+        self._tail.extend(lines)
+
+    def tail(self):
+        return b"".join(list(self._tail)).decode("utf-8", "ignore")
+
+    def stop(self, timeout):
+        if self._thread is None:
+            return
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            self._proc.terminate()
+            self._thread.join()
+
+
+class ContainerLogsStreamer:
+    """Follows the logs of all the containers of a docker-compose project
+
+    follow() is incremental: it only attaches to containers it hasn't seen yet
+    (or whose follower has finished), so it is cheap to call after every
+    command that may create or restart containers. Logs end up in
+    <CONTAINER_LOGS_PATH>/<project>/<service>/<container-name>.log.gz
+    """
+
+    def __init__(self, project, logs_path=None):
+        self.project = project
+        self.logs_path = os.path.join(logs_path or CONTAINER_LOGS_PATH, project)
+        self._followers = {}
+        self._lock = threading.Lock()
+        _streamers[project] = self
+
+    def _list_containers(self):
+        output = subprocess.check_output(
+            [
+                "docker",
+                "ps",
+                "--filter",
+                "label=com.docker.compose.project=%s" % self.project,
+                "--format",
+                '{{.ID}}\t{{.Names}}\t{{.Label "com.docker.compose.service"}}',
+            ]
+        ).decode()
+        for line in output.splitlines():
+            fields = line.split("\t")
+            if len(fields) == 3:
+                yield fields
+
+    def follow(self):
+        """Start following any running container which is not followed yet"""
+        with self._lock:
+            try:
+                containers = list(self._list_containers())
+            except (subprocess.CalledProcessError, FileNotFoundError) as e:
+                logger.warning("cannot list containers of %s: %s" % (self.project, e))
+                return
+
+            for container_id, name, service in containers:
+                follower = self._followers.get(container_id)
+                if follower is not None and follower.running():
+                    continue
+                if follower is None:
+                    service_dir = os.path.join(self.logs_path, service or "unknown")
+                    os.makedirs(service_dir, exist_ok=True)
+                    follower = _ContainerLogFollower(
+                        container_id, name, os.path.join(service_dir, name + ".log.gz"),
+                    )
+                    self._followers[container_id] = follower
+                follower.start()
+
+    def stop(self, timeout=10):
+        """Wait for the followers to drain, and terminate them if they don't
+
+        Meant to be called after the containers have been taken down, at which
+        point all the `docker logs` processes are already exiting.
+        """
+        deadline = time.time() + timeout
+        with self._lock:
+            for follower in self._followers.values():
+                follower.stop(max(0, deadline - time.time()))
+            self._followers = {}
+        if _streamers.get(self.project) is self:
+            del _streamers[self.project]
+
+    def log_tails(self):
+        """Log the last lines of every followed container, e.g. when a test
+        fails, so that they end up in the test log and report too"""
+        with self._lock:
+            followers = sorted(self._followers.values(), key=lambda f: f.name)
+        for follower in followers:
+            logger.info(
+                "last %d lines of the logs of container %s:\n%s"
+                % (TAIL_LINES, follower.name, follower.tail())
+            )
@@ -12,7 +12,6 @@
 #    See the License for the specific language governing permissions and
 #    limitations under the License.
 import os
-import re
 import time
 import subprocess
 import filelock
@@ -20,6 +19,7 @@ import logging
 import copy
 import redo
 
+from .container_logs import ContainerLogsStreamer
 from .docker_manager import DockerNamespace
 
 logger = logging.getLogger("root")
@@ -37,14 +37,19 @@ class DockerComposeBaseNamespace(DockerNamespace):
     def __init__(self, name=None, extra_files=[]):
         DockerNamespace.__init__(self, name)
         self.extra_files = copy.copy(extra_files)
+        self._logs_streamer = ContainerLogsStreamer(self.name)
 
     @property
     def docker_compose_files(self):
         return self.BASE_FILES + self.extra_files
 
     def teardown(self):
-        self._debug_log_containers_logs()
         self._stop_docker_compose()
+        self._logs_streamer.stop()
+
+    def log_containers_logs_tails(self):
+        """Logs the last lines of the logs of each container"""
+        self._logs_streamer.log_tails()
 
     def get_mender_clients(self, network="mender", client_service_name="mender-client"):
         """Returns IP address(es) of mender-client container(s)"""
@@ -72,8 +77,6 @@ class DockerComposeBaseNamespace(DockerNamespace):
         output = subprocess.check_output(cmd, shell=True)
         return output.decode().strip() + ":8822"
 
-    _re_newlines_sub = re.compile(r"[\r\n]*").sub
-
     def get_ip_of_service(self, service, network="mender"):
         """Return a list of IP addresseses of `service`. `service` is the same name as
         present in docker-compose files.
@@ -142,10 +145,8 @@ class DockerComposeBaseNamespace(DockerNamespace):
         container_id = super().getid([container_name])
         return super().execute(container_id, ["cat", path])
 
-    def _debug_log_containers_logs(self):
-        logs = self._docker_compose_cmd("logs --no-color")
-        for line in logs.split("\n"):
-            logger.debug(self._re_newlines_sub("", line))
+    # docker-compose commands which may create or (re)start containers.
+    _STARTING_COMMANDS = {"up", "run", "start", "restart"}
 
     def _docker_compose_cmd(self, arg_list, env=None, fail_early=True):
         """Run docker-compose command using self.docker_compose_files
@@ -165,9 +166,13 @@ class DockerComposeBaseNamespace(DockerNamespace):
         for count in range(1, 6):
             with docker_lock:
                 try:
-                    return subprocess.check_output(
+                    output = subprocess.check_output(
                         cmd, stderr=subprocess.STDOUT, shell=True, env=penv
                     ).decode("utf-8", "ignore")
+                    if arg_list.split(" ", 1)[0] in self._STARTING_COMMANDS:
+                        # Attach to the logs of whatever was (re)created.
+                        self._logs_streamer.follow()
+                    return output
 
                 except subprocess.CalledProcessError as e:
                     logger.info(
@@ -14,6 +14,11 @@
 import subprocess
 
 from .base import BaseContainerManagerNamespace
+from .container_logs import follow_container
+from .exec_session import DockerExecSession, ExecSessionPool
+
+# Shared by all the namespaces, sessions are per container, not per namespace.
+_exec_sessions = ExecSessionPool(DockerExecSession)
 
 
 class DockerNamespace(BaseContainerManagerNamespace):
@@ -26,16 +31,23 @@ class DockerNamespace(BaseContainerManagerNamespace):
     def teardown(self):
         pass
 
-    def execute(self, container_id, cmd):
+    def execute(self, container_id, cmd, timeout=None):
         cmd = ["docker", "exec", "{}".format(container_id)] + cmd
-        ret = subprocess.check_output(cmd).decode("utf-8").strip()
+        ret = subprocess.check_output(cmd, timeout=timeout).decode("utf-8").strip()
         return ret
 
+    def exec_session(self, container_id):
+        return _exec_sessions.get(self, container_id)
+
     def cmd(self, container_id, docker_cmd, cmd=[]):
+        if docker_cmd in ["stop", "restart", "kill", "rm"]:
+            _exec_sessions.discard(container_id)
         cmd = ["docker", docker_cmd] + [str(container_id)] + cmd
         ret = subprocess.run(
             cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE
         )
+        if docker_cmd in ["start", "restart"]:
+            follow_container(container_id)
         return ret.stdout.decode("utf-8").strip()
 
     def download(self, container_id, source, destination):
@@ -0,0 +1,265 @@
+# Copyright 2023 Northern.tech AS
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+"""Sessions to run many commands in a container over a single channel"""
+
+import logging
+import os
+import select
+import shlex
+import subprocess
+import threading
+import time
+import uuid
+from typing import List, Optional
+
+logger = logging.getLogger("root")
+
+
+class ExecSession:
+    """Runs commands in a container, one `execute` call of the namespace each
+
+    This is the fallback used when a persistent channel is not available, e.g.
+    because the container has no shell.
+    """
+
+    def __init__(self, namespace, container_id):
+        self.namespace = namespace
+        self.container_id = container_id
+
+    def alive(self) -> bool:
+        return True
+
+    def execute(self, cmd: List[str], timeout: Optional[float] = None) -> str:
+        return self.execute_many([cmd], timeout=timeout)[0]
+
+    def execute_many(
+        self, cmds: List[List[str]], timeout: Optional[float] = None
+    ) -> List[str]:
+        """Runs the commands in order and returns their outputs
+
+        timeout applies to each command; None waits as long as it takes.
+        """
+        return [
+            self.namespace.execute(self.container_id, cmd, timeout=timeout)
+            for cmd in cmds
+        ]
+
+    def close(self):
+        pass
+
+
+class ShellExecSession(ExecSession):
+    """Runs commands through a long-lived shell inside the container
+
+    Commands are written to the shell's stdin, each followed by a marker line
+    carrying its exit status, so many commands share one `exec`. Batches are
+    pipelined: all the commands are written before any output is read.
+    Subclasses provide the transport (_open, _write, _readline, _close) and
+    may collect the stderr of each command (_read_stderr).
+    """
+
+    SHELL = "/bin/sh"
+    # Whether outputs are stripped, like the namespace's execute() does.
+    STRIP_OUTPUT = False
+
+    def __init__(self, namespace, container_id):
+        ExecSession.__init__(self, namespace, container_id)
+        self._lock = threading.Lock()
+        self._marker = "__exec_session_%s__" % uuid.uuid4().hex
+        self._open()
+        # Handshake: fails early if the container has no usable shell.
+        self._write(self._script([]))
+        self._read_result([], None)
+
+    def _script(self, cmd):
+        line = " ".join([shlex.quote(arg) for arg in cmd])
+        if line:
+            line += " </dev/null; "
+        return line + "printf '\\n%s %%d\\n' \"$?\"\n" % self._marker
+
+    def _read_result(self, cmd, timeout):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        lines = []
+        while True:
+            line = self._readline(deadline)
+            if line is None:
+                raise subprocess.TimeoutExpired(cmd, timeout)
+            if line == "":
+                raise ConnectionError(
+                    "exec session in container %s closed unexpectedly"
+                    % self.container_id
+                )
+            if line.startswith(self._marker + " "):
+                returncode = int(line[len(self._marker) + 1 :])
+                break
+            lines.append(line)
+        # Drop the newline printed before the marker.
+        output = "".join(lines)[:-1]
+        if self.STRIP_OUTPUT:
+            output = output.strip()
+        stderr = self._read_stderr()
+        if returncode != 0:
+            return subprocess.CalledProcessError(
+                returncode, cmd, output=output, stderr=stderr
+            )
+        return output
+
+    def _write_batch(self, script, errors):
+        try:
+            self._write(script)
+        except ConnectionError as e:
+            errors.append(e)
+
+    def execute_many(
+        self, cmds: List[List[str]], timeout: Optional[float] = None
+    ) -> List[str]:
+        with self._lock:
+            # The batch is written by another thread while the results are
+            # read: a large batch doesn't fit in the pipe buffers, and the
+            # shell would block on its output while we block on its input.
+            errors = []
+            writer = threading.Thread(
+                target=self._write_batch,
+                args=("".join([self._script(cmd) for cmd in cmds]), errors),
+                daemon=True,
+            )
+            writer.start()
+            try:
+                # Drain every result before raising, so that the session stays
+                # in sync for the next batch.
+                results = [self._read_result(cmd, timeout) for cmd in cmds]
+            except (ConnectionError, subprocess.TimeoutExpired):
+                # Out of sync for good, make sure alive() reports it. This
+                # also unblocks the writer.
+                self._close()
+                writer.join()
+                raise
+            writer.join()
+            if errors:
+                self._close()
+                raise errors[0]
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+        return results
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def _open(self):
+        raise NotImplementedError
+
+    def _write(self, data: str):
+        raise NotImplementedError
+
+    def _readline(self, deadline: Optional[float]) -> Optional[str]:
+        """Returns the next line of output, "" at EOF, None past deadline"""
+        raise NotImplementedError
+
+    def _read_stderr(self) -> str:
+        return ""
+
+    def _close(self):
+        raise NotImplementedError
+
+
+class DockerExecSession(ShellExecSession):
+    """ShellExecSession over the stdin/stdout of `docker exec -i`"""
+
+    STRIP_OUTPUT = True
+
+    def _open(self):
+        self._buffer = b""
+        self._proc = subprocess.Popen(
+            ["docker", "exec", "-i", self.container_id, self.SHELL],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+
+    def alive(self):
+        return self._proc.poll() is None
+
+    def _write(self, data):
+        try:
+            self._proc.stdin.write(data.encode())
+            self._proc.stdin.flush()
+        except BrokenPipeError as e:
+            raise ConnectionError(
+                "exec session in container %s is closed" % self.container_id
+            ) from e
+
+    def _readline(self, deadline):
+        fd = self._proc.stdout.fileno()
+        while b"\n" not in self._buffer:
+            if deadline is not None:
+                ready, _, _ = select.select(
+                    [fd], [], [], max(0, deadline - time.monotonic())
+                )
+                if not ready:
+                    return None
+            data = os.read(fd, 65536)
+            if not data:
+                line, self._buffer = self._buffer, b""
+                return line.decode("utf-8", "ignore")
+            self._buffer += data
+        line, _, self._buffer = self._buffer.partition(b"\n")
+        return (line + b"\n").decode("utf-8", "ignore")
+
+    def _close(self):
+        try:
+            self._proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        try:
+            self._proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self._proc.kill()
+            self._proc.wait()
+
+
+class ExecSessionPool:
+    """Keeps one session per container ID
+
+    Containers without a usable shell are remembered, and get a plain
+    ExecSession from then on instead of retrying the shell every time.
+    """
+
+    def __init__(self, session_class, fallback_class=ExecSession):
+        self.session_class = session_class
+        self.fallback_class = fallback_class
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def get(self, namespace, container_id) -> ExecSession:
+        with self._lock:
+            session = self._sessions.get(container_id)
+            if session is None or not session.alive():
+                try:
+                    session = self.session_class(namespace, container_id)
+                except (ConnectionError, OSError, ValueError) as e:
+                    logger.info(
+                        "no shell session in container %s, running commands "
+                        "one by one: %s" % (container_id, e)
+                    )
+                    session = self.fallback_class(namespace, container_id)
+                self._sessions[container_id] = session
+            return session
+
+    def discard(self, container_id):
+        """Drop (and close) the session of a container, e.g. after a restart"""
+        with self._lock:
+            session = self._sessions.pop(container_id, None)
+        if session is not None:
+            session.close()
@@ -15,13 +15,15 @@ import filelock
 import logging
 import os
 import subprocess
+import threading
 import time
-from typing import List
+from typing import Dict, List, Optional
 
-from kubernetes import client, config
+from kubernetes import client, config, watch
 from kubernetes.stream import stream
 
 from .docker_compose_base_manager import DockerComposeBaseNamespace
+from .exec_session import ExecSession, ExecSessionPool, ShellExecSession
 
 logger = logging.getLogger("root")
 
@@ -29,9 +31,161 @@ logger = logging.getLogger("root")
 docker_lock = filelock.FileLock("docker_lock")
 
 
+# Seconds to wait for the pods of a namespace to be listed.
+LIST_PODS_TIMEOUT = 60
+
+# Longest single wait on an exec websocket, deadlines are checked in between.
+EXEC_POLL_INTERVAL = 1
+
+
+class _RunningPodsCache:
+    """Watch-backed view of the running pods in a Kubernetes namespace.
+
+    A background thread lists the pods once and then follows the watch events,
+    so lookups never hit the API server.
+    """
+
+    def __init__(self, v1, namespace):
+        self.v1 = v1
+        self.namespace = namespace
+        self._pods = {}
+        self._lock = threading.Lock()
+        self._synced = threading.Event()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _update(self, pod):
+        with self._lock:
+            if (
+                pod.status.phase == "Running"
+                and pod.metadata.deletion_timestamp is None
+            ):
+                self._pods[pod.metadata.name] = pod.metadata.labels or {}
+            else:
+                self._pods.pop(pod.metadata.name, None)
+
+    def _run(self):
+        while True:
+            try:
+                pod_list = self.v1.list_namespaced_pod(self.namespace)
+                with self._lock:
+                    self._pods = {}
+                for pod in pod_list.items:
+                    self._update(pod)
+                self._synced.set()
+                for event in watch.Watch().stream(
+                    self.v1.list_namespaced_pod,
+                    self.namespace,
+                    resource_version=pod_list.metadata.resource_version,
+                ):
+                    if event["type"] == "DELETED":
+                        with self._lock:
+                            self._pods.pop(event["object"].metadata.name, None)
+                    else:
+                        self._update(event["object"])
+            except Exception as e:
+                # Expired resource version, dropped connection... start over.
+                logger.info(f"restarting pod watch in {self.namespace}: {e}")
+                time.sleep(1)
+
+    def pods(self, timeout=LIST_PODS_TIMEOUT) -> Dict[str, Dict[str, str]]:
+        """Returns a {pod name: labels} snapshot of the running pods.
+
+        Pods are in the order of the pod list, followed by the ones added since.
+        """
+        if not self._synced.wait(timeout):
+            raise RuntimeError(f"cannot list pods in namespace {self.namespace}")
+        with self._lock:
+            return dict(self._pods)
+
+
+class KubernetesExecSession(ShellExecSession):
+    """ShellExecSession over one exec websocket, reused across commands"""
+
+    def execute_many(
+        self, cmds: List[List[str]], timeout: Optional[float] = None
+    ) -> List[str]:
+        try:
+            return ShellExecSession.execute_many(self, cmds, timeout=timeout)
+        except subprocess.CalledProcessError as e:
+            raise RuntimeError(f"Kubernetes SDK exec error: {e.stderr}")
+
+    def _open(self):
+        self._stderr = []
+        self._ws_client = stream(
+            self.namespace.v1.connect_get_namespaced_pod_exec,
+            self.container_id,
+            self.namespace.namespace,
+            command=[self.SHELL],
+            stderr=True,
+            stdin=True,
+            stdout=True,
+            tty=False,
+            _preload_content=False,
+        )
+
+    def alive(self):
+        return self._ws_client.is_open()
+
+    def _write(self, data):
+        if not self._ws_client.is_open():
+            raise ConnectionError(
+                f"exec session in pod {self.container_id} is closed: "
+                f"{self._ws_client.read_stderr()}"
+            )
+        self._ws_client.write_stdin(data)
+
+    def _readline(self, deadline):
+        while self._ws_client.is_open():
+            if deadline is None:
+                timeout = EXEC_POLL_INTERVAL
+            else:
+                timeout = min(EXEC_POLL_INTERVAL, deadline - time.monotonic())
+                if timeout <= 0:
+                    return None
+            line = self._ws_client.readline_stdout(timeout=timeout)
+            # Keep the buffered stderr from growing while waiting.
+            self._stderr.append(self._ws_client.read_stderr(timeout=0))
+            if line is not None:
+                return line + "\n"
+        return ""
+
+    def _read_stderr(self):
+        self._stderr.append(self._ws_client.read_stderr(timeout=0))
+        stderr = "".join(self._stderr)
+        self._stderr = []
+        return stderr
+
+    def _close(self):
+        self._ws_client.close()
+
+
+class _OneShotKubernetesExecSession(ExecSession):
+    """One exec websocket per command, for pods without a shell"""
+
+    def execute_many(
+        self, cmds: List[List[str]], timeout: Optional[float] = None
+    ) -> List[str]:
+        return [
+            self.namespace._exec_once(self.container_id, cmd, timeout) for cmd in cmds
+        ]
+
+
+# Shared by all the namespaces, sessions are per pod.
+_exec_sessions = ExecSessionPool(KubernetesExecSession, _OneShotKubernetesExecSession)
+
+# One pods cache per Kubernetes namespace.
+_running_pods_caches = {}
+_running_pods_caches_lock = threading.Lock()
+
+
 class KubernetesNamespace(DockerComposeBaseNamespace):
     namespace = "staging"
     KUBECONFIG = f"{os.getenv('HOME')}/kubeconfig.{namespace}"
+    # Label selector identifying the pods of a service; "{service}" is
+    # replaced by the first filter given to getid().
+    POD_LABEL_SELECTOR = os.environ.get(
+        "K8S_POD_LABEL_SELECTOR", "app.kubernetes.io/name={service}"
+    )
 
     def __init__(self, name=None, extra_files=[]):
         DockerComposeBaseNamespace.__init__(self, name=name, extra_files=extra_files)
@@ -41,8 +195,18 @@ class KubernetesNamespace(DockerComposeBaseNamespace):
     def setup(self):
         pass
 
-    def execute(self, pod_id: str, cmd: List[str]) -> str:
+    def exec_session(self, pod_id: str) -> ExecSession:
+        return _exec_sessions.get(self, pod_id)
+
+    def execute(
+        self, pod_id: str, cmd: List[str], timeout: Optional[float] = None
+    ) -> str:
         """Perform kubectl exec command on given pod. """
+        return self.exec_session(pod_id).execute(cmd, timeout=timeout)
+
+    def _exec_once(
+        self, pod_id: str, cmd: List[str], timeout: Optional[float] = None
+    ) -> str:
         ws_client = stream(
             self.v1.connect_get_namespaced_pod_exec,
             pod_id,
@@ -54,7 +218,10 @@ class KubernetesNamespace(DockerComposeBaseNamespace):
             tty=False,
             _preload_content=False,
         )
-        ws_client.run_forever(timeout=60)
+        ws_client.run_forever(timeout=timeout)
+        if ws_client.is_open():
+            ws_client.close()
+            raise subprocess.TimeoutExpired(cmd, timeout)
         if ws_client.returncode != 0:
             raise RuntimeError(f"Kubernetes SDK exec error: {ws_client.read_stderr()}")
         return ws_client.read_all()
@@ -66,17 +233,36 @@ class KubernetesNamespace(DockerComposeBaseNamespace):
         )
         return ret.stdout.decode("utf-8").strip()
 
+    def _running_pods(self) -> _RunningPodsCache:
+        with _running_pods_caches_lock:
+            cache = _running_pods_caches.get(self.namespace)
+            if cache is None:
+                cache = _RunningPodsCache(self.v1, self.namespace)
+                _running_pods_caches[self.namespace] = cache
+            return cache
+
     def getid(self, filters: List[str]) -> str:
-        """Get pod id based on given filters."""
-        pod_list = self.v1.list_namespaced_pod(self.namespace)
-        pod_id = ""
-
-        for pod in pod_list.items:
-            if filters[0] in pod.metadata.name and pod.status.phase == "Running":
-                pod_id = pod.metadata.name
-        if pod_id == "":
+        """Get pod id based on given filters.
+
+        Pods are matched by POD_LABEL_SELECTOR first, and by name if no pod
+        carries the labels.
+        """
+        pods = self._running_pods().pods()
+        selector = dict(
+            term.split("=", 1)
+            for term in self.POD_LABEL_SELECTOR.format(service=filters[0]).split(",")
+        )
+        candidates = [
+            name
+            for name, labels in pods.items()
+            if all(labels.get(k) == v for k, v in selector.items())
+        ]
+        if len(candidates) == 0:
+            candidates = [name for name in pods if filters[0] in name]
+        if len(candidates) == 0:
             raise RuntimeError(f"pod id for filters {str(filters)} not found")
-        return pod_id
+        # As when walking the pod list: the last match wins.
+        return candidates[-1]
 
     def get_mender_gateway(self):
         return os.environ.get("GATEWAY_HOSTNAME")
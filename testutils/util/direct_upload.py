@@ -0,0 +1,187 @@
+# Copyright 2023 Northern.tech AS
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+"""Artifact uploads straight to the storage, through the deployments
+direct-upload flow (POST /artifacts/directupload, upload to the returned link,
+POST /artifacts/directupload/{id}/complete)"""
+
+import base64
+import concurrent.futures
+import logging
+import os
+import threading
+import time
+import warnings
+
+import redo
+import requests
+from urllib3.exceptions import InsecureRequestWarning
+
+import testutils.api.deployments as deployments
+from testutils.api.client import ApiClient
+
+logger = logging.getLogger("root")
+
+PART_SIZE = 16 * 1024 * 1024
+CHUNK_SIZE = 1024 * 1024
+
+
+class _FileRange:
+    """Streams length bytes of a file starting at offset, in chunks"""
+
+    def __init__(self, filename, offset, length, progress):
+        self.filename = filename
+        self.offset = offset
+        self.length = length
+        self.progress = progress
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        with open(self.filename, "rb") as fd:
+            fd.seek(self.offset)
+            remaining = self.length
+            while remaining > 0:
+                chunk = fd.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                self.progress(len(chunk))
+                yield chunk
+
+
+class DirectUpload:
+    """Uploads one artifact file to the link handed out by the deployments
+    service
+
+    Azure links (recognized by their x-ms-blob-type header) accept extra
+    query parameters, so the file is sent as blocks of part_size, `workers`
+    at a time, and committed with a block list. Each block is retried on its
+    own. S3/minio links are presigned for a single PUT of the whole object,
+    which is then what gets sent (and retried).
+
+    `progress`, if given, is called as progress(bytes_sent, total_bytes); on a
+    retry, bytes_sent counts the resent bytes again.
+    """
+
+    def __init__(
+        self, filename, part_size=PART_SIZE, workers=4, attempts=3, progress=None
+    ):
+        self.filename = filename
+        self.size = os.path.getsize(filename)
+        self.part_size = part_size
+        self.workers = workers
+        self.attempts = attempts
+        self.progress = progress
+        self.bytes_sent = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def _sent(self, n):
+        with self._lock:
+            self.bytes_sent += n
+            bytes_sent = self.bytes_sent
+        if self.progress is not None:
+            self.progress(bytes_sent, self.size)
+
+    def _put(self, url, headers, body):
+        for _ in redo.retrier(attempts=self.attempts, sleeptime=1):
+            try:
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore", category=InsecureRequestWarning)
+                    r = requests.put(url, data=body, headers=headers, verify=False)
+                if r.status_code < 300:
+                    return r
+                logger.warning(
+                    "storage upload to %s failed: %d %s"
+                    % (url.split("?")[0], r.status_code, r.text)
+                )
+            except requests.exceptions.ConnectionError as e:
+                logger.warning(
+                    "storage upload to %s failed: %s" % (url.split("?")[0], e)
+                )
+        raise RuntimeError(
+            "storage upload of %s failed after %d attempts"
+            % (self.filename, self.attempts)
+        )
+
+    def _put_block(self, url, headers, block_id, offset):
+        length = min(self.part_size, self.size - offset)
+        body = _FileRange(self.filename, offset, length, self._sent)
+        self._put(url + "&comp=block&blockid=" + block_id, headers, body)
+
+    def _upload_blocks(self, url, headers):
+        offsets = range(0, self.size, self.part_size)
+        # Block IDs must all have the same length.
+        block_ids = [
+            base64.b64encode(b"%08d" % i).decode() for i in range(len(offsets))
+        ]
+        with concurrent.futures.ThreadPoolExecutor(self.workers) as pool:
+            futures = [
+                pool.submit(self._put_block, url, headers, block_id, offset)
+                for block_id, offset in zip(block_ids, offsets)
+            ]
+            for future in futures:
+                future.result()
+        block_list = (
+            '<?xml version="1.0" encoding="utf-8"?><BlockList>'
+            + "".join(["<Latest>%s</Latest>" % block_id for block_id in block_ids])
+            + "</BlockList>"
+        )
+        headers = {k: v for k, v in headers.items() if k.lower() != "x-ms-blob-type"}
+        self._put(url + "&comp=blocklist", headers, block_list.encode())
+
+    def upload(self, url, headers):
+        self.bytes_sent = 0
+        started = time.time()
+        if headers.get("x-ms-blob-type") == "BlockBlob":
+            self._upload_blocks(url, headers)
+        else:
+            self._put(url, headers, _FileRange(self.filename, 0, self.size, self._sent))
+        self.seconds = time.time() - started
+        logger.info(
+            "direct upload of %s: %d bytes in %.2f seconds (%.1f MiB/s)"
+            % (
+                self.filename,
+                self.size,
+                self.seconds,
+                self.size / self.seconds / (1024 * 1024) if self.seconds else 0.0,
+            )
+        )
+
+
+def direct_upload_artifact(filename, auth_token, **kwargs):
+    """Uploads an artifact through the direct-upload flow, and returns the ID
+    of the artifact; keyword arguments are passed to DirectUpload
+
+    The artifact is processed asynchronously once the upload is completed, so
+    it may take a moment before it shows up in the artifacts list.
+    """
+    api_client = ApiClient(deployments.URL_MGMT)
+    api_client.headers = {}  # avoid default Content-Type: application/json
+    api_client.with_auth(auth_token)
+
+    r = api_client.call("POST", deployments.URL_DEPLOYMENTS_ARTIFACTS_DIRECT_UPLOAD)
+    assert r.status_code == 200, r.text
+    link = r.json()
+
+    DirectUpload(filename, **kwargs).upload(link["uri"], link.get("header_map") or {})
+
+    r = api_client.call(
+        "POST",
+        deployments.URL_DEPLOYMENTS_ARTIFACTS_DIRECT_UPLOAD_COMPLETE,
+        path_params={"id": link["id"]},
+    )
+    assert r.status_code == 202, r.text
+    return link["id"]
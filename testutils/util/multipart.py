@@ -0,0 +1,149 @@
+# Copyright 2023 Northern.tech AS
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+"""Streaming multipart/form-data bodies for (large) artifact uploads"""
+
+import collections
+import logging
+import os
+import time
+import uuid
+
+logger = logging.getLogger("root")
+
+CHUNK_SIZE = 1024 * 1024
+
+# A file field of a multipart body, streamed from disk.
+FilePart = collections.namedtuple("FilePart", ["path", "content_type"])
+FilePart.__new__.__defaults__ = ("application/octet-stream",)
+
+
+class MultipartEncoder:
+    """A multipart/form-data body which is produced while it is being sent
+
+    `requests` builds the whole body in memory when given `files=`; this class
+    instead reads files in chunks of `chunk_size` as the request goes out.
+    Pass it as `data=` together with the `content_type` header:
+
+        body = MultipartEncoder(
+            [("description", "abc"), ("artifact", FilePart(path))]
+        )
+        requests.post(url, data=body, headers={"Content-Type": body.content_type})
+
+    Fields are (name, value) tuples, where value is either a string (a plain
+    form field) or a FilePart to stream. The body length is computed
+    upfront, so the request carries a Content-Length and not chunked encoding.
+
+    `progress`, if given, is called as progress(bytes_sent, total_bytes) after
+    each chunk. Once the body has been consumed, `stats()` reports the upload
+    throughput.
+    """
+
+    def __init__(self, fields, progress=None, chunk_size=CHUNK_SIZE):
+        self.boundary = uuid.uuid4().hex
+        self.content_type = "multipart/form-data; boundary=%s" % self.boundary
+        self.progress = progress
+        self.chunk_size = chunk_size
+        self._parts = [self._part(name, value) for name, value in fields]
+        self._closing = ("--%s--\r\n" % self.boundary).encode()
+        self._length = sum(
+            len(header) + size + 2 for header, _, size in self._parts
+        ) + len(self._closing)
+        self.bytes_sent = 0
+        self._started = None
+        self._finished = None
+
+    def _part(self, name, value):
+        if isinstance(value, FilePart):
+            header = (
+                "--%s\r\n"
+                'Content-Disposition: form-data; name="%s"; filename="%s"\r\n'
+                "Content-Type: %s\r\n\r\n"
+                % (
+                    self.boundary,
+                    name,
+                    os.path.basename(value.path),
+                    value.content_type,
+                )
+            )
+            return header.encode(), value.path, os.path.getsize(value.path)
+        header = '--%s\r\nContent-Disposition: form-data; name="%s"\r\n\r\n' % (
+            self.boundary,
+            name,
+        )
+        data = str(value).encode()
+        return header.encode(), data, len(data)
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        self.bytes_sent = 0
+        self._started = time.time()
+        self._finished = None
+        for header, body, _ in self._parts:
+            yield self._sent(header)
+            if isinstance(body, bytes):
+                yield self._sent(body)
+            else:
+                with open(body, "rb") as fd:
+                    while True:
+                        chunk = fd.read(self.chunk_size)
+                        if not chunk:
+                            break
+                        yield self._sent(chunk)
+            yield self._sent(b"\r\n")
+        yield self._sent(self._closing)
+        self._finished = time.time()
+
+    def _sent(self, chunk):
+        self.bytes_sent += len(chunk)
+        if self.progress is not None:
+            self.progress(self.bytes_sent, self._length)
+        return chunk
+
+    def stats(self):
+        """Returns bytes sent, seconds spent and throughput in bytes/second"""
+        if self._started is None:
+            return {"bytes": 0, "seconds": 0.0, "bytes_per_second": 0.0}
+        seconds = (self._finished or time.time()) - self._started
+        return {
+            "bytes": self.bytes_sent,
+            "seconds": seconds,
+            "bytes_per_second": self.bytes_sent / seconds if seconds > 0 else 0.0,
+        }
+
+
+def artifact_upload_body(filename, description="abc", progress=None):
+    """Body of a deployments management API artifact upload (POST /artifacts)"""
+    return MultipartEncoder(
+        [
+            ("description", description),
+            ("size", str(os.path.getsize(filename))),
+            ("artifact", FilePart(filename)),
+        ],
+        progress=progress,
+    )
+
+
+def log_upload_stats(body, what="upload"):
+    stats = body.stats()
+    logger.info(
+        "%s: %d bytes in %.2f seconds (%.1f MiB/s)"
+        % (
+            what,
+            stats["bytes"],
+            stats["seconds"],
+            stats["bytes_per_second"] / (1024 * 1024),
+        )
+    )